@@ -3,6 +3,7 @@ from datetime import datetime
 
 from sqlalchemy import Result, select
 
+from api.v1.analytics.controllers import rebuild_word_frequency
 from core.database import Note, NoteHistory, User
 from core.database.db_helper import db_helper
 
@@ -121,6 +122,7 @@ async def insert_data():
             await session.commit()
             session.add_all([NoteHistory(**history) for history in data_note_history])
             await session.commit()
+            await rebuild_word_frequency(session)
 
 
 asyncio.run(insert_data())
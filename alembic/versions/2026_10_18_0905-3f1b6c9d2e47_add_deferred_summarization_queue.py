@@ -0,0 +1,77 @@
+"""add deferred summarization queue
+
+Revision ID: 3f1b6c9d2e47
+Revises: ff66956e49e8
+Create Date: 2026-10-18 09:05:12.418302
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "3f1b6c9d2e47"
+down_revision: Union[str, None] = "ff66956e49e8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "summarization_job",
+        sa.Column("note_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("revision", sa.Integer(), nullable=False),
+        sa.Column(
+            "run_after",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["note_id"],
+            ["note.id"],
+            name=op.f("fk_summarization_job_note_id_note"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_summarization_job")),
+        sa.UniqueConstraint("note_id", name=op.f("uq_summarization_job_note_id")),
+    )
+    op.create_index(
+        "ix_summarization_job_run_after",
+        "summarization_job",
+        ["run_after"],
+        unique=False,
+        postgresql_where=sa.text("status <> 'dead'"),
+    )
+    op.add_column(
+        "note",
+        sa.Column(
+            "summarization_status",
+            sa.String(length=16),
+            server_default="done",
+            nullable=False,
+        ),
+    )
+    op.alter_column("note", "summarization", existing_type=sa.String(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("UPDATE note SET summarization = '' WHERE summarization IS NULL")
+    op.alter_column("note", "summarization", existing_type=sa.String(), nullable=False)
+    op.drop_column("note", "summarization_status")
+    op.drop_index("ix_summarization_job_run_after", table_name="summarization_job")
+    op.drop_table("summarization_job")
@@ -0,0 +1,41 @@
+"""add summarization cache table
+
+Revision ID: 8d3b9c272d11
+Revises: 3f1b6c9d2e47
+Create Date: 2026-10-18 09:42:37.905114
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "8d3b9c272d11"
+down_revision: Union[str, None] = "3f1b6c9d2e47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "summarization_cache",
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("summarization", sa.String(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_summarization_cache")),
+        sa.UniqueConstraint("key", name=op.f("uq_summarization_cache_key")),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("summarization_cache")
@@ -0,0 +1,31 @@
+"""add note keyset pagination index
+
+Revision ID: c5e0a7f4b913
+Revises: 8d3b9c272d11
+Create Date: 2026-10-18 10:21:54.116730
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "c5e0a7f4b913"
+down_revision: Union[str, None] = "8d3b9c272d11"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_note_user_id_updated_at_id",
+        "note",
+        ["user_id", "updated_at", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_note_user_id_updated_at_id", table_name="note")
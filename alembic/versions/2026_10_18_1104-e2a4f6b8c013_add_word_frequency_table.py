@@ -0,0 +1,76 @@
+"""add word frequency table
+
+Revision ID: e2a4f6b8c013
+Revises: c5e0a7f4b913
+Create Date: 2026-10-18 11:04:12.508331
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "e2a4f6b8c013"
+down_revision: Union[str, None] = "c5e0a7f4b913"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# analytics tokenizer of this revision: lower case, delete everything but latin
+# and cyrillic letters, digits and whitespace, split on whitespace
+NON_WORD_PATTERN = "[^a-zA-Zа-яА-ЯёЁ0-9[:space:]]"
+# words are counted by their first characters, so any word fits into the index
+MAX_WORD_LENGTH = 255
+
+NOTE_WORDS = """
+    note
+    CROSS JOIN LATERAL regexp_split_to_table(
+        regexp_replace(lower(note.title || ' ' || note.text), :pattern, '', 'g'),
+        '[[:space:]]+'
+    ) AS words (word)
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "word_frequency",
+        sa.Column("word", sa.String(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_word_frequency")),
+        sa.UniqueConstraint("word", name=op.f("uq_word_frequency_word")),
+    )
+    op.create_index(
+        op.f("ix_word_frequency_count"), "word_frequency", ["count"], unique=False
+    )
+    op.add_column(
+        "note",
+        sa.Column("word_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.create_index(op.f("ix_note_word_count"), "note", ["word_count"], unique=False)
+    # backfill existing notes, incremental analytics only apply deltas to them
+    op.execute(
+        sa.text(
+            "UPDATE note SET word_count = counts.word_count FROM ("
+            f"  SELECT note.id, count(*) AS word_count FROM {NOTE_WORDS}"
+            "  WHERE words.word <> '' GROUP BY note.id"
+            ") AS counts WHERE note.id = counts.id"
+        ).bindparams(pattern=NON_WORD_PATTERN)
+    )
+    op.execute(
+        sa.text(
+            "INSERT INTO word_frequency (word, count) "
+            f"SELECT left(words.word, :max_word_length), count(*) FROM {NOTE_WORDS} "
+            "WHERE words.word <> '' GROUP BY 1"
+        ).bindparams(pattern=NON_WORD_PATTERN, max_word_length=MAX_WORD_LENGTH)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_note_word_count"), table_name="note")
+    op.drop_column("note", "word_count")
+    op.drop_index(op.f("ix_word_frequency_count"), table_name="word_frequency")
+    op.drop_table("word_frequency")
@@ -0,0 +1,35 @@
+"""add note history and note word count indexes
+
+Revision ID: 7b9d1e3f5a20
+Revises: e2a4f6b8c013
+Create Date: 2026-10-18 11:46:03.772154
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "7b9d1e3f5a20"
+down_revision: Union[str, None] = "e2a4f6b8c013"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_note_history_note_id_created_at_id",
+        "note_history",
+        ["note_id", "created_at", "id"],
+        unique=False,
+    )
+    op.drop_index("ix_note_word_count", table_name="note")
+    op.create_index("ix_note_word_count_id", "note", ["word_count", "id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_note_word_count_id", table_name="note")
+    op.create_index("ix_note_word_count", "note", ["word_count"], unique=False)
+    op.drop_index("ix_note_history_note_id_created_at_id", table_name="note_history")
@@ -0,0 +1,55 @@
+"""add note search vector
+
+Revision ID: 4c8e2d6a9b71
+Revises: 7b9d1e3f5a20
+Create Date: 2026-10-18 12:38:27.405118
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+revision: str = "4c8e2d6a9b71"
+down_revision: Union[str, None] = "7b9d1e3f5a20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# a tsvector can't exceed 1 MB, so only the beginning of long texts is searched
+SEARCH_TEXT_LENGTH = 100_000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "note",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('simple', title), 'A') || "
+                "setweight(to_tsvector('simple', "
+                f"left(text, {SEARCH_TEXT_LENGTH})), 'B') || "
+                "setweight(to_tsvector('simple', "
+                f"left(coalesce(summarization, ''), {SEARCH_TEXT_LENGTH})), 'C')",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_note_search_vector",
+        "note",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_note_search_vector", table_name="note", postgresql_using="gin")
+    op.drop_column("note", "search_vector")
@@ -0,0 +1,200 @@
+"""store note history as deltas
+
+Revision ID: 9e1f3a7c5d24
+Revises: 4c8e2d6a9b71
+Create Date: 2026-10-18 13:52:09.611834
+
+"""
+
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+from itertools import groupby
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "9e1f3a7c5d24"
+down_revision: Union[str, None] = "4c8e2d6a9b71"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# notes converted per statement
+CHUNK_SIZE = 500
+
+# delta codec and history settings of this revision, frozen so later changes
+# of the application don't change what this migration writes and reads
+SNAPSHOT_INTERVAL = 10
+TOKEN_PATTERN = re.compile(r"\s*\S+\s*|\s+")
+CHUNK_MODULUS = 8
+MAX_TOKEN_DIFF_CELLS = 40_000
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text)
+
+
+def chunk(tokens: list[str]) -> list[list[str]]:
+    chunks, current = [], []
+    for token in tokens:
+        current.append(token)
+        if zlib.crc32(token.encode()) % CHUNK_MODULUS == 0:
+            chunks.append(current)
+            current = []
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def diff_tokens(base: list[str], target: list[str], ops: list[int | str]) -> None:
+    matcher = SequenceMatcher(None, base, target, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append("".join(target[j1:j2]))
+
+
+def make_delta(base: str, target: str) -> bytes:
+    """Returns JSON list of ops turning `base` into `target`: positive numbers
+    copy tokens of `base`, negative ones skip them, strings are inserted"""
+    base_tokens, target_tokens = tokenize(base), tokenize(target)
+    prefix = 0
+    limit = min(len(base_tokens), len(target_tokens))
+    while prefix < limit and base_tokens[prefix] == target_tokens[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < limit - prefix
+        and base_tokens[-suffix - 1] == target_tokens[-suffix - 1]
+    ):
+        suffix += 1
+    base_chunks = chunk(base_tokens[prefix : len(base_tokens) - suffix])
+    target_chunks = chunk(target_tokens[prefix : len(target_tokens) - suffix])
+
+    ops: list[int | str] = [prefix]
+    matcher = SequenceMatcher(
+        None,
+        ["".join(tokens) for tokens in base_chunks],
+        ["".join(tokens) for tokens in target_chunks],
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        base_region = [token for tokens in base_chunks[i1:i2] for token in tokens]
+        target_region = [token for tokens in target_chunks[j1:j2] for token in tokens]
+        if tag == "equal":
+            ops.append(len(base_region))
+        elif len(base_region) * len(target_region) <= MAX_TOKEN_DIFF_CELLS:
+            diff_tokens(base_region, target_region, ops)
+        else:
+            ops += [-len(base_region), "".join(target_region)]
+    ops.append(suffix)
+    return json.dumps(
+        [delta_op for delta_op in ops if delta_op],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    tokens = tokenize(base)
+    parts = []
+    position = 0
+    for delta_op in json.loads(delta):
+        if isinstance(delta_op, str):
+            parts.append(delta_op)
+        elif delta_op > 0:
+            parts.extend(tokens[position : position + delta_op])
+            position += delta_op
+        else:
+            position -= delta_op
+    return "".join(parts)
+
+
+def history_values(text: str, newer_text: str, delta_run: int) -> dict:
+    """Returns text columns of a history row storing `text`, as a delta against
+    `newer_text` unless it ends a run of deltas or isn't smaller than the text"""
+    if delta_run < SNAPSHOT_INTERVAL - 1:
+        delta = make_delta(newer_text, text)
+        if len(delta) < len(text.encode()):
+            return {"text": None, "text_delta": delta}
+    return {"text": text, "text_delta": None}
+
+
+def history_texts(text: str, rows: list[sa.Row]) -> list[str]:
+    """Returns texts of history rows ordered newest first, `text` is note text"""
+    texts = []
+    for row in rows:
+        text = row.text if row.text is not None else apply_delta(text, row.text_delta)
+        texts.append(text)
+    return texts
+
+
+def note_history_chunks(conn: sa.Connection):
+    """Yields (note text, history rows newest first) of every note with history"""
+    note_ids = (
+        conn.execute(sa.text("SELECT DISTINCT note_id FROM note_history ORDER BY 1"))
+        .scalars()
+        .all()
+    )
+    for start in range(0, len(note_ids), CHUNK_SIZE):
+        rows = conn.execute(
+            sa.text(
+                "SELECT h.id, h.note_id, h.text, h.text_delta, n.text AS note_text "
+                "FROM note_history AS h JOIN note AS n ON n.id = h.note_id "
+                "WHERE h.note_id = ANY(:note_ids) "
+                "ORDER BY h.note_id, h.created_at DESC, h.id DESC"
+            ),
+            {"note_ids": note_ids[start : start + CHUNK_SIZE]},
+        ).all()
+        for _, note_rows in groupby(rows, key=lambda row: row.note_id):
+            note_rows = list(note_rows)
+            yield note_rows[0].note_text, note_rows
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("note_history", sa.Column("text_delta", sa.LargeBinary()))
+    op.alter_column("note_history", "text", existing_type=sa.String(), nullable=True)
+    conn = op.get_bind()
+    for note_text, rows in note_history_chunks(conn):
+        deltas = []
+        newer_text, delta_run = note_text, 0
+        for row in rows:
+            values = history_values(row.text, newer_text, delta_run)
+            if values["text"] is None:
+                deltas.append({"id": row.id, "text_delta": values["text_delta"]})
+                delta_run += 1
+            else:
+                delta_run = 0
+            newer_text = row.text
+        if deltas:
+            conn.execute(
+                sa.text(
+                    "UPDATE note_history SET text = NULL, text_delta = :text_delta "
+                    "WHERE id = :id"
+                ),
+                deltas,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    for note_text, rows in note_history_chunks(conn):
+        texts = [
+            {"id": row.id, "text": text}
+            for row, text in zip(rows, history_texts(note_text, rows))
+            if row.text is None
+        ]
+        if texts:
+            conn.execute(
+                sa.text("UPDATE note_history SET text = :text WHERE id = :id"), texts
+            )
+    op.alter_column("note_history", "text", existing_type=sa.String(), nullable=False)
+    op.drop_column("note_history", "text_delta")
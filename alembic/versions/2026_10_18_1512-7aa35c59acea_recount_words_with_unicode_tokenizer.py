@@ -0,0 +1,81 @@
+"""recount words with unicode tokenizer
+
+Revision ID: 7aa35c59acea
+Revises: 9e1f3a7c5d24
+Create Date: 2026-10-18 15:12:40.218507
+
+"""
+
+import sys
+import unicodedata
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "7aa35c59acea"
+down_revision: Union[str, None] = "9e1f3a7c5d24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# tokenizer before this revision: latin and cyrillic letters and digits only
+LATIN_CYRILLIC_NON_WORD_PATTERN = "[^a-zA-Zа-яА-ЯёЁ0-9[:space:]]"
+# words are counted by their first characters, so any word fits into the index
+MAX_WORD_LENGTH = 255
+
+
+def unicode_non_word_pattern() -> str:
+    """Tokenizer of this revision: letters, digits and combining marks of any
+    script are kept, `[:alnum:]` follows the database locale (a UTF-8 one)"""
+    marks = []
+    start = None
+    for code_point in range(sys.maxunicode + 2):
+        is_mark = code_point <= sys.maxunicode and unicodedata.category(
+            chr(code_point)
+        ).startswith("M")
+        if is_mark and start is None:
+            start = code_point
+        elif not is_mark and start is not None:
+            marks.append(f"\\U{start:08x}-\\U{code_point - 1:08x}")
+            start = None
+    return f"[^[:alnum:][:space:]{''.join(marks)}]"
+
+
+def recount_words(non_word_pattern: str) -> None:
+    """Recomputes word_frequency and note.word_count, note writes wait for it"""
+    op.execute("LOCK TABLE note IN SHARE MODE")
+    op.execute("DELETE FROM word_frequency")
+    note_words = """
+        note
+        LEFT JOIN LATERAL regexp_split_to_table(
+            regexp_replace(lower(note.title || ' ' || note.text), :pattern, '', 'g'),
+            '[[:space:]]+'
+        ) AS words (word) ON words.word <> ''
+    """
+    op.execute(
+        sa.text(
+            "UPDATE note SET word_count = counts.word_count FROM ("
+            f"  SELECT note.id, count(words.word) AS word_count FROM {note_words}"
+            "  GROUP BY note.id"
+            ") AS counts "
+            "WHERE note.id = counts.id AND note.word_count <> counts.word_count"
+        ).bindparams(pattern=non_word_pattern)
+    )
+    op.execute(
+        sa.text(
+            "INSERT INTO word_frequency (word, count) "
+            f"SELECT left(words.word, :max_word_length), count(*) FROM {note_words} "
+            "WHERE words.word IS NOT NULL GROUP BY 1"
+        ).bindparams(pattern=non_word_pattern, max_word_length=MAX_WORD_LENGTH)
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    recount_words(unicode_non_word_pattern())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    recount_words(LATIN_CYRILLIC_NON_WORD_PATTERN)
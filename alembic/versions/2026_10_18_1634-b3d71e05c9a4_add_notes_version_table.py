@@ -0,0 +1,48 @@
+"""add notes version table
+
+Revision ID: b3d71e05c9a4
+Revises: 7aa35c59acea
+Create Date: 2026-10-18 16:34:51.702316
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "b3d71e05c9a4"
+down_revision: Union[str, None] = "7aa35c59acea"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "notes_version",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("changed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["user.id"],
+            name=op.f("fk_notes_version_user_id_user"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_notes_version")),
+        sa.UniqueConstraint("user_id", name=op.f("uq_notes_version_user_id")),
+    )
+    # note writes wait for the backfill, so none of them is missed
+    op.execute("LOCK TABLE note IN SHARE MODE")
+    op.execute(
+        "INSERT INTO notes_version (user_id, version, changed_at) "
+        "SELECT user_id, 1, max(updated_at) FROM note GROUP BY user_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("notes_version")
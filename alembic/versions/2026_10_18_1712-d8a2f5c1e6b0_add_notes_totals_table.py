@@ -0,0 +1,40 @@
+"""add notes totals table
+
+Revision ID: d8a2f5c1e6b0
+Revises: b3d71e05c9a4
+Create Date: 2026-10-18 17:12:08.415270
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "d8a2f5c1e6b0"
+down_revision: Union[str, None] = "b3d71e05c9a4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "notes_totals",
+        sa.Column("notes", sa.BigInteger(), nullable=False),
+        sa.Column("words", sa.BigInteger(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_notes_totals")),
+    )
+    # note writes wait for the backfill, so none of them is missed
+    op.execute("LOCK TABLE note IN SHARE MODE")
+    op.execute(
+        "INSERT INTO notes_totals (id, notes, words) "
+        "SELECT 1, count(*), coalesce(sum(word_count), 0) FROM note"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("notes_totals")
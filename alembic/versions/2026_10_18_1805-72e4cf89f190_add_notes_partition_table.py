@@ -0,0 +1,37 @@
+"""add notes partition table
+
+Revision ID: 72e4cf89f190
+Revises: d8a2f5c1e6b0
+Create Date: 2026-10-18 18:05:37.214903
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "72e4cf89f190"
+down_revision: Union[str, None] = "d8a2f5c1e6b0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # no backfill, partitions without a row have version 0 and every process
+    # starts without sketches
+    op.create_table(
+        "notes_partition",
+        sa.Column("partition", sa.Integer(), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_notes_partition")),
+        sa.UniqueConstraint("partition", name=op.f("uq_notes_partition_partition")),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("notes_partition")
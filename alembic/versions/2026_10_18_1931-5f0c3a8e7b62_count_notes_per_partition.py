@@ -0,0 +1,63 @@
+"""count notes per partition
+
+Revision ID: 5f0c3a8e7b62
+Revises: 72e4cf89f190
+Create Date: 2026-10-18 19:31:46.508219
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "5f0c3a8e7b62"
+down_revision: Union[str, None] = "72e4cf89f190"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# SKETCH_PARTITION_SIZE at the time of this migration
+SKETCH_PARTITION_SIZE = 20_000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "notes_partition",
+        sa.Column("notes", sa.BigInteger(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "notes_partition",
+        sa.Column("words", sa.BigInteger(), server_default="0", nullable=False),
+    )
+    # note writes wait for the backfill, so none of them is missed
+    op.execute("LOCK TABLE note IN SHARE MODE")
+    op.execute(
+        sa.text(
+            "INSERT INTO notes_partition (partition, version, notes, words) "
+            "SELECT id / :partition_size, 1, count(*), coalesce(sum(word_count), 0) "
+            "FROM note GROUP BY 1 "
+            "ON CONFLICT (partition) DO UPDATE "
+            "SET notes = excluded.notes, words = excluded.words"
+        ).bindparams(partition_size=SKETCH_PARTITION_SIZE)
+    )
+    op.drop_table("notes_totals")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table(
+        "notes_totals",
+        sa.Column("notes", sa.BigInteger(), nullable=False),
+        sa.Column("words", sa.BigInteger(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_notes_totals")),
+    )
+    op.execute("LOCK TABLE note IN SHARE MODE")
+    op.execute(
+        "INSERT INTO notes_totals (id, notes, words) "
+        "SELECT 1, count(*), coalesce(sum(word_count), 0) FROM note"
+    )
+    op.drop_column("notes_partition", "words")
+    op.drop_column("notes_partition", "notes")
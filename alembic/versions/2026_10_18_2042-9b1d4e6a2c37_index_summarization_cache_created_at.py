@@ -0,0 +1,33 @@
+"""index summarization cache created_at
+
+Revision ID: 9b1d4e6a2c37
+Revises: 5f0c3a8e7b62
+Create Date: 2026-10-18 20:42:13.271946
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "9b1d4e6a2c37"
+down_revision: Union[str, None] = "5f0c3a8e7b62"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        op.f("ix_summarization_cache_created_at"),
+        "summarization_cache",
+        ["created_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        op.f("ix_summarization_cache_created_at"), table_name="summarization_cache"
+    )
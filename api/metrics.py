@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from api.v1.auth.security_utils import verified_token_cache
+from api.v1.notes.summarization import (
+    summarization_cache,
+    summarization_db_cache_stats,
+)
+from core.database.db_helper import db_helper
+from core.database.pool_metrics import PoolMetrics, render_metrics
+from core.utils.cache import LRUCache
+
+router = APIRouter(tags=["metrics"])
+
+# Prometheus text exposition format
+METRICS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# in-process caches by their label
+CACHES: dict[str, LRUCache] = {
+    "summarization": summarization_cache,
+    "verified_token": verified_token_cache,
+}
+
+# (type, help, value of a cache) of metrics rendered for every cache
+CACHE_METRICS = {
+    "cache_entries": ("gauge", "Entries in the cache", len),
+    "cache_max_entries": ("gauge", "Capacity of the cache", lambda c: c.maxsize),
+    "cache_hits_total": ("counter", "Lookups found in the cache", lambda c: c.hits),
+    "cache_misses_total": (
+        "counter",
+        "Lookups missing in the cache or expired",
+        lambda c: c.misses,
+    ),
+}
+
+
+def render_cache_metrics(caches: dict[str, LRUCache]) -> str:
+    """Returns Prometheus text exposition of in-process caches"""
+    lines = []
+    for name, (metric_type, description, value) in CACHE_METRICS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+        lines += [
+            f'{name}{{cache="{label}"}} {value(cache)}'
+            for label, cache in caches.items()
+        ]
+    # second level of summarization cache, its misses are AI calls
+    for result, count in summarization_db_cache_stats.items():
+        name = f"summarization_db_cache_{result}_total"
+        lines += [
+            f"# HELP {name} Lookups {result} in summarization_cache table",
+            f"# TYPE {name} counter",
+            f"{name} {count}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(
+    pool_metrics: list[PoolMetrics] = Depends(db_helper.pool_metrics_getter),
+):
+    """Connection pool and cache metrics for Prometheus"""
+    return PlainTextResponse(
+        render_metrics(pool_metrics) + render_cache_metrics(CACHES),
+        media_type=METRICS_MEDIA_TYPE,
+    )
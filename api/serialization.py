@@ -0,0 +1,65 @@
+"""Pre-encoded JSON responses.
+
+FastAPI validates whatever a view returns against `response_model` and then
+converts it with `jsonable_encoder`, so rows validated by the view are validated
+twice. Views returning `json_response` skip both: rows are read by an encoder
+compiled once per schema and dumped with orjson. `response_model` of the route
+is still used for OpenAPI.
+"""
+
+import functools
+import operator
+from collections.abc import Callable
+from typing import Any
+
+import orjson
+from fastapi import Response, status
+from pydantic import BaseModel
+
+# pydantic writes UTC datetimes with "Z" as well
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+@functools.cache
+def row_encoder(schema: type[BaseModel]) -> Callable[[Any], dict]:
+    """Returns function reading fields of `schema` from an ORM object or a row"""
+    return fields_encoder(tuple(schema.model_fields))
+
+
+@functools.cache
+def fields_encoder(fields: tuple[str, ...]) -> Callable[[Any], dict]:
+    """Returns function reading `fields` from an ORM object or a row"""
+    getter = operator.attrgetter(*fields)
+    if len(fields) == 1:
+        return lambda row: {fields[0]: getter(row)}
+    return lambda row: dict(zip(fields, getter(row)))
+
+
+def encode_rows(schema: type[BaseModel], rows) -> list[dict]:
+    encoder = row_encoder(schema)
+    return [encoder(row) for row in rows]
+
+
+def default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError
+
+
+def json_response(
+    content: Any,
+    response: Response | None = None,
+    status_code: int = status.HTTP_200_OK,
+) -> Response:
+    """Returns `content` dumped by orjson, with headers set by dependencies
+    on their `response`. Pydantic models are dumped by their own serializer"""
+    if isinstance(content, BaseModel):
+        body = content.model_dump_json().encode()
+    else:
+        body = orjson.dumps(content, default=default, option=ORJSON_OPTIONS)
+    return Response(
+        body,
+        status_code=status_code,
+        media_type="application/json",
+        headers=response.headers if response is not None else None,
+    )
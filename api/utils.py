@@ -1,3 +1,12 @@
+import base64
+import hashlib
+from datetime import datetime
+from email.utils import format_datetime
+
+import orjson
+from fastapi import HTTPException, Request, Response, status
+
+
 def validation_error(loc: list[str], msg: str, input_value=None, reason=None) -> dict:
     """Returns detail for HttpException in OpenApi format"""
     error = {
@@ -10,3 +19,52 @@ def validation_error(loc: list[str], msg: str, input_value=None, reason=None) ->
     if reason:
         error["ctx"] = {"reason": reason}
     return {"detail": [error]}
+
+
+def encode_cursor(*values) -> str:
+    """Returns opaque keyset pagination cursor"""
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    """Returns values of cursor, raises ValueError if it is malformed"""
+    values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list):
+        raise ValueError("Malformed cursor")
+    return values
+
+
+def weak_etag(*values) -> str:
+    """Returns weak ETag of values, which must change with the representation"""
+    digest = hashlib.blake2b(orjson.dumps(values), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of ETag against If-None-Match header"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque_tag
+        for candidate in if_none_match.split(",")
+    )
+
+
+def validator_headers(etag: str, last_modified: datetime | None) -> dict[str, str]:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def check_not_modified(
+    request: Request, response: Response, etag: str, last_modified: datetime | None
+) -> None:
+    """Sets validators of response, raises 304 if client's copy is still fresh"""
+    headers = validator_headers(etag, last_modified)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
@@ -1,15 +1,58 @@
-from sqlalchemy import Result, select
+from collections import Counter
+from typing import AsyncGenerator, Mapping, Sequence
+
+from sqlalchemy import Result, Row, delete, func, literal, select, text, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.database import Note
+from api.v1.analytics.tokenizer import count_note_words
+from api.v1.notes.schemas import NoteSchema
+from core.database import Note, NotesPartition, WordFrequency
+
+# two bind parameters per upserted row, one per deleted word,
+# asyncpg allows 32767 per statement
+WORD_FREQUENCY_CHUNK_SIZE = 10_000
+
+# notes with ids in [n * size, (n + 1) * size) are the n-th partition of sketches
+# of approximate analytics, notes_partition rows are kept by this size
+SKETCH_PARTITION_SIZE = 20_000
+
+
+def get_sketch_partition_ids(partition: int) -> tuple[int, int]:
+    """Returns first and last note id of partition"""
+    first_id = partition * SKETCH_PARTITION_SIZE
+    return first_id, first_id + SKETCH_PARTITION_SIZE - 1
 
 
-async def get_all_notes_for_analytics(
+async def get_notes_id_range(session: AsyncSession) -> tuple[int, int] | None:
+    first_id, last_id = (
+        await session.execute(select(func.min(Note.id), func.max(Note.id)))
+    ).one()
+    if first_id is None:
+        return None
+    return first_id, last_id
+
+
+async def stream_notes_for_analytics(
     session: AsyncSession,
-) -> list[tuple[str, str]]:
-    stmt = select(Note.title, Note.text).order_by(Note.id)
-    result: Result = await session.execute(stmt)
-    return result.all()
+    chunk_size: int,
+    first_id: int | None = None,
+    last_id: int | None = None,
+) -> AsyncGenerator[Sequence[Row], None]:
+    """Yields chunks of (title, text) of notes read by a server-side cursor,
+    optionally only with ids in [first_id, last_id]"""
+    stmt = (
+        select(Note.title, Note.text)
+        .order_by(Note.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    if first_id is not None:
+        stmt = stmt.where(Note.id >= first_id)
+    if last_id is not None:
+        stmt = stmt.where(Note.id <= last_id)
+    result = await session.stream(stmt)
+    async for rows in result.partitions(chunk_size):
+        yield rows
 
 
 async def get_all_notes(session: AsyncSession) -> list[Note]:
@@ -17,3 +60,252 @@ async def get_all_notes(session: AsyncSession) -> list[Note]:
     result: Result = await session.execute(stmt)
     notes = result.scalars().all()
     return list(notes)
+
+
+async def stream_all_notes(
+    session: AsyncSession, chunk_size: int
+) -> AsyncGenerator[Sequence[Row], None]:
+    """Yields chunks of NoteSchema columns read by a server-side cursor"""
+    columns = [getattr(Note, field) for field in NoteSchema.model_fields]
+    stmt = select(*columns).order_by(Note.id).execution_options(yield_per=chunk_size)
+    result = await session.stream(stmt)
+    async for rows in result.partitions(chunk_size):
+        yield rows
+
+
+# session.info flag of note writes, see invalidate_cached_analytics
+ANALYTICS_CHANGED = "analytics_changed"
+
+
+async def apply_word_count_delta(
+    session: AsyncSession,
+    delta: Counter,
+    note_deltas: Mapping[int, tuple[int, int]],
+) -> None:
+    """Adds per-word delta to word_frequency table and (notes, words) delta of
+    every written note, by its id, to the counters of its partition, bumping
+    the partition version, without commit.
+
+    Words are upserted in sorted order, then partitions in sorted order, so
+    concurrent note writes lock rows in the same order and can't deadlock each
+    other. There is no global totals row, writes of notes in different
+    partitions don't wait for each other. Cached analytics are invalidated
+    when the session commits.
+    """
+    session.info[ANALYTICS_CHANGED] = True
+    rows = [{"word": word, "count": count} for word, count in sorted(delta.items())]
+    rows = [row for row in rows if row["count"]]
+    for start in range(0, len(rows), WORD_FREQUENCY_CHUNK_SIZE):
+        chunk = rows[start : start + WORD_FREQUENCY_CHUNK_SIZE]
+        stmt = insert(WordFrequency).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[WordFrequency.word],
+            set_={"count": WordFrequency.count + stmt.excluded["count"]},
+        )
+        await session.execute(stmt)
+        removed = [row["word"] for row in chunk if row["count"] < 0]
+        if removed:
+            await session.execute(
+                delete(WordFrequency).where(
+                    WordFrequency.word.in_(removed), WordFrequency.count <= 0
+                )
+            )
+    partition_deltas: dict[int, Counter] = {}
+    for note_id, (notes, words) in note_deltas.items():
+        partition = note_id // SKETCH_PARTITION_SIZE
+        partition_deltas.setdefault(partition, Counter()).update(
+            notes=notes, words=words
+        )
+    if partition_deltas:
+        stmt = insert(NotesPartition).values(
+            [
+                {
+                    "partition": partition,
+                    "version": 1,
+                    "notes": partition_delta["notes"],
+                    "words": partition_delta["words"],
+                }
+                for partition, partition_delta in sorted(partition_deltas.items())
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[NotesPartition.partition],
+            set_={
+                "version": NotesPartition.version + 1,
+                "notes": NotesPartition.notes + stmt.excluded.notes,
+                "words": NotesPartition.words + stmt.excluded.words,
+            },
+        )
+        await session.execute(stmt)
+
+
+async def get_sketch_partition_versions(
+    session: AsyncSession, first_id: int, last_id: int
+) -> dict[int, int]:
+    """Returns versions of partitions of notes with ids in [first_id, last_id],
+    partitions that were never written have version 0"""
+    partitions = range(
+        first_id // SKETCH_PARTITION_SIZE, last_id // SKETCH_PARTITION_SIZE + 1
+    )
+    stmt = select(NotesPartition.partition, NotesPartition.version).where(
+        NotesPartition.partition.between(partitions.start, partitions.stop - 1)
+    )
+    versions = dict((await session.execute(stmt)).tuples().all())
+    return {partition: versions.get(partition, 0) for partition in partitions}
+
+
+async def get_notes_totals(session: AsyncSession) -> tuple[int, int]:
+    """Returns number of notes and total number of words in them, summed over
+    counters of partitions"""
+    stmt = select(
+        func.coalesce(func.sum(NotesPartition.notes), 0),
+        func.coalesce(func.sum(NotesPartition.words), 0),
+    )
+    notes, words = (await session.execute(stmt)).one()
+    return int(notes), int(words)
+
+
+async def get_most_common_words(session: AsyncSession, top: int) -> dict[str, int]:
+    stmt = (
+        select(WordFrequency.word, WordFrequency.count)
+        .order_by(WordFrequency.count.desc(), WordFrequency.word)
+        .limit(top)
+    )
+    result: Result = await session.execute(stmt)
+    return dict(result.tuples().all())
+
+
+async def get_notes_by_word_count(
+    session: AsyncSession, top: int, longest: bool
+) -> list[tuple[str, int]]:
+    """Returns (title, word_count) of longest or shortest notes, older first"""
+    order = Note.word_count.desc() if longest else Note.word_count.asc()
+    stmt = select(Note.title, Note.word_count).order_by(order, Note.id).limit(top)
+    result: Result = await session.execute(stmt)
+    return list(result.tuples().all())
+
+
+SQL_ANALYTICS_STMT = text(
+    """
+    WITH note_words AS MATERIALIZED (
+        SELECT note.id, left(words.word, :max_word_length) AS word,
+            (note.id::bigint << 32) + words.position AS occurrence
+        FROM note
+        LEFT JOIN LATERAL regexp_split_to_table(
+            regexp_replace(
+                lower(note.title || ' ' || note.text), :non_word_pattern, '', 'g'
+            ),
+            '[[:space:]]+'
+        ) WITH ORDINALITY AS words (word, position) ON words.word <> ''
+    ),
+    note_counts AS (
+        SELECT id, count(word) AS word_count
+        FROM note_words
+        GROUP BY id
+    )
+    SELECT 'totals' AS kind, NULL AS key, count(*) AS value,
+        coalesce(sum(word_count), 0)::bigint AS extra
+    FROM note_counts
+    UNION ALL
+    SELECT 'longest', note.title, longest.word_count,
+        row_number() OVER (ORDER BY longest.word_count DESC, longest.id)
+    FROM (
+        SELECT id, word_count FROM note_counts
+        ORDER BY word_count DESC, id LIMIT :top_notes
+    ) AS longest
+    JOIN note ON note.id = longest.id
+    UNION ALL
+    SELECT 'shortest', note.title, shortest.word_count,
+        row_number() OVER (ORDER BY shortest.word_count, shortest.id)
+    FROM (
+        SELECT id, word_count FROM note_counts
+        ORDER BY word_count, id LIMIT :top_notes
+    ) AS shortest
+    JOIN note ON note.id = shortest.id
+    UNION ALL
+    SELECT 'word', word, count, row_number() OVER (ORDER BY count DESC, first)
+    FROM (
+        SELECT word, count(*) AS count, min(occurrence) AS first
+        FROM note_words
+        WHERE word IS NOT NULL
+        GROUP BY word
+        ORDER BY count DESC, first LIMIT :top_words
+    ) AS common_words
+    """
+)
+
+
+async def get_sql_analytics_rows(
+    session: AsyncSession,
+    non_word_pattern: str,
+    top_words: int,
+    top_notes: int,
+    max_word_length: int,
+) -> list[Row]:
+    """Computes analytics inside Postgres, returns (kind, key, value, extra) rows:
+    one "totals" row (notes, words), then "longest", "shortest" and "word" rows
+    with their place in `extra`, ties are broken by note id and word position
+    like in pandas engine, words are truncated to `max_word_length` characters"""
+    result = await session.execute(
+        SQL_ANALYTICS_STMT,
+        {
+            "non_word_pattern": non_word_pattern,
+            "top_words": top_words,
+            "top_notes": top_notes,
+            "max_word_length": max_word_length,
+        },
+    )
+    return list(result.all())
+
+
+async def rebuild_word_frequency(session: AsyncSession, batch_size: int = 1_000) -> int:
+    """Recomputes word_frequency table, note.word_count and counters of
+    partitions from scratch, bumps versions of all partitions and commits.
+
+    Note writes are blocked until rebuild commits, so no delta is lost.
+    Returns number of processed notes.
+    """
+    await session.execute(text("LOCK TABLE note IN SHARE MODE"))
+    await session.execute(delete(WordFrequency))
+    word_counts: Counter = Counter()
+    processed = 0
+    last_id = 0
+    while True:
+        stmt = (
+            select(Note.id, Note.title, Note.text)
+            .where(Note.id > last_id)
+            .order_by(Note.id)
+            .limit(batch_size)
+        )
+        notes = (await session.execute(stmt)).all()
+        if not notes:
+            break
+        word_count_updates = []
+        for note_id, title, note_text in notes:
+            note_words = count_note_words(title, note_text)
+            word_counts.update(note_words)
+            word_count_updates.append({"id": note_id, "word_count": note_words.total()})
+        await session.execute(update(Note), word_count_updates)
+        processed += len(notes)
+        last_id = notes[-1].id
+    await apply_word_count_delta(session, word_counts, {})
+    # notes may have been written bypassing apply_word_count_delta
+    await session.execute(
+        update(NotesPartition).values(
+            version=NotesPartition.version + 1, notes=0, words=0
+        )
+    )
+    partition = Note.id // SKETCH_PARTITION_SIZE
+    stmt = insert(NotesPartition).from_select(
+        ["partition", "version", "notes", "words"],
+        select(partition, literal(1), func.count(), func.sum(Note.word_count)).group_by(
+            partition
+        ),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[NotesPartition.partition],
+        set_={"notes": stmt.excluded.notes, "words": stmt.excluded.words},
+    )
+    await session.execute(stmt)
+    await session.commit()
+    return processed
@@ -0,0 +1,13 @@
+from fastapi import HTTPException, status
+
+from api.utils import validation_error
+
+analytics_busy_exc = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail=validation_error(
+        loc=["query"],
+        msg="Server is busy",
+        reason="Too many analytics computations in progress, try again later",
+    )["detail"],
+    headers={"Retry-After": "5"},
+)
@@ -1,67 +1,463 @@
-import re
+import asyncio
 from collections import Counter
+from dataclasses import dataclass
+from typing import AsyncGenerator, Literal, Sequence
 
+import orjson
 import pandas as pd
-from fastapi import Depends
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Depends, Query
+from sqlalchemy import NullPool, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
 
-from api.v1.analytics.controllers import get_all_notes_for_analytics
+from api.v1.analytics.controllers import (
+    ANALYTICS_CHANGED,
+    get_most_common_words,
+    get_notes_by_word_count,
+    get_notes_id_range,
+    get_notes_totals,
+    get_sketch_partition_ids,
+    get_sketch_partition_versions,
+    get_sql_analytics_rows,
+    stream_all_notes,
+    stream_notes_for_analytics,
+)
+from api.v1.analytics.exceptions import analytics_busy_exc
 from api.v1.analytics.schemas import AnalyticsSchema
+from api.v1.analytics.sketches import CountMinSketch, SpaceSaving
+from api.v1.analytics.tokenizer import (
+    MAX_WORD_LENGTH,
+    NON_WORD_TABLE,
+    clean_text,
+    postgres_non_word_pattern,
+)
+from core.config import settings
 from core.database.db_helper import db_helper
+from core.utils.cache import SingleFlightCache
+from core.utils.executors import BoundedExecutor, ExecutorSaturatedError
 
+analytics_executor = BoundedExecutor(
+    kind="process",
+    max_workers=settings.analytics.workers,
+    max_queue_depth=settings.analytics.max_queue_depth,
+)
 
-def clean_text(text: str) -> str:
-    return re.sub(r"[^a-zA-Zа-яА-ЯёЁ0-9\s]", "", text.lower())
 
+analytics_cache: SingleFlightCache[tuple[str, str | None], AnalyticsSchema] = (
+    SingleFlightCache(settings.analytics.cache_ttl, settings.analytics.cache_stale_ttl)
+)
 
-def count_total_and_avg_words(df: pd.DataFrame) -> tuple[int, int]:
-    total_words = df["word_count"].sum()
-    avg_words = int(df["word_count"].mean())
-    return total_words, avg_words
 
+@dataclass(frozen=True)
+class PartitionSketch:
+    """Common words summaries of a partition at a version of notes_partition"""
 
-def count_most_common_words(df: pd.DataFrame, top: int) -> dict:
-    words = " ".join(df["content"]).lower().split()
-    word_counts = Counter(words)
-    common_words = dict(word_counts.most_common(top))
-    return common_words
+    version: int
+    sketch: CountMinSketch
+    heavy_hitters: SpaceSaving
 
 
-def count_top_shortest_and_longest(df: pd.DataFrame, top: int) -> tuple:
-    top_longest_notes = dict(
-        df.nlargest(top, "word_count")[["title", "word_count"]].values
+# summaries of partitions are kept by every process, keyed by partition number
+partition_sketches: dict[int, PartitionSketch] = {}
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_cached_analytics(session: Session) -> None:
+    if session.info.pop(ANALYTICS_CHANGED, False):
+        analytics_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_analytics_changes(session: Session) -> None:
+    session.info.pop(ANALYTICS_CHANGED, None)
+
+
+def clean_series(series: pd.Series) -> pd.Series:
+    return series.str.lower().str.translate(NON_WORD_TABLE)
+
+
+def explode_words(words: pd.Series) -> pd.Series:
+    """One word per row, truncated like tokenize_note does, empty notes are NaN"""
+    return words.explode().str.slice(stop=MAX_WORD_LENGTH)
+
+
+class AnalyticsAccumulator:
+    """Folds chunks of notes into analytics, so the whole corpus
+    is never held in memory at once"""
+
+    def __init__(self, top_words: int = 10, top_notes: int = 3):
+        self.top_words = top_words
+        self.top_notes = top_notes
+        self.total_notes = 0
+        self.total_words = 0
+        self.word_counts: Counter = Counter()
+        self.longest: pd.DataFrame | None = None
+        self.shortest: pd.DataFrame | None = None
+
+    def update(self, titles: Sequence[str], texts: Sequence[str]) -> None:
+        titles = pd.Series(titles, dtype=object)
+        words = clean_series(titles + " " + pd.Series(texts, dtype=object)).str.split()
+        notes = pd.DataFrame({"title": titles, "word_count": words.str.len()})
+        self.total_notes += len(notes)
+        self.total_words += int(notes["word_count"].sum())
+        self._count_words(words)
+        self.longest = self._top(self.longest, notes, largest=True)
+        self.shortest = self._top(self.shortest, notes, largest=False)
+
+    def merge(self, other: "AnalyticsAccumulator") -> None:
+        """Adds results of a partition that follows all partitions merged before"""
+        self.total_notes += other.total_notes
+        self.total_words += other.total_words
+        self._merge_word_counts(other)
+        self.longest = self._top(self.longest, other.longest, largest=True)
+        self.shortest = self._top(self.shortest, other.shortest, largest=False)
+
+    def _count_words(self, words: pd.Series) -> None:
+        # sort=False keeps first occurrence order, so ties are ranked like before
+        self.word_counts.update(explode_words(words).value_counts(sort=False).to_dict())
+
+    def _merge_word_counts(self, other: "AnalyticsAccumulator") -> None:
+        self.word_counts.update(other.word_counts)
+
+    def _top(
+        self,
+        current: pd.DataFrame | None,
+        notes: pd.DataFrame | None,
+        largest: bool,
+    ) -> pd.DataFrame | None:
+        if current is not None and notes is not None:
+            notes = pd.concat([current, notes], ignore_index=True)
+        elif notes is None:
+            return current
+        if largest:
+            return notes.nlargest(self.top_notes, "word_count")
+        return notes.nsmallest(self.top_notes, "word_count")
+
+    @staticmethod
+    def _titles_word_counts(notes: pd.DataFrame) -> dict[str, int]:
+        return {
+            clean_text(title): int(word_count)
+            for title, word_count in notes.itertuples(index=False)
+        }
+
+    def result(self) -> AnalyticsSchema:
+        if not self.total_notes:
+            return AnalyticsSchema()
+        return AnalyticsSchema(
+            total_notes=self.total_notes,
+            total_words=self.total_words,
+            avg_words=int(self.total_words / self.total_notes),
+            common_words=dict(self.word_counts.most_common(self.top_words)),
+            top_longest_notes=self._titles_word_counts(self.longest),
+            top_shortest_notes=self._titles_word_counts(self.shortest),
+        )
+
+
+class SketchAnalyticsAccumulator(AnalyticsAccumulator):
+    """AnalyticsAccumulator that estimates common words with Count-Min Sketch
+    and Space-Saving, so its size and merge cost don't depend on vocabulary"""
+
+    def __init__(self, top_words: int = 10, top_notes: int = 3):
+        super().__init__(top_words, top_notes)
+        self.sketch = CountMinSketch(
+            settings.analytics.sketch_width, settings.analytics.sketch_depth
+        )
+        self.heavy_hitters = SpaceSaving(settings.analytics.heavy_hitters_capacity)
+
+    def _count_words(self, words: pd.Series) -> None:
+        counts = explode_words(words).value_counts()
+        vocabulary, values = counts.index.tolist(), counts.to_numpy()
+        self.sketch.update(vocabulary, values)
+        self.heavy_hitters.update(vocabulary, values)
+
+    def _merge_word_counts(self, other: "SketchAnalyticsAccumulator") -> None:
+        self.sketch.merge(other.sketch)
+        self.heavy_hitters.merge(other.heavy_hitters)
+
+    def result(self) -> AnalyticsSchema:
+        schema = super().result()
+        if not self.total_notes:
+            return schema
+        return with_estimated_common_words(
+            schema, self.sketch, self.heavy_hitters, self.top_words
+        )
+
+
+def with_estimated_common_words(
+    schema: AnalyticsSchema,
+    sketch: CountMinSketch,
+    heavy_hitters: SpaceSaving,
+    top_words: int,
+) -> AnalyticsSchema:
+    """Returns approximate schema with common words of the summaries, they are
+    upper bounds, true count of a word is at least its count minus its
+    `common_words_error`"""
+    top = heavy_hitters.top(top_words)
+    estimates = sketch.estimate([word for word, _, _ in top])
+    common_words, errors = {}, {}
+    for (word, count, error), estimate in zip(top, estimates):
+        common_words[word] = min(count, int(estimate))
+        errors[word] = max(0, common_words[word] - (count - error))
+    common_words = dict(
+        sorted(common_words.items(), key=lambda item: item[1], reverse=True)
     )
-    top_shortest_notes = dict(
-        df.nsmallest(top, "word_count")[["title", "word_count"]].values
+    return schema.model_copy(
+        update={
+            "approximate": True,
+            "common_words": common_words,
+            "common_words_error": {word: errors[word] for word in common_words},
+        }
     )
-    return top_longest_notes, top_shortest_notes
 
 
-async def get_analytics(session: AsyncSession = Depends(db_helper.session_getter)):
-    notes = await get_all_notes_for_analytics(session)
-    schema = AnalyticsSchema()
-    if not notes:
-        return schema
+async def get_analytics(
+    mode: Literal["exact", "approx"] = Query("exact"),
+    engine: Literal["incremental", "pandas", "sql"] | None = Query(None),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        db_helper.read_factory_getter
+    ),
+) -> AnalyticsSchema:
+    """`engine` overrides `settings.analytics.engine`, `mode=approx` ignores it.
+
+    Results are cached per mode and engine, concurrent requests share one
+    computation, which has its own session, so it outlives a cancelled request.
+    It runs on a replica, so a result computed right after the commit that
+    invalidated the cache may miss the last `replica_max_lag` seconds of writes.
+    """
+    if mode == "approx":
+        engine = None
+    else:
+        engine = engine or settings.analytics.engine
 
-    titles, texts = zip(*notes)
+    async def compute() -> AnalyticsSchema:
+        async with session_factory() as session:
+            return await compute_analytics(session, mode, engine)
 
-    cleaned_titles = [clean_text(title) for title in titles]
-    cleaned_texts = [clean_text(text) for text in texts]
+    return await analytics_cache.get((mode, engine), compute)
 
-    df = pd.DataFrame({"title": cleaned_titles, "text": cleaned_texts})
-    df["content"] = df["title"] + " " + df["text"]
-    df["word_count"] = df["content"].apply(lambda x: len(x.split()))
 
-    total_words, avg_words = count_total_and_avg_words(df)
+async def compute_analytics(
+    session: AsyncSession,
+    mode: Literal["exact", "approx"],
+    engine: Literal["incremental", "pandas", "sql"] | None,
+) -> AnalyticsSchema:
+    if mode == "approx":
+        return await get_approx_analytics(session)
+    if engine == "pandas":
+        return await get_pandas_analytics(session)
+    if engine == "sql":
+        return await get_sql_analytics(session)
+    return await get_incremental_analytics(session)
 
-    common_words = count_most_common_words(df, 10)
-    top_longest_notes, top_shortest_notes = count_top_shortest_and_longest(df, 3)
 
+async def get_sql_analytics(session: AsyncSession) -> AnalyticsSchema:
+    """Tokenizes and counts words inside Postgres, only the results are transferred"""
+    rows = await get_sql_analytics_rows(
+        session,
+        postgres_non_word_pattern(),
+        top_words=10,
+        top_notes=3,
+        max_word_length=MAX_WORD_LENGTH,
+    )
+    ranked = {"longest": [], "shortest": [], "word": []}
+    total_notes = total_words = 0
+    for kind, key, value, extra in rows:
+        if kind == "totals":
+            total_notes, total_words = value, extra
+        else:
+            ranked[kind].append((extra, key, value))
+    if not total_notes:
+        return AnalyticsSchema()
+    longest, shortest, words = (sorted(ranked[kind]) for kind in ranked)
     return AnalyticsSchema(
-        total_notes=len(df),
+        total_notes=total_notes,
         total_words=total_words,
-        avg_words=avg_words,
+        avg_words=int(total_words / total_notes),
+        common_words={word: count for _, word, count in words},
+        top_longest_notes={clean_text(title): count for _, title, count in longest},
+        top_shortest_notes={clean_text(title): count for _, title, count in shortest},
+    )
+
+
+async def get_incremental_analytics(session: AsyncSession) -> AnalyticsSchema:
+    """Builds analytics from word_frequency table and note.word_count
+    with a few indexed queries instead of reading every note"""
+    total_notes, total_words = await get_notes_totals(session)
+    if not total_notes:
+        return AnalyticsSchema()
+    common_words = await get_most_common_words(session, 10)
+    longest = await get_notes_by_word_count(session, 3, longest=True)
+    shortest = await get_notes_by_word_count(session, 3, longest=False)
+    return AnalyticsSchema(
+        total_notes=total_notes,
+        total_words=total_words,
+        avg_words=total_words // total_notes,
         common_words=common_words,
-        top_longest_notes=top_longest_notes,
-        top_shortest_notes=top_shortest_notes,
+        top_longest_notes={clean_text(title): count for title, count in longest},
+        top_shortest_notes={clean_text(title): count for title, count in shortest},
+    )
+
+
+def analyze_partition(
+    url: str,
+    snapshot: str,
+    first_id: int,
+    last_id: int,
+    chunk_size: int,
+    approximate: bool = False,
+) -> AnalyticsAccumulator:
+    """Process pool task: folds notes with ids in [first_id, last_id],
+    as seen by exported `snapshot`, into an accumulator"""
+
+    async def analyze() -> AnalyticsAccumulator:
+        accumulator = (
+            SketchAnalyticsAccumulator() if approximate else AnalyticsAccumulator()
+        )
+        engine = create_async_engine(url, poolclass=NullPool)
+        try:
+            async with engine.connect() as conn:
+                await conn.execution_options(isolation_level="REPEATABLE READ")
+                await conn.begin()
+                await conn.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+                async with AsyncSession(bind=conn) as session:
+                    async for rows in stream_notes_for_analytics(
+                        session, chunk_size, first_id, last_id
+                    ):
+                        titles, texts = zip(*rows)
+                        accumulator.update(titles, texts)
+        finally:
+            await engine.dispose()
+        return accumulator
+
+    return asyncio.run(analyze())
+
+
+def split_id_range(first_id: int, last_id: int, parts: int) -> list[tuple[int, int]]:
+    step = max(1, -(-(last_id - first_id + 1) // parts))
+    return [
+        (start, min(start + step - 1, last_id))
+        for start in range(first_id, last_id + 1, step)
+    ]
+
+
+async def get_pandas_analytics(session: AsyncSession) -> AnalyticsSchema:
+    """Computes analytics with map-reduce over id ranges of notes in a process pool.
+
+    Every partition is streamed in `settings.analytics.chunk_size` chunks and processed
+    with vectorized pandas string operations. Workers import the snapshot of this
+    transaction, so all partitions see the same notes.
+    """
+    snapshot = await session.scalar(text("SELECT pg_export_snapshot()"))
+    id_range = await get_notes_id_range(session)
+    if id_range is None:
+        return AnalyticsSchema()
+    url = session.bind.engine.url.render_as_string(hide_password=False)
+    partitions = split_id_range(*id_range, settings.analytics.workers)
+    try:
+        results = await asyncio.gather(
+            *(
+                analytics_executor.run(
+                    analyze_partition,
+                    url,
+                    snapshot,
+                    first_id,
+                    last_id,
+                    settings.analytics.chunk_size,
+                )
+                for first_id, last_id in partitions
+            )
+        )
+    except ExecutorSaturatedError:
+        raise analytics_busy_exc
+    accumulator = AnalyticsAccumulator()
+    for result in results:
+        accumulator.merge(result)
+    return accumulator.result()
+
+
+async def get_approx_analytics(session: AsyncSession) -> AnalyticsSchema:
+    """Exact totals and longest/shortest notes like the incremental engine,
+    common words estimated from sketches of id partitions.
+
+    Sketches of every partition are kept in process with the partition version
+    they were built at. Only partitions written since are rebuilt in the process
+    pool, a few at a time, then the sketches of all partitions are merged.
+    Versions are read before the snapshot the partitions are rebuilt from is
+    exported, so a sketch may be newer than its version, but never older.
+    """
+    schema = await get_incremental_analytics(session)
+    id_range = await get_notes_id_range(session)
+    if not schema.total_notes or id_range is None:
+        return schema
+    versions = await get_sketch_partition_versions(session, *id_range)
+    # computations started after a write may run concurrently, so this one
+    # merges its own copy and never replaces a newer sketch
+    sketches = {partition: partition_sketches.get(partition) for partition in versions}
+    stale = [
+        partition
+        for partition, sketch in sketches.items()
+        if sketch is None or sketch.version != versions[partition]
+    ]
+    if stale:
+        snapshot = await session.scalar(text("SELECT pg_export_snapshot()"))
+        url = session.bind.engine.url.render_as_string(hide_password=False)
+        workers = settings.analytics.workers
+        for start in range(0, len(stale), workers):
+            wave = stale[start : start + workers]
+            try:
+                results = await asyncio.gather(
+                    *(
+                        analytics_executor.run(
+                            analyze_partition,
+                            url,
+                            snapshot,
+                            *get_sketch_partition_ids(partition),
+                            settings.analytics.chunk_size,
+                            True,
+                        )
+                        for partition in wave
+                    )
+                )
+            except ExecutorSaturatedError:
+                raise analytics_busy_exc
+            for partition, result in zip(wave, results):
+                sketches[partition] = PartitionSketch(
+                    versions[partition], result.sketch, result.heavy_hitters
+                )
+                cached = partition_sketches.get(partition)
+                if cached is None or cached.version <= versions[partition]:
+                    partition_sketches[partition] = sketches[partition]
+    for partition in partition_sketches.keys() - versions.keys():
+        del partition_sketches[partition]
+    sketch = CountMinSketch(
+        settings.analytics.sketch_width, settings.analytics.sketch_depth
     )
+    heavy_hitters = SpaceSaving(settings.analytics.heavy_hitters_capacity)
+    for partition_sketch in sketches.values():
+        sketch.merge(partition_sketch.sketch)
+        heavy_hitters.merge(partition_sketch.heavy_hitters)
+    return with_estimated_common_words(schema, sketch, heavy_hitters, top_words=10)
+
+
+async def encode_all_notes_json(
+    session_factory: async_sessionmaker[AsyncSession], chunk_size: int
+) -> AsyncGenerator[bytes, None]:
+    """Yields JSON array of all notes chunk by chunk with constant memory"""
+    async with session_factory() as session:
+        yield b"["
+        separator = b""
+        async for rows in stream_all_notes(session, chunk_size):
+            chunk = orjson.dumps(
+                [row._asdict() for row in rows], option=orjson.OPT_UTC_Z
+            )
+            yield separator + chunk[1:-1]
+            separator = b","
+        yield b"]"
+
+
+async def get_all_notes_json_stream(
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        db_helper.read_factory_getter
+    ),
+) -> AsyncGenerator[bytes, None]:
+    return encode_all_notes_json(session_factory, settings.analytics.stream_chunk_size)
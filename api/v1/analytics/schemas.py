@@ -8,3 +8,6 @@ class AnalyticsSchema(BaseModel):
     common_words: dict[str, int] = {}
     top_longest_notes: dict[str, int] = {}
     top_shortest_notes: dict[str, int] = {}
+    # set by ?mode=approx, true count of a common word is within its error below
+    approximate: bool = False
+    common_words_error: dict[str, int] = {}
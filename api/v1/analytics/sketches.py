@@ -0,0 +1,157 @@
+import hashlib
+import math
+import struct
+
+import numpy as np
+import orjson
+
+
+def _hash_words(words: list[str], seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Two independent 32-bit hashes per word, stable across processes"""
+    key = seed.to_bytes(8, "little")
+    digests = b"".join(
+        hashlib.blake2b(word.encode(), digest_size=8, key=key).digest()
+        for word in words
+    )
+    hashes = np.frombuffer(digests, dtype="<u8")
+    return hashes & 0xFFFFFFFF, (hashes >> np.uint64(32)) | np.uint64(1)
+
+
+class CountMinSketch:
+    """Frequency estimates in `depth` x `width` counters.
+
+    Estimate is never lower than true count and, with probability `confidence`,
+    exceeds it by at most `epsilon * total`.
+    """
+
+    _header = struct.Struct("<IIQq")
+
+    def __init__(self, width: int, depth: int, seed: int = 0):
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def confidence(self) -> float:
+        return 1 - math.exp(-self.depth)
+
+    @property
+    def error_bound(self) -> int:
+        return math.ceil(self.epsilon * self.total)
+
+    def _indexes(self, words: list[str]) -> np.ndarray:
+        first, second = _hash_words(words, self.seed)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((first + rows * second) % np.uint64(self.width)).astype(np.intp)
+
+    def update(self, words: list[str], counts: np.ndarray) -> None:
+        if not words:
+            return
+        indexes = self._indexes(words)
+        for row in range(self.depth):
+            np.add.at(self.table[row], indexes[row], counts)
+        self.total += int(counts.sum())
+
+    def estimate(self, words: list[str]) -> np.ndarray:
+        if not words:
+            return np.zeros(0, dtype=np.int64)
+        indexes = self._indexes(words)
+        return self.table[np.arange(self.depth)[:, None], indexes].min(axis=0)
+
+    def merge(self, other: "CountMinSketch") -> None:
+        if self.table.shape != other.table.shape or self.seed != other.seed:
+            raise ValueError("Only sketches with the same shape and seed can merge")
+        self.table += other.table
+        self.total += other.total
+
+    def to_bytes(self) -> bytes:
+        header = self._header.pack(self.width, self.depth, self.seed, self.total)
+        return header + self.table.astype("<i8").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CountMinSketch":
+        width, depth, seed, total = cls._header.unpack_from(data)
+        sketch = cls(width, depth, seed)
+        sketch.total = total
+        table = np.frombuffer(data, dtype="<i8", offset=cls._header.size)
+        sketch.table = table.reshape(depth, width).astype(np.int64)
+        return sketch
+
+    def __reduce__(self):
+        return self.from_bytes, (self.to_bytes(),)
+
+
+class SpaceSaving:
+    """Top `capacity` heavy hitters with (count, error) per word.
+
+    True count of a word is between `count - error` and `count`, and every word
+    occurring more than `total / capacity` times is kept. Summaries are merged
+    as in "Mergeable Summaries" (Agarwal et al.), so partitions can be
+    summarized independently.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counters: dict[str, tuple[int, int]] = {}
+
+    @property
+    def min_count(self) -> int:
+        """Upper bound of count of any word that is not kept"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def update(self, words: list[str], counts: np.ndarray) -> None:
+        """Adds exact counts of a chunk, `words` sorted by count descending.
+
+        Words beyond capacity are dropped, their counts are not higher than
+        the smallest kept one, so the chunk itself is a valid summary.
+        """
+        chunk = SpaceSaving(self.capacity)
+        chunk.counters = {
+            word: (int(count), 0)
+            for word, count in zip(words[: self.capacity], counts[: self.capacity])
+        }
+        self.merge(chunk)
+
+    def merge(self, other: "SpaceSaving") -> None:
+        own_min, other_min = self.min_count, other.min_count
+        merged = {}
+        for word, (count, error) in self.counters.items():
+            other_count, other_error = other.counters.get(word, (other_min, other_min))
+            merged[word] = (count + other_count, error + other_error)
+        for word, (count, error) in other.counters.items():
+            if word not in merged:
+                merged[word] = (count + own_min, error + own_min)
+        top = sorted(merged.items(), key=lambda item: item[1][0], reverse=True)
+        self.counters = dict(top[: self.capacity])
+
+    def top(self, n: int) -> list[tuple[str, int, int]]:
+        """Returns (word, count, error) of `n` most frequent words"""
+        # counters are kept sorted by count, see `merge`
+        top = list(self.counters.items())[:n]
+        return [(word, count, error) for word, (count, error) in top]
+
+    def to_bytes(self) -> bytes:
+        counters = [
+            [word, count, error] for word, (count, error) in self.counters.items()
+        ]
+        return orjson.dumps({"capacity": self.capacity, "counters": counters})
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SpaceSaving":
+        state = orjson.loads(data)
+        summary = cls(state["capacity"])
+        summary.counters = {
+            word: (count, error) for word, count, error in state["counters"]
+        }
+        return summary
+
+    def __reduce__(self):
+        return self.from_bytes, (self.to_bytes(),)
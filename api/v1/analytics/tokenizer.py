@@ -0,0 +1,67 @@
+import functools
+import sys
+import unicodedata
+from collections import Counter
+
+
+class NonWordDeletionTable(dict):
+    """`str.translate` table deleting everything but letters, digits,
+    combining marks and whitespace of any script.
+
+    Filled lazily, one entry per seen code point. Combining marks are kept
+    because they are part of words in many scripts (Devanagari, Thai, Arabic...).
+    """
+
+    def __missing__(self, code_point: int) -> int | None:
+        char = chr(code_point)
+        is_word_char = (
+            char.isalnum()
+            or char.isspace()
+            or unicodedata.category(char).startswith("M")
+        )
+        self[code_point] = code_point if is_word_char else None
+        return self[code_point]
+
+
+NON_WORD_TABLE = NonWordDeletionTable()
+
+# longer words are counted by their first MAX_WORD_LENGTH characters, so a word
+# (4 bytes per character at most) always fits into the word_frequency index
+MAX_WORD_LENGTH = 255
+
+
+@functools.cache
+def postgres_non_word_pattern() -> str:
+    """Postgres regex matching characters deleted by NON_WORD_TABLE.
+
+    `[:alnum:]` and `lower()` follow the database locale, which must be a UTF-8 one
+    (C.UTF-8, en_US.UTF-8...), combining marks are listed explicitly.
+    """
+    marks = []
+    start = None
+    for code_point in range(sys.maxunicode + 2):
+        is_mark = code_point <= sys.maxunicode and unicodedata.category(
+            chr(code_point)
+        ).startswith("M")
+        if is_mark and start is None:
+            start = code_point
+        elif not is_mark and start is not None:
+            marks.append(f"\\U{start:08x}-\\U{code_point - 1:08x}")
+            start = None
+    return f"[^[:alnum:][:space:]{''.join(marks)}]"
+
+
+def clean_text(text: str) -> str:
+    return text.lower().translate(NON_WORD_TABLE)
+
+
+def tokenize_note(title: str, text: str) -> list[str]:
+    """Returns words of note exactly as analytics counts them"""
+    return [
+        word[:MAX_WORD_LENGTH]
+        for word in f"{clean_text(title)} {clean_text(text)}".split()
+    ]
+
+
+def count_note_words(title: str, text: str) -> Counter:
+    return Counter(tokenize_note(title, text))
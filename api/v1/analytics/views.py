@@ -1,12 +1,12 @@
+from typing import AsyncGenerator
+
 from fastapi import APIRouter, Depends
-from pydantic import TypeAdapter
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import StreamingResponse
 
-from api.v1.analytics.controllers import get_all_notes
-from api.v1.analytics.helpers import get_analytics
+from api.serialization import json_response
+from api.v1.analytics.helpers import get_all_notes_json_stream, get_analytics
 from api.v1.analytics.schemas import AnalyticsSchema
 from api.v1.notes.schemas import NoteSchema
-from core.database.db_helper import db_helper
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
@@ -15,13 +15,11 @@ router = APIRouter(prefix="/analytics", tags=["analytics"])
 async def get_analytics_of_all_notes(
     analytics: AnalyticsSchema = Depends(get_analytics),
 ):
-    return analytics
+    return json_response(analytics)
 
 
 @router.get("/notes", response_model=list[NoteSchema])
 async def get_all_notes_without_auth(
-    session: AsyncSession = Depends(db_helper.session_getter),
+    notes_json: AsyncGenerator[bytes, None] = Depends(get_all_notes_json_stream),
 ):
-    ta = TypeAdapter(list[NoteSchema])
-    notes = await get_all_notes(session)
-    return ta.validate_python(notes, from_attributes=True)
+    return StreamingResponse(notes_json, media_type="application/json")
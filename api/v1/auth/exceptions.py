@@ -38,3 +38,13 @@ user_not_found_exc = HTTPException(
         reason="No user with the provided ID exists",
     )["detail"],
 )
+
+password_executor_busy_exc = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail=validation_error(
+        loc=["body", "password"],
+        msg="Server is busy",
+        reason="Too many password checks in progress, try again later",
+    )["detail"],
+    headers={"Retry-After": "1"},
+)
@@ -1,31 +1,81 @@
+import math
+import time
 from datetime import timedelta
+from typing import AsyncGenerator
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException, Request, Response
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jwt import InvalidTokenError
+from sqlalchemy import event
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import ORMExecuteState, Session, object_session
 
 from api.v1.auth.controllers import create_user, get_user, get_user_by_username
 from api.v1.auth.exceptions import (
     invalid_token_exc,
+    password_executor_busy_exc,
     unauthed_exc,
     user_not_found_exc,
     username_taken_exc,
 )
-from api.v1.auth.schemas import UserSchema
+from api.v1.auth.schemas import Principal, UserSchema
 from api.v1.auth.security_utils import (
-    decode_jwt,
+    decode_jwt_cached,
     encode_jwt,
-    hash_password,
-    validate_password,
+    hash_password_async,
+    sign_write_marker,
+    validate_password_async,
+    verify_write_marker,
 )
 from core.config import settings
 from core.database import User
-from core.database.db_helper import db_helper
+from core.database.db_helper import db_helper, get_wal_lsn
+from core.utils.cache import LRUCache
+from core.utils.executors import ExecutorSaturatedError
 
 http_bearer = HTTPBearer()
 
+user_cache: LRUCache[int, Principal] = LRUCache(settings.jwt.user_cache_size)
+
+# cookie with the signed WAL position of the last committed write of the user
+WRITE_MARKER_COOKIE = "written_lsn"
+
+# session.info keys of user writes, cached users are invalidated on commit
+CHANGED_USER_IDS = "changed_user_ids"
+USERS_BULK_CHANGED = "users_bulk_changed"
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def remember_changed_user(mapper, connection, target: User) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(CHANGED_USER_IDS, set()).add(target.id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def remember_bulk_user_changes(orm_execute_state: ORMExecuteState) -> None:
+    # update(User)/delete(User) statements don't say which rows they change
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and any(
+        mapper.class_ is User for mapper in orm_execute_state.all_mappers
+    ):
+        orm_execute_state.session.info[USERS_BULK_CHANGED] = True
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_cached_users(session: Session) -> None:
+    if session.info.pop(USERS_BULK_CHANGED, False):
+        user_cache.clear()
+    for user_id in session.info.pop(CHANGED_USER_IDS, ()):
+        user_cache.pop(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_user_changes(session: Session) -> None:
+    session.info.pop(USERS_BULK_CHANGED, None)
+    session.info.pop(CHANGED_USER_IDS, None)
+
 
 async def validate_auth_user(
     user_in: UserSchema,
@@ -34,7 +84,11 @@ async def validate_auth_user(
     user = await get_user_by_username(session, user_in.username)
     if not user:
         raise user_not_found_exc
-    if not validate_password(user_in.password, user.password):
+    try:
+        is_valid = await validate_password_async(user_in.password, user.password)
+    except ExecutorSaturatedError:
+        raise password_executor_busy_exc
+    if not is_valid:
         raise unauthed_exc
     return user
 
@@ -42,7 +96,10 @@ async def validate_auth_user(
 async def create_auth_user(
     user_in: UserSchema, session: AsyncSession = Depends(db_helper.session_getter)
 ) -> User:
-    user_in.password = hash_password(user_in.password)
+    try:
+        user_in.password = await hash_password_async(user_in.password)
+    except ExecutorSaturatedError:
+        raise password_executor_busy_exc
     try:
         user = await create_user(session, user_in)
     except IntegrityError:
@@ -83,7 +140,7 @@ async def get_token_payload(
 ) -> dict:
     token = credentials.credentials
     try:
-        payload = decode_jwt(token)
+        payload = decode_jwt_cached(token)
     except InvalidTokenError:
         raise invalid_token_exc
     return payload
@@ -98,13 +155,102 @@ async def get_user_by_jwt_sub(
     return user
 
 
-async def get_current_user_by_access_token(
+async def get_principal_by_jwt_sub(
+    payload: dict, session: AsyncSession = Depends(db_helper.session_getter)
+) -> Principal:
+    user_id = int(payload.get("sub"))
+    principal = user_cache.get(user_id)
+    if principal is None:
+        user = await get_user_by_jwt_sub(payload, session)
+        principal = Principal.model_validate(user, from_attributes=True)
+        expires_at = time.time() + settings.jwt.user_cache_ttl_seconds
+        user_cache.set(user_id, principal, expires_at)
+    return principal
+
+
+async def get_access_token_payload(
     payload: dict = Depends(get_token_payload),
-    session: AsyncSession = Depends(db_helper.session_getter),
-) -> User:
+) -> dict:
     if payload.get(settings.jwt.TOKEN_TYPE_FIELD) != settings.jwt.ACCESS_TOKEN_TYPE:
         raise invalid_token_exc
-    return await get_user_by_jwt_sub(payload, session)
+    return payload
+
+
+async def get_current_principal_by_access_token(
+    payload: dict = Depends(get_access_token_payload),
+    session: AsyncSession = Depends(db_helper.session_getter),
+) -> Principal:
+    """Returns principal of the user row of access token `sub`.
+
+    Opt-in shortcuts: with `trust_access_token_claims` principal is built from
+    signed claims (note writes of a deleted user then fail with
+    user_not_found_exc), with `cache_users` user rows are cached in this process
+    for `user_cache_ttl_seconds`.
+    """
+    if settings.jwt.trust_access_token_claims:
+        return Principal(id=int(payload.get("sub")), username=payload.get("username"))
+    if settings.jwt.cache_users:
+        return await get_principal_by_jwt_sub(payload, session)
+    user = await get_user_by_jwt_sub(payload, session)
+    return Principal.model_validate(user, from_attributes=True)
+
+
+async def remember_write(
+    response: Response, session: AsyncSession, user_id: int
+) -> None:
+    """Sets the write marker cookie after a committed write of the user, so their
+    reads on any worker skip replicas that haven't replayed it yet. Without
+    replicas nothing reads it, so neither the WAL position nor the cookie is taken
+    """
+    if not db_helper.replica_factories:
+        return
+    response.set_cookie(
+        WRITE_MARKER_COOKIE,
+        sign_write_marker(user_id, await get_wal_lsn(session)),
+        max_age=math.ceil(settings.db.read_your_writes_seconds),
+        httponly=True,
+        samesite="strict",
+    )
+
+
+def get_written_lsn(request: Request, user_id: int) -> int | None:
+    """Returns WAL position of the last write of the user from the write marker
+    cookie, None if there is no valid one"""
+    marker = request.cookies.get(WRITE_MARKER_COOKIE)
+    if marker is None:
+        return None
+    return verify_write_marker(marker, user_id)
+
+
+async def get_read_session_with_jwt(
+    request: Request,
+    payload: dict = Depends(get_access_token_payload),
+) -> AsyncGenerator[AsyncSession, None]:
+    """Session of read-only endpoints, on a replica unless it may not have
+    replayed the last write of the user yet"""
+    user_id = int(payload.get("sub"))
+    session_factory = await db_helper.read_factory(get_written_lsn(request, user_id))
+    async with session_factory() as session:
+        yield session
+
+
+async def get_read_principal_by_access_token(
+    payload: dict = Depends(get_access_token_payload),
+    session: AsyncSession = Depends(get_read_session_with_jwt),
+) -> Principal:
+    """Same as get_current_principal_by_access_token, but the user row is read
+    with the session of read-only endpoints, so reads on a replica don't touch
+    the primary. A user the replica hasn't replayed yet is read on the primary.
+    """
+    try:
+        return await get_current_principal_by_access_token(payload, session)
+    except HTTPException as error:
+        if error is not user_not_found_exc or session.bind not in (
+            db_helper.replica_engines
+        ):
+            raise
+    async with db_helper.factory() as primary_session:
+        return await get_current_principal_by_access_token(payload, primary_session)
 
 
 async def get_current_user_by_refresh_token(
@@ -21,6 +21,12 @@ class UserSchema(BaseUser):
         return v
 
 
+class Principal(BaseUser):
+    """Authenticated user without a DB row behind it"""
+
+    id: int
+
+
 class Token(BaseModel):
     access_token: str
     refresh_token: str | None = None
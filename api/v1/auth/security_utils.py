@@ -1,3 +1,6 @@
+import hashlib
+import hmac
+import time
 import uuid
 from datetime import UTC, datetime, timedelta
 
@@ -5,6 +8,14 @@ import bcrypt
 import jwt
 
 from core.config import settings
+from core.utils.cache import LRUCache
+from core.utils.executors import BoundedExecutor
+
+password_executor = BoundedExecutor(
+    kind=settings.password.executor,
+    max_workers=settings.password.max_workers,
+    max_queue_depth=settings.password.max_queue_depth,
+)
 
 
 def encode_jwt(
@@ -37,6 +48,48 @@ def decode_jwt(
     return decoded
 
 
+verified_token_cache: LRUCache[str, dict] = LRUCache(settings.jwt.verified_cache_size)
+
+
+def decode_jwt_cached(jwt_token: str) -> dict:
+    """Same as decode_jwt, but skips signature check for recently verified tokens.
+
+    Entries live at most `verified_cache_ttl_seconds` and never past token `exp`.
+    """
+    key = hashlib.sha256(jwt_token.encode()).hexdigest()
+    payload = verified_token_cache.get(key)
+    if payload is None:
+        payload = decode_jwt(jwt_token)
+        expires_at = time.time() + settings.jwt.verified_cache_ttl_seconds
+        if "exp" in payload:
+            expires_at = min(expires_at, payload["exp"])
+        verified_token_cache.set(key, payload, expires_at)
+    return payload.copy()
+
+
+# key of read-your-writes markers, derived from the JWT private key, so all
+# workers share it without another secret to configure
+WRITE_MARKER_KEY = hashlib.sha256(settings.jwt.private_key_path.read_bytes()).digest()
+
+
+def sign_write_marker(user_id: int, written_lsn: int) -> str:
+    """Returns marker of a write of user committed at WAL position `written_lsn`"""
+    value = f"{user_id}:{written_lsn}"
+    signature = hmac.new(WRITE_MARKER_KEY, value.encode(), "sha256").hexdigest()
+    return f"{value}:{signature}"
+
+
+def verify_write_marker(marker: str, user_id: int) -> int | None:
+    """Returns WAL position of the write of sign_write_marker, None if the marker
+    is forged or of another user"""
+    value, _, signature = marker.rpartition(":")
+    expected = hmac.new(WRITE_MARKER_KEY, value.encode(), "sha256").hexdigest()
+    marker_user_id, _, written_lsn = value.partition(":")
+    if not hmac.compare_digest(signature, expected) or marker_user_id != str(user_id):
+        return None
+    return int(written_lsn)
+
+
 def hash_password(password: str) -> str:
     salt = bcrypt.gensalt()
     pwd_in_bytes: bytes = password.encode()
@@ -45,3 +98,11 @@ def hash_password(password: str) -> str:
 
 def validate_password(password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password.encode(), hashed_password.encode())
+
+
+async def hash_password_async(password: str) -> str:
+    return await password_executor.run(hash_password, password)
+
+
+async def validate_password_async(password: str, hashed_password: str) -> bool:
+    return await password_executor.run(validate_password, password, hashed_password)
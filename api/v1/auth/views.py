@@ -4,11 +4,11 @@ from api.v1.auth.helpers import (
     create_access_token,
     create_auth_user,
     create_refresh_token,
-    get_current_user_by_access_token,
+    get_current_principal_by_access_token,
     get_current_user_by_refresh_token,
     validate_auth_user,
 )
-from api.v1.auth.schemas import BaseUser, Token
+from api.v1.auth.schemas import BaseUser, Principal, Token
 from core.database import User
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
@@ -29,7 +29,9 @@ async def sign_up(user: User = Depends(create_auth_user)):
 
 
 @router.get("/me", response_model=BaseUser)
-async def get_user_info(user: User = Depends(get_current_user_by_access_token)):
+async def get_user_info(
+    user: Principal = Depends(get_current_principal_by_access_token),
+):
     return BaseUser.model_validate(user, from_attributes=True)
 
 
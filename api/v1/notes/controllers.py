@@ -1,46 +1,416 @@
-from datetime import UTC, datetime
+from collections import Counter
+from datetime import datetime
 
-from sqlalchemy import Result, select, update
+from sqlalchemy import (
+    Result,
+    Row,
+    Select,
+    cast,
+    delete,
+    func,
+    select,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import REGCONFIG, insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased
 
-from api.v1.notes.schemas import CreateNoteSchema, NoteSchema, UpdateNoteSchema
-from core.database import Note, NoteHistory
+from api.v1.analytics.controllers import apply_word_count_delta
+from api.v1.analytics.tokenizer import count_note_words
+from api.v1.notes.history import history_values, rebuild_history
+from api.v1.notes.schemas import (
+    BatchUpdateNoteSchema,
+    CreateNoteSchema,
+    NoteHistorySchema,
+    NoteSchema,
+    UpdateNoteSchema,
+)
+from core.config import settings
+from core.database import (
+    JobStatus,
+    Note,
+    NoteHistory,
+    NotesVersion,
+    SummarizationJob,
+    SummarizationStatus,
+)
+from core.database.note import SEARCH_CONFIG, SEARCH_TEXT_LENGTH
 
+# not mapped on Note, see its __mapper_args__
+note_search_vector = Note.__table__.c.search_vector
+SNIPPET_OPTIONS = "MaxFragments=2, MaxWords=20, MinWords=5, FragmentDelimiter= … "
 
-async def get_note(session: AsyncSession, note_id: int, user_id: int) -> Note:
-    stmt = select(Note).where(Note.id == note_id, Note.user_id == user_id)
-    return await session.scalar(stmt)
 
+def note_columns(columns: tuple[str, ...]) -> list:
+    return [getattr(Note, column) for column in columns]
 
-async def get_user_notes(session: AsyncSession, user_id: int) -> list[Note]:
-    stmt = select(Note).where(Note.user_id == user_id).order_by(Note.updated_at.desc())
+
+async def get_note(
+    session: AsyncSession,
+    note_id: int,
+    user_id: int,
+    columns: tuple[str, ...] | None = None,
+) -> Note | Row | None:
+    """Returns note, or only a row of its `columns` if they are given"""
+    if columns is None:
+        stmt = select(Note).where(Note.id == note_id, Note.user_id == user_id)
+        return await session.scalar(stmt)
+    stmt = select(*note_columns(columns)).where(
+        Note.id == note_id, Note.user_id == user_id
+    )
+    result: Result = await session.execute(stmt)
+    return result.one_or_none()
+
+
+def user_notes_stmt(
+    user_id: int,
+    limit: int | None = None,
+    after: tuple[datetime, int] | None = None,
+    columns: tuple[str, ...] | None = None,
+) -> Select:
+    entities = [Note] if columns is None else note_columns(columns)
+    stmt = (
+        select(*entities)
+        .where(Note.user_id == user_id)
+        .order_by(Note.updated_at.desc(), Note.id.desc())
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(Note.updated_at, Note.id) < after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+async def get_user_notes(
+    session: AsyncSession,
+    user_id: int,
+    limit: int | None = None,
+    after: tuple[datetime, int] | None = None,
+    columns: tuple[str, ...] | None = None,
+) -> list[Note] | list[Row]:
+    """Returns notes newest first, `after` is (updated_at, id) of the last seen note.
+
+    If `columns` are given only they are selected and rows are returned.
+    """
+    stmt = user_notes_stmt(user_id, limit, after, columns)
     result: Result = await session.execute(stmt)
+    if columns is not None:
+        return list(result.all())
     notes = result.scalars().all()
     return list(notes)
 
 
+async def get_user_notes_page(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    after: tuple[datetime, int] | None = None,
+    columns: tuple[str, ...] | None = None,
+) -> tuple[tuple, list[Note] | list[Row]]:
+    """Same as get_user_notes, but also returns version of all user notes
+    (see get_user_notes_version) taken by the same statement.
+
+    `columns` must include updated_at and id, rows of them also carry
+    the version columns.
+    """
+    version = user_notes_version_stmt(user_id).subquery("version")
+    page = user_notes_stmt(user_id, limit, after, columns).subquery().lateral("page")
+    if columns is None:
+        entities = [aliased(Note, page)]
+    else:
+        entities = [page.c[column] for column in columns]
+    stmt = (
+        select(*version.c, page.c.id.label("page_note_id"), *entities)
+        .select_from(version)
+        .outerjoin(page, true())
+        .order_by(page.c.updated_at.desc(), page.c.id.desc())
+    )
+    rows = (await session.execute(stmt)).all()
+    notes_version = tuple(rows[0][: len(version.c)])
+    # the version row is joined with nothing if the page is empty
+    if rows[0].page_note_id is None:
+        return notes_version, []
+    if columns is None:
+        return notes_version, [row[-1] for row in rows]
+    return notes_version, rows
+
+
+async def get_user_notes_by_ids(
+    session: AsyncSession, user_id: int, note_ids: list[int]
+) -> list[Row]:
+    """Returns (id, title, text) of those of notes that belong to user"""
+    stmt = select(Note.id, Note.title, Note.text).where(
+        Note.id.in_(note_ids), Note.user_id == user_id
+    )
+    result: Result = await session.execute(stmt)
+    return list(result.all())
+
+
+async def get_note_version(
+    session: AsyncSession, note_id: int, user_id: int
+) -> Row | None:
+    """Returns (updated_at, summarization_status) of note"""
+    stmt = select(Note.updated_at, Note.summarization_status).where(
+        Note.id == note_id, Note.user_id == user_id
+    )
+    result: Result = await session.execute(stmt)
+    return result.one_or_none()
+
+
+def user_notes_version_stmt(user_id: int) -> Select:
+    # aggregated, so there is a row (of nulls) for users without notes too
+    return select(
+        func.max(NotesVersion.changed_at).label("version_changed_at"),
+        func.max(NotesVersion.version).label("version_number"),
+    ).where(NotesVersion.user_id == user_id)
+
+
+async def get_user_notes_version(session: AsyncSession, user_id: int) -> tuple:
+    """Returns (changed_at, version) of user notes, see bump_notes_version.
+    It's a lookup of one row, however many notes the user has"""
+    result: Result = await session.execute(user_notes_version_stmt(user_id))
+    return tuple(result.one())
+
+
+async def bump_notes_version(session: AsyncSession, user_ids: list[int]) -> None:
+    """Bumps version of all notes of users, without commit. Every note write and
+    summarization status change calls it, in the transaction of the change"""
+    stmt = insert(NotesVersion).values(
+        [
+            {"user_id": user_id, "version": 1, "changed_at": func.clock_timestamp()}
+            for user_id in sorted(set(user_ids))
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[NotesVersion.user_id],
+        set_={
+            "version": NotesVersion.version + 1,
+            "changed_at": stmt.excluded.changed_at,
+        },
+    )
+    await session.execute(stmt)
+
+
+async def search_user_notes(
+    session: AsyncSession,
+    user_id: int,
+    query: str,
+    limit: int,
+    after: tuple[float, int] | None = None,
+) -> list[Row]:
+    """Returns (id, title, updated_at, rank, snippet) of matching notes, best first.
+
+    `query` is in web search syntax ("quoted phrase", or, -excluded),
+    `after` is (rank, id) of the last seen match. Only the first
+    SEARCH_TEXT_LENGTH characters of text are searched. Snippets are built only
+    for the returned page.
+    """
+    ts_query = func.websearch_to_tsquery(cast(SEARCH_CONFIG, REGCONFIG), query)
+    rank = func.ts_rank_cd(note_search_vector, ts_query)
+    matches = (
+        select(Note.id, rank.label("rank"))
+        .where(Note.user_id == user_id, note_search_vector.bool_op("@@")(ts_query))
+        .order_by(rank.desc(), Note.id.desc())
+        .limit(limit)
+    )
+    if after is not None:
+        matches = matches.where(tuple_(rank, Note.id) < after)
+    matches = matches.subquery()
+    snippet = func.ts_headline(
+        cast(SEARCH_CONFIG, REGCONFIG),
+        func.left(Note.text, SEARCH_TEXT_LENGTH),
+        ts_query,
+        SNIPPET_OPTIONS,
+    )
+    stmt = (
+        select(
+            Note.id,
+            Note.title,
+            Note.updated_at,
+            matches.c.rank,
+            snippet.label("snippet"),
+        )
+        .join(matches, Note.id == matches.c.id)
+        .order_by(matches.c.rank.desc(), Note.id.desc())
+    )
+    result: Result = await session.execute(stmt)
+    return list(result.all())
+
+
+async def enqueue_summarization_job(session: AsyncSession, note_id: int) -> None:
+    """Adds (or restarts) summarization job of note, without commit"""
+    await enqueue_summarization_jobs(session, [note_id])
+
+
+async def enqueue_summarization_jobs(
+    session: AsyncSession, note_ids: list[int]
+) -> None:
+    """Adds (or restarts) summarization jobs of notes with one statement"""
+    stmt = insert(SummarizationJob).values(
+        [{"note_id": note_id} for note_id in note_ids]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SummarizationJob.note_id],
+        set_={
+            "status": JobStatus.PENDING,
+            "attempts": 0,
+            "revision": SummarizationJob.revision + 1,
+            "run_after": func.now(),
+            "last_error": None,
+        },
+    )
+    await session.execute(stmt)
+
+
+def summarization_values(summarization: str | None) -> dict:
+    """Note columns for a new summarization, None - deferred to the worker"""
+    if summarization is None:
+        return {"summarization_status": SummarizationStatus.PENDING}
+    return {
+        "summarization": summarization,
+        "summarization_status": SummarizationStatus.DONE,
+    }
+
+
 async def create_note(
-    session: AsyncSession, note_in: CreateNoteSchema, user_id: int, summarization: str
+    session: AsyncSession,
+    note_in: CreateNoteSchema,
+    user_id: int,
+    summarization: str | None,
 ) -> Note:
+    """Creates note, if summarization is None it is deferred to the worker"""
     note_dict = note_in.model_dump(exclude_none=True)
     note_dict["user_id"] = user_id
     note_dict["summarization"] = summarization
+    note_dict.update(summarization_values(summarization))
+    note_words = count_note_words(note_in.title, note_in.text)
+    note_dict["word_count"] = note_words.total()
     note = Note(**note_dict)
     session.add(note)
+    await session.flush()
+    await apply_word_count_delta(
+        session, note_words, {note.id: (1, note_words.total())}
+    )
+    if summarization is None:
+        await enqueue_summarization_job(session, note.id)
+    await bump_notes_version(session, [user_id])
     await session.commit()
     return note
 
 
-async def get_note_history(session: AsyncSession, note_id: int) -> list[NoteHistory]:
+async def get_note_history(
+    session: AsyncSession, note_id: int
+) -> list[NoteHistorySchema]:
+    """Returns all revisions of note newest first, rebuilt from stored deltas.
+    Note text is read by the same statement as the rows, so the newest delta
+    is never newer than the text it's applied to"""
+    note_text = select(Note.text).where(Note.id == note_id).scalar_subquery()
+    stmt = note_history_rows_stmt(note_id).add_columns(note_text.label("note_text"))
+    rows = list((await session.execute(stmt)).all())
+    if not rows:
+        return []
+    return rebuild_history(rows[0].note_text, rows)
+
+
+def note_history_rows_stmt(
+    note_id: int,
+    limit: int | None = None,
+    after: tuple[datetime, int] | None = None,
+    with_text: bool = True,
+) -> Select:
+    """Select of history rows newest first, `after` is (created_at, id) of the last
+    seen row. Stored text columns are selected only `with_text`"""
+    columns = [
+        NoteHistory.id,
+        NoteHistory.note_id,
+        NoteHistory.title,
+        NoteHistory.created_at,
+    ]
+    if with_text:
+        columns += [NoteHistory.text, NoteHistory.text_delta]
     stmt = (
-        select(NoteHistory)
+        select(*columns)
         .where(NoteHistory.note_id == note_id)
-        .order_by(NoteHistory.created_at.desc())
+        .order_by(NoteHistory.created_at.desc(), NoteHistory.id.desc())
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(NoteHistory.created_at, NoteHistory.id) < after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+async def get_note_history_rows(
+    session: AsyncSession,
+    note_id: int,
+    limit: int | None = None,
+    after: tuple[datetime, int] | None = None,
+    with_text: bool = True,
+) -> list[Row]:
+    """Returns rows of note_history_rows_stmt"""
+    result: Result = await session.execute(
+        note_history_rows_stmt(note_id, limit, after, with_text)
+    )
+    return list(result.all())
+
+
+async def get_newer_history_rows(
+    session: AsyncSession, note_id: int, before: tuple[datetime, int]
+) -> list[Row]:
+    """Returns (text, text_delta) of history rows from (created_at, id) `before`
+    and newer, nearest first, up to the first snapshot. These are needed to
+    rebuild revisions older than `before`"""
+    stmt = (
+        select(NoteHistory.text, NoteHistory.text_delta)
+        .where(
+            NoteHistory.note_id == note_id,
+            tuple_(NoteHistory.created_at, NoteHistory.id) >= before,
+        )
+        .order_by(NoteHistory.created_at, NoteHistory.id)
+    )
+    # a delta run is shorter than the interval, unless rows were written
+    # with a bigger one, then all newer rows are read
+    limit = settings.history.snapshot_interval
+    rows = list((await session.execute(stmt.limit(limit))).all())
+    if len(rows) == limit and all(row.text is None for row in rows):
+        rows = list((await session.execute(stmt)).all())
+    for position, row in enumerate(rows):
+        if row.text is not None:
+            return rows[: position + 1]
+    return rows
+
+
+async def get_history_delta_runs(
+    session: AsyncSession, note_ids: list[int]
+) -> dict[int, int]:
+    """Returns number of the newest history rows stored as deltas in a row,
+    counted up to the snapshot interval, notes without them are omitted"""
+    position = func.row_number().over(
+        partition_by=NoteHistory.note_id,
+        order_by=(NoteHistory.created_at.desc(), NoteHistory.id.desc()),
+    )
+    recent = (
+        select(
+            NoteHistory.note_id,
+            NoteHistory.text.is_(None).label("is_delta"),
+            position.label("position"),
+        )
+        .where(NoteHistory.note_id.in_(note_ids))
+        .subquery()
+    )
+    first_snapshot = func.min(recent.c.position).filter(~recent.c.is_delta)
+    stmt = (
+        select(
+            recent.c.note_id,
+            func.coalesce(first_snapshot - 1, func.count()).label("run"),
+        )
+        .where(recent.c.position < settings.history.snapshot_interval)
+        .group_by(recent.c.note_id)
     )
     result: Result = await session.execute(stmt)
-    note_history = result.scalars().all()
-    return list(note_history)
+    return {row.note_id: row.run for row in result}
 
 
 async def update_note_and_create_history(
@@ -48,22 +418,52 @@ async def update_note_and_create_history(
     note: Note,
     note_in: UpdateNoteSchema,
     old_note: NoteSchema,
-    summarization: str,
+    summarization: str | None,
 ) -> Note:
-    now = datetime.now(UTC)
+    """Updates note, if summarization is None it is deferred to the worker
+    and the previous summarization is kept until the new one is ready"""
     update_data = note_in.model_dump(exclude_unset=True)
-    await session.execute(
+    update_data.update(summarization_values(summarization))
+    # re-read under row lock, so concurrent updates apply word deltas one by one
+    current = (
+        await session.execute(
+            select(Note.title, Note.text)
+            .where(Note.id == old_note.id)
+            .with_for_update()
+        )
+    ).one()
+    old_words = count_note_words(current.title, current.text)
+    new_words = count_note_words(
+        update_data.get("title", current.title),
+        update_data.get("text", current.text),
+    )
+    update_data["word_count"] = new_words.total()
+    delta_runs = await get_history_delta_runs(session, [old_note.id])
+    new_words.subtract(old_words)
+    await apply_word_count_delta(
+        session, new_words, {old_note.id: (0, new_words.total())}
+    )
+    # history is ordered by created_at, so it's taken by the database after
+    # the row lock, a timestamp taken before could be older than the previous one
+    now = await session.scalar(
         update(Note)
         .where(Note.id == old_note.id)
-        .values(**update_data, updated_at=now, summarization=summarization)
+        .values(**update_data, updated_at=func.clock_timestamp())
+        .returning(Note.updated_at)
     )
+    if summarization is None:
+        await enqueue_summarization_job(session, old_note.id)
+    await bump_notes_version(session, [old_note.user_id])
     note_history = NoteHistory(
         created_at=now,
-        title=old_note.title,
-        text=old_note.text,
+        title=current.title,
         note_id=old_note.id,
+        **history_values(
+            current.text,
+            update_data.get("text", current.text),
+            delta_runs.get(old_note.id, 0),
+        ),
     )
-    note.updated_at = now
     session.add(note_history)
     await session.commit()
     await session.refresh(note)
@@ -72,21 +472,144 @@ async def update_note_and_create_history(
 
 
 async def delete_note(session: AsyncSession, note_id: int, user_id: int) -> bool:
-    stmt = select(Note).where(Note.id == note_id, Note.user_id == user_id)
+    stmt = (
+        select(Note)
+        .where(Note.id == note_id, Note.user_id == user_id)
+        .with_for_update()
+    )
     note = await session.scalar(stmt)
     if note:
+        note_words = Counter()
+        note_words.subtract(count_note_words(note.title, note.text))
+        await apply_word_count_delta(
+            session, note_words, {note_id: (-1, note_words.total())}
+        )
         await session.delete(note)
+        await bump_notes_version(session, [user_id])
         await session.commit()
         return True
     return False
 
 
-async def get_note_with_history(
-    session: AsyncSession, note_id: int, user_id: int
-) -> Note | None:
-    stmt = (
-        select(Note)
-        .where(Note.id == note_id, Note.user_id == user_id)
-        .options(selectinload(Note.note_history))
-    )
-    return await session.scalar(stmt)
+async def apply_notes_batch(
+    session: AsyncSession,
+    user_id: int,
+    creates: list[tuple[CreateNoteSchema, str | None]],
+    updates: list[tuple[BatchUpdateNoteSchema, str | None]],
+    deletes: list[int],
+) -> tuple[list[Note], list[Note], set[int]]:
+    """Applies creates, updates and deletes of user notes in one transaction.
+
+    Every kind is written with a single multi-row statement. Notes that are
+    missing (or of another user) are skipped. Returns created notes, updated
+    notes and ids of deleted notes.
+    """
+    word_delta: Counter = Counter()
+    # (notes, words) delta of every written note by its id
+    note_deltas: dict[int, tuple[int, int]] = {}
+    # lock in id order, so concurrent batches can't deadlock each other
+    targets = {
+        row.id: row
+        for row in await session.execute(
+            select(Note.id, Note.title, Note.text)
+            .where(
+                Note.id.in_([note.id for note, _ in updates] + deletes),
+                Note.user_id == user_id,
+            )
+            .order_by(Note.id)
+            .with_for_update()
+        )
+    }
+
+    created = []
+    if creates:
+        rows = []
+        for note_in, summarization in creates:
+            note_words = count_note_words(note_in.title, note_in.text)
+            word_delta.update(note_words)
+            rows.append(
+                {
+                    "user_id": user_id,
+                    "title": note_in.title,
+                    "text": note_in.text,
+                    "summarization": None,
+                    "word_count": note_words.total(),
+                    **summarization_values(summarization),
+                }
+            )
+        created = list(
+            await session.scalars(
+                insert(Note).returning(Note, sort_by_parameter_order=True), rows
+            )
+        )
+        for note in created:
+            note_deltas[note.id] = (1, note.word_count)
+
+    updated_ids = [note_in.id for note_in, _ in updates if note_in.id in targets]
+    if updated_ids:
+        # taken after the row locks, see update_note_and_create_history
+        now = await session.scalar(select(func.clock_timestamp()))
+        delta_runs = await get_history_delta_runs(session, updated_ids)
+        rows, history = [], []
+        for note_in, summarization in updates:
+            old = targets.get(note_in.id)
+            if old is None:
+                continue
+            # merged with the locked row, so fields that aren't given keep values
+            title = old.title if note_in.title is None else note_in.title
+            text = old.text if note_in.text is None else note_in.text
+            new_words = count_note_words(title, text)
+            rows.append(
+                {
+                    "id": note_in.id,
+                    "title": title,
+                    "text": text,
+                    "word_count": new_words.total(),
+                    "updated_at": now,
+                    **summarization_values(summarization),
+                }
+            )
+            new_words.subtract(count_note_words(old.title, old.text))
+            word_delta.update(new_words)
+            note_deltas[old.id] = (0, new_words.total())
+            history.append(
+                {
+                    "note_id": old.id,
+                    "title": old.title,
+                    "created_at": now,
+                    **history_values(old.text, text, delta_runs.get(old.id, 0)),
+                }
+            )
+        await session.execute(update(Note), rows)
+        await session.execute(insert(NoteHistory), history)
+
+    deleted_ids = {note_id for note_id in deletes if note_id in targets}
+    if deleted_ids:
+        for note_id in deleted_ids:
+            note_words = count_note_words(targets[note_id].title, targets[note_id].text)
+            word_delta.subtract(note_words)
+            note_deltas[note_id] = (-1, -note_words.total())
+        await session.execute(delete(Note).where(Note.id.in_(deleted_ids)))
+
+    await apply_word_count_delta(session, word_delta, note_deltas)
+    deferred_ids = [note.id for note in created if note.summarization is None] + [
+        note_in.id
+        for note_in, summarization in updates
+        if summarization is None and note_in.id in targets
+    ]
+    if deferred_ids:
+        await enqueue_summarization_jobs(session, deferred_ids)
+    if created or updated_ids or deleted_ids:
+        await bump_notes_version(session, [user_id])
+    await session.commit()
+
+    updated = []
+    if updated_ids:
+        updated = list(
+            await session.scalars(
+                select(Note)
+                .where(Note.id.in_(updated_ids))
+                .execution_options(populate_existing=True)
+            )
+        )
+    return created, updated, deleted_ids
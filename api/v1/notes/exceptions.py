@@ -19,3 +19,39 @@ invalid_upd_found_exc = HTTPException(
         reason="Update input is empty or same as original data",
     )["detail"],
 )
+
+summarization_timeout_exc = HTTPException(
+    status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+    detail=validation_error(
+        loc=["body", "title", "text"],
+        msg="Summarization timed out",
+        reason="AI service did not respond in time, try again later",
+    )["detail"],
+)
+
+invalid_cursor_exc = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail=validation_error(
+        loc=["query", "cursor"],
+        msg="Invalid cursor",
+        reason="Cursor is malformed, use next_cursor of the previous page",
+    )["detail"],
+)
+
+duplicate_batch_note_exc = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail=validation_error(
+        loc=["body", "operations", "id"],
+        msg="Duplicate note in batch",
+        reason="Every note can be updated or deleted only once per batch",
+    )["detail"],
+)
+
+invalid_fields_exc = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail=validation_error(
+        loc=["query", "fields"],
+        msg="Invalid fields",
+        reason="Fields must be comma separated names of note fields",
+    )["detail"],
+)
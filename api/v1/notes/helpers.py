@@ -1,98 +1,493 @@
-from fastapi import Depends
-from google import genai
-from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+from collections import Counter
+from datetime import datetime
 
-from api.v1.auth.helpers import get_current_user_by_access_token
+from fastapi import Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from api.serialization import encode_rows, row_encoder
+from api.utils import (
+    check_not_modified,
+    decode_cursor,
+    encode_cursor,
+    validator_headers,
+    weak_etag,
+)
+from api.v1.auth.exceptions import user_not_found_exc
+from api.v1.auth.helpers import (
+    get_current_principal_by_access_token,
+    get_read_principal_by_access_token,
+    get_read_session_with_jwt,
+    remember_write,
+)
+from api.v1.auth.schemas import Principal
 from api.v1.notes.controllers import (
+    apply_notes_batch,
     create_note,
     delete_note,
+    get_newer_history_rows,
     get_note,
-    get_note_with_history,
-    get_user_notes,
+    get_note_history_rows,
+    get_note_version,
+    get_user_notes_by_ids,
+    get_user_notes_page,
+    get_user_notes_version,
+    search_user_notes,
     update_note_and_create_history,
 )
-from api.v1.notes.exceptions import invalid_upd_found_exc, note_not_found_exc
-from api.v1.notes.schemas import CreateNoteSchema, NoteSchema, UpdateNoteSchema
+from api.v1.notes.exceptions import (
+    duplicate_batch_note_exc,
+    invalid_cursor_exc,
+    invalid_fields_exc,
+    invalid_upd_found_exc,
+    note_not_found_exc,
+    summarization_timeout_exc,
+)
+from api.v1.notes.history import rebuild_history
+from api.v1.notes.schemas import (
+    BatchItemResultSchema,
+    CreateNoteSchema,
+    NoteHistoryMetadataSchema,
+    NotesBatchSchema,
+    NoteSchema,
+    UpdateNoteSchema,
+)
+from api.v1.notes.summarization import summarize_note
 from core.config import settings
-from core.database import Note, User
+from core.database import Note
 from core.database.db_helper import db_helper
 
-ai_client = genai.Client(api_key=settings.ai.api_key)
-
 
-async def create_note_summarization(title: str, text: str):
-    response = ai_client.models.generate_content(
-        model=settings.ai.default_model,
-        contents=f"{settings.ai.summarization_prompt} Title: {title} Text: {text}",
-    )
-    return response.text.strip()
+async def create_note_summarization(
+    title: str,
+    text: str,
+    session_factory: async_sessionmaker[AsyncSession],
+    user_id: int,
+) -> str | None:
+    """Returns None in deferred mode, so note is summarized by worker.py"""
+    if settings.ai.summarization_mode == "deferred":
+        return None
+    try:
+        return await summarize_note(title, text, session_factory, user_id)
+    except TimeoutError:
+        raise summarization_timeout_exc
 
 
 async def create_note_with_jwt(
     note_in: CreateNoteSchema,
-    user: User = Depends(get_current_user_by_access_token),
+    response: Response,
+    user: Principal = Depends(get_current_principal_by_access_token),
     session: AsyncSession = Depends(db_helper.session_getter),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        db_helper.factory_getter
+    ),
 ) -> Note:
-    summarization = await create_note_summarization(note_in.title, note_in.text)
-    note = await create_note(session, note_in, user.id, summarization)
+    summarization = await create_note_summarization(
+        note_in.title, note_in.text, session_factory, user.id
+    )
+    try:
+        note = await create_note(session, note_in, user.id, summarization)
+    except IntegrityError:
+        # principal built from token claims may belong to a deleted user
+        raise user_not_found_exc
+    await remember_write(response, session, user.id)
     return note
 
 
-async def get_all_users_notes_with_jwt(
-    user: User = Depends(get_current_user_by_access_token),
+async def apply_notes_batch_with_jwt(
+    batch: NotesBatchSchema,
+    response: Response,
+    user: Principal = Depends(get_current_principal_by_access_token),
     session: AsyncSession = Depends(db_helper.session_getter),
-) -> list[Note]:
-    notes = await get_user_notes(session, user.id)
-    return notes
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        db_helper.factory_getter
+    ),
+) -> list[BatchItemResultSchema]:
+    """Applies batch in one transaction, invalid operations get an error result
+    instead of failing the whole batch.
+
+    Summarizations run concurrently, at most `settings.batch.summarization_concurrency`
+    at a time, before notes are locked.
+    """
+    operations = list(enumerate(batch.operations))
+    errors: dict[int, HTTPException] = {}
+    id_counts = Counter(op.id for _, op in operations if op.op != "create")
+    for index, op in operations:
+        if op.op != "create" and id_counts[op.id] > 1:
+            errors[index] = duplicate_batch_note_exc
+
+    update_ids = [op.id for _, op in operations if op.op == "update"]
+    current = {
+        note.id: note
+        for note in await get_user_notes_by_ids(session, user.id, update_ids)
+    }
+    # don't keep the connection idle in transaction while summarizing
+    await session.commit()
+    # (title, text) notes will have, partial updates keep the current values
+    merged: dict[int, tuple[str, str]] = {}
+    for index, op in operations:
+        if op.op == "create":
+            merged[index] = (op.title, op.text)
+        if index in errors or op.op != "update":
+            continue
+        if op.id not in current:
+            errors[index] = note_not_found_exc
+            continue
+        note = current[op.id]
+        merged[index] = (
+            note.title if op.title is None else op.title,
+            note.text if op.text is None else op.text,
+        )
+        if not merged[index][1] or merged[index] == (note.title, note.text):
+            errors[index] = invalid_upd_found_exc
+
+    semaphore = asyncio.Semaphore(settings.batch.summarization_concurrency)
+
+    async def summarize(title: str, text: str) -> str | None:
+        async with semaphore:
+            return await create_note_summarization(
+                title, text, session_factory, user.id
+            )
+
+    to_summarize = [
+        (index, op)
+        for index, op in operations
+        if op.op != "delete" and index not in errors
+    ]
+    summarizations = await asyncio.gather(
+        *(summarize(*merged[index]) for index, _ in to_summarize),
+        return_exceptions=True,
+    )
+    summarized = {}
+    for (index, _), summarization in zip(to_summarize, summarizations):
+        if isinstance(summarization, HTTPException):
+            errors[index] = summarization
+        elif isinstance(summarization, BaseException):
+            raise summarization
+        else:
+            summarized[index] = summarization
+
+    creates = [(index, op) for index, op in to_summarize if op.op == "create"]
+    updates = [(index, op) for index, op in to_summarize if op.op == "update"]
+    deletes = [
+        (index, op)
+        for index, op in operations
+        if op.op == "delete" and index not in errors
+    ]
+    try:
+        created, updated, deleted_ids = await apply_notes_batch(
+            session,
+            user.id,
+            [(op, summarized[index]) for index, op in creates if index in summarized],
+            [(op, summarized[index]) for index, op in updates if index in summarized],
+            [op.id for _, op in deletes],
+        )
+    except IntegrityError:
+        raise user_not_found_exc
+    await remember_write(response, session, user.id)
+
+    results = {
+        index: BatchItemResultSchema(
+            index=index, status=error.status_code, detail=error.detail
+        )
+        for index, error in errors.items()
+    }
+    created_indexes = [index for index, _ in creates if index in summarized]
+    for index, note in zip(created_indexes, created):
+        results[index] = BatchItemResultSchema(
+            index=index,
+            status=status.HTTP_201_CREATED,
+            note=NoteSchema.model_validate(note, from_attributes=True),
+        )
+    updated_by_id = {note.id: note for note in updated}
+    for index, op in updates + deletes:
+        if index in results:
+            continue
+        if op.op == "update" and op.id in updated_by_id:
+            note = NoteSchema.model_validate(updated_by_id[op.id], from_attributes=True)
+            results[index] = BatchItemResultSchema(
+                index=index, status=status.HTTP_200_OK, note=note
+            )
+        elif op.op == "delete" and op.id in deleted_ids:
+            results[index] = BatchItemResultSchema(
+                index=index, status=status.HTTP_204_NO_CONTENT
+            )
+        else:
+            # deleted by a concurrent request after validation
+            results[index] = BatchItemResultSchema(
+                index=index,
+                status=note_not_found_exc.status_code,
+                detail=note_not_found_exc.detail,
+            )
+    return [results[index] for index, _ in operations]
+
+
+def note_fields(
+    fields: str | None = Query(
+        default=None,
+        description="Comma separated note fields to return, all by default",
+    ),
+) -> tuple[str, ...] | None:
+    """Returns requested fields in NoteSchema order, None if all are requested"""
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",")} - {""}
+    if not requested or requested - NoteSchema.model_fields.keys():
+        raise invalid_fields_exc
+    return tuple(name for name in NoteSchema.model_fields if name in requested)
+
+
+def with_columns(
+    fields: tuple[str, ...] | None, *columns: str
+) -> tuple[str, ...] | None:
+    """Adds columns needed by the endpoint itself (cursors, validators)"""
+    if fields is None:
+        return None
+    return tuple(dict.fromkeys(fields + columns))
+
+
+def decode_notes_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    if cursor is None:
+        return None
+    try:
+        updated_at, note_id = decode_cursor(cursor)
+        return datetime.fromisoformat(updated_at), int(note_id)
+    except (ValueError, TypeError):
+        raise invalid_cursor_exc
+
+
+def notes_page_etag(request: Request, user_id: int, version: tuple) -> str:
+    # query is a part of it, since every page and set of fields differs
+    return weak_etag(user_id, request.url.query, *version)
+
+
+async def get_all_users_notes_with_jwt(
+    request: Request,
+    response: Response,
+    limit: int = Query(
+        default=settings.pagination.default_limit,
+        ge=1,
+        le=settings.pagination.max_limit,
+    ),
+    cursor: str | None = None,
+    fields: tuple[str, ...] | None = Depends(note_fields),
+    user: Principal = Depends(get_read_principal_by_access_token),
+    session: AsyncSession = Depends(get_read_session_with_jwt),
+) -> tuple[list[Note] | list[Row], str | None]:
+    """Returns page of notes and cursor of the next page (None for the last page),
+    notes are rows of requested `fields` only if they are given.
+
+    Validators are set from the version of user notes read with the page.
+    """
+    after = decode_notes_cursor(cursor)
+    columns = with_columns(fields, "updated_at", "id")
+    version, notes = await get_user_notes_page(
+        session, user.id, limit + 1, after, columns
+    )
+    etag = notes_page_etag(request, user.id, version)
+    response.headers.update(validator_headers(etag, version[0]))
+    next_cursor = None
+    if len(notes) > limit:
+        notes = notes[:limit]
+        next_cursor = encode_cursor(notes[-1].updated_at, notes[-1].id)
+    return notes, next_cursor
+
+
+def decode_search_cursor(cursor: str | None) -> tuple[float, int] | None:
+    if cursor is None:
+        return None
+    try:
+        rank, note_id = decode_cursor(cursor)
+        return float(rank), int(note_id)
+    except (ValueError, TypeError):
+        raise invalid_cursor_exc
+
+
+async def search_users_notes_with_jwt(
+    q: str = Query(min_length=1, max_length=256),
+    limit: int = Query(
+        default=settings.pagination.default_limit,
+        ge=1,
+        le=settings.pagination.max_limit,
+    ),
+    cursor: str | None = None,
+    user: Principal = Depends(get_read_principal_by_access_token),
+    session: AsyncSession = Depends(get_read_session_with_jwt),
+) -> tuple[list[Row], str | None]:
+    """Returns page of matches and cursor of the next page (None for the last page)"""
+    after = decode_search_cursor(cursor)
+    matches = await search_user_notes(session, user.id, q, limit + 1, after)
+    next_cursor = None
+    if len(matches) > limit:
+        matches = matches[:limit]
+        next_cursor = encode_cursor(matches[-1].rank, matches[-1].id)
+    return matches, next_cursor
+
+
+async def check_users_notes_not_modified_with_jwt(
+    request: Request,
+    response: Response,
+    user: Principal = Depends(get_read_principal_by_access_token),
+    session: AsyncSession = Depends(get_read_session_with_jwt),
+) -> None:
+    """Answers 304 before the page is loaded if client has its current version.
+
+    Only conditional requests pay for the extra query, validators of 200
+    responses are set from the version read with the page.
+    """
+    if not request.headers.get("If-None-Match"):
+        return
+    version = await get_user_notes_version(session, user.id)
+    etag = notes_page_etag(request, user.id, version)
+    check_not_modified(request, response, etag, version[0])
+
+
+def note_etag(request: Request, updated_at: datetime, summarization_status: str) -> str:
+    # worker changes only summarization_status when deferred summarization is done,
+    # query is a part of it, since pages of history differ
+    return weak_etag(
+        request.url.path, request.url.query, updated_at, summarization_status
+    )
+
+
+async def check_users_note_not_modified_with_jwt(
+    note_id: int,
+    request: Request,
+    response: Response,
+    user: Principal = Depends(get_read_principal_by_access_token),
+    session: AsyncSession = Depends(get_read_session_with_jwt),
+) -> None:
+    """Answers 304 before the note is loaded if client has its current version.
+
+    Only conditional requests pay for the extra query, validators of 200
+    responses are set from the loaded note. Missing note is left for
+    the loading dependency to answer 404.
+    """
+    if not request.headers.get("If-None-Match"):
+        return
+    version = await get_note_version(session, note_id, user.id)
+    if version is None:
+        return
+    etag = note_etag(request, version.updated_at, version.summarization_status)
+    check_not_modified(request, response, etag, version.updated_at)
 
 
 async def get_single_users_note_with_jwt(
     note_id: int,
-    user: User = Depends(get_current_user_by_access_token),
-    session: AsyncSession = Depends(db_helper.session_getter),
-) -> Note:
-    note = await get_note(session, note_id, user.id)
+    request: Request,
+    response: Response,
+    fields: tuple[str, ...] | None = Depends(note_fields),
+    user: Principal = Depends(get_read_principal_by_access_token),
+    session: AsyncSession = Depends(get_read_session_with_jwt),
+) -> Note | Row:
+    """Returns note, or a row of requested `fields` only if they are given"""
+    columns = with_columns(fields, "updated_at", "summarization_status")
+    note = await get_note(session, note_id, user.id, columns)
     if not note:
         raise note_not_found_exc
+    etag = note_etag(request, note.updated_at, note.summarization_status)
+    response.headers.update(validator_headers(etag, note.updated_at))
     return note
 
 
 async def delete_users_note_with_jwt(
     note_id: int,
-    user: User = Depends(get_current_user_by_access_token),
+    response: Response,
+    user: Principal = Depends(get_current_principal_by_access_token),
     session: AsyncSession = Depends(db_helper.session_getter),
 ) -> bool:
     status = await delete_note(session, note_id, user.id)
+    if status:
+        await remember_write(response, session, user.id)
     return status
 
 
 async def update_users_note_with_jwt(
     note_id: int,
     note_in: UpdateNoteSchema,
-    user: User = Depends(get_current_user_by_access_token),
+    response: Response,
+    user: Principal = Depends(get_current_principal_by_access_token),
     session: AsyncSession = Depends(db_helper.session_getter),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        db_helper.factory_getter
+    ),
 ) -> Note:
     note = await get_note(session, note_id, user.id)
     if not note:
         raise note_not_found_exc
     old_note = NoteSchema.model_validate(note, from_attributes=True)
-    if not (note_in.title and note_in.text):
+    # fields that aren't given keep their values, same as in a batch update,
+    # but a note can't be left without text
+    note_in = UpdateNoteSchema(
+        title=old_note.title if note_in.title is None else note_in.title,
+        text=old_note.text if note_in.text is None else note_in.text,
+    )
+    if not note_in.text:
         raise invalid_upd_found_exc
     if note_in.title == old_note.title and note_in.text == old_note.text:
         raise invalid_upd_found_exc
-    summarization = await create_note_summarization(note_in.title, note_in.text)
+    summarization = await create_note_summarization(
+        note_in.title, note_in.text, session_factory, user.id
+    )
     note = await update_note_and_create_history(
         session, note, note_in, old_note, summarization
     )
+    await remember_write(response, session, user.id)
     return note
 
 
 async def get_users_note_history_with_jwt(
     note_id: int,
-    user: User = Depends(get_current_user_by_access_token),
-    session: AsyncSession = Depends(db_helper.session_getter),
-) -> Note:
-    note_with_history = await get_note_with_history(session, note_id, user.id)
-    if not note_with_history:
+    request: Request,
+    response: Response,
+    limit: int = Query(
+        default=settings.pagination.default_limit,
+        ge=1,
+        le=settings.pagination.max_limit,
+    ),
+    cursor: str | None = None,
+    metadata_only: bool = False,
+    user: Principal = Depends(get_read_principal_by_access_token),
+    session: AsyncSession = Depends(get_read_session_with_jwt),
+) -> dict:
+    """Returns NoteSchemaWithHistory (or, with `metadata_only`,
+    NoteSchemaWithHistoryMetadata) fields of note with a page of its revisions
+    newest first.
+
+    With `metadata_only` revisions come without text, so neither stored texts
+    nor deltas are read. Otherwise texts are rebuilt from the note text,
+    or, for later pages, from revisions newer than the page up to a snapshot.
+    All of them are read in one REPEATABLE READ transaction.
+    """
+    after = decode_notes_cursor(cursor)
+    # one snapshot for the note and its history, a revision committed between
+    # the reads would be a delta against a text that wasn't read. The conditional
+    # check may have read the version in a transaction of its own
+    await session.rollback()
+    await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    note = await get_note(session, note_id, user.id)
+    if not note:
         raise note_not_found_exc
-    return note_with_history
+    etag = note_etag(request, note.updated_at, note.summarization_status)
+    response.headers.update(validator_headers(etag, note.updated_at))
+    rows = await get_note_history_rows(
+        session, note_id, limit + 1, after, with_text=not metadata_only
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    if metadata_only:
+        note_history = encode_rows(NoteHistoryMetadataSchema, rows)
+    else:
+        newer_rows = None
+        if after is not None and rows and rows[0].text is None:
+            newer_rows = await get_newer_history_rows(session, note_id, after)
+        note_history = rebuild_history(note.text, rows, newer_rows)
+    return {
+        **row_encoder(NoteSchema)(note),
+        "note_history": note_history,
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,55 @@
+from collections.abc import Iterable
+
+from sqlalchemy import Row
+
+from api.v1.notes.schemas import NoteHistorySchema
+from core.config import settings
+from core.database import NoteHistory
+from core.utils.text_delta import apply_delta, make_delta
+
+
+def history_values(text: str, newer_text: str, delta_run: int) -> dict:
+    """Returns text columns of a history row storing `text` of a revision.
+
+    Revision is stored as a delta against `newer_text` (text of the next newer
+    revision or of the note), unless the newest `delta_run` rows already are
+    deltas up to the snapshot interval or the delta isn't smaller than the text.
+    """
+    if delta_run < settings.history.snapshot_interval - 1:
+        delta = make_delta(newer_text, text)
+        if len(delta) < len(text.encode()):
+            return {"text": None, "text_delta": delta}
+    return {"text": text, "text_delta": None}
+
+
+def history_texts(text: str, rows: Iterable[NoteHistory | Row]) -> list[str]:
+    """Returns texts of history rows ordered newest first, `text` is note text"""
+    texts = []
+    for row in rows:
+        text = row.text if row.text is not None else apply_delta(text, row.text_delta)
+        texts.append(text)
+    return texts
+
+
+def rebuild_history(
+    text: str,
+    rows: list[NoteHistory | Row],
+    newer_rows: list[Row] | None = None,
+) -> list[NoteHistorySchema]:
+    """Returns revisions of history rows ordered newest first.
+
+    `text` is note text, `newer_rows` are rows newer than the first of `rows`
+    nearest first, up to a snapshot, when `rows` is not the first page.
+    """
+    newer_rows = list(reversed(newer_rows or []))
+    texts = history_texts(text, newer_rows + rows)[len(newer_rows) :]
+    return [
+        NoteHistorySchema(
+            id=row.id,
+            title=row.title,
+            text=revision_text,
+            created_at=row.created_at,
+            note_id=row.note_id,
+        )
+        for row, revision_text in zip(rows, texts)
+    ]
@@ -1,7 +1,11 @@
 from datetime import datetime
+from typing import Annotated, Literal
 
 from pydantic import BaseModel, Field
 
+from core.config import settings
+from core.database import SummarizationStatus
+
 
 class CreateNoteSchema(BaseModel):
     title: str = Field(min_length=3, max_length=150)
@@ -17,15 +21,89 @@ class NoteSchema(CreateNoteSchema):
     id: int
     created_at: datetime
     updated_at: datetime
-    summarization: str
+    summarization: str | None = None
+    summarization_status: SummarizationStatus = SummarizationStatus.DONE
     user_id: int
 
 
+class NotesPageSchema(BaseModel):
+    items: list[NoteSchema]
+    next_cursor: str | None = None
+
+
+class NoteSearchResultSchema(BaseModel):
+    id: int
+    title: str
+    updated_at: datetime
+    rank: float
+    snippet: str
+
+
+class NotesSearchPageSchema(BaseModel):
+    items: list[NoteSearchResultSchema]
+    next_cursor: str | None = None
+
+
 class NoteHistorySchema(CreateNoteSchema):
     id: int
     created_at: datetime
     note_id: int
 
 
+class NoteHistoryMetadataSchema(BaseModel):
+    id: int
+    title: str
+    created_at: datetime
+    note_id: int
+
+
 class NoteSchemaWithHistory(NoteSchema):
     note_history: list[NoteHistorySchema]
+    next_cursor: str | None = None
+
+
+class NoteSchemaWithHistoryMetadata(NoteSchema):
+    """History page with `metadata_only`, revisions come without text"""
+
+    note_history: list[NoteHistoryMetadataSchema]
+    next_cursor: str | None = None
+
+
+class BatchCreateNoteSchema(CreateNoteSchema):
+    op: Literal["create"]
+
+
+class BatchUpdateNoteSchema(UpdateNoteSchema):
+    """Same as PATCH body, fields that aren't given keep their values"""
+
+    op: Literal["update"]
+    id: int
+
+
+class BatchDeleteNoteSchema(BaseModel):
+    op: Literal["delete"]
+    id: int
+
+
+BatchNoteOperation = Annotated[
+    BatchCreateNoteSchema | BatchUpdateNoteSchema | BatchDeleteNoteSchema,
+    Field(discriminator="op"),
+]
+
+
+class NotesBatchSchema(BaseModel):
+    operations: list[BatchNoteOperation] = Field(
+        min_length=1, max_length=settings.batch.max_size
+    )
+
+
+class BatchItemResultSchema(BaseModel):
+    index: int
+    status: int
+    note: NoteSchema | None = None
+    # same as `detail` of the matching single-note endpoint error
+    detail: list[dict] | None = None
+
+
+class NotesBatchResultSchema(BaseModel):
+    items: list[BatchItemResultSchema]
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+from datetime import UTC, datetime, timedelta
+from typing import Hashable
+
+from google import genai
+from google.genai import types
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.config import settings
+from core.database import SummarizationCache
+from core.utils.cache import LRUCache
+
+ai_client = genai.Client(
+    api_key=settings.ai.api_key,
+    http_options=types.HttpOptions(timeout=int(settings.ai.request_timeout * 1000)),
+)
+
+summarization_semaphore = asyncio.Semaphore(settings.ai.max_concurrent_requests)
+
+# memory level counts its hits and misses itself, misses of the table go to AI
+summarization_cache: LRUCache[str, str] = LRUCache(settings.ai.cache_size)
+summarization_db_cache_stats = {"hits": 0, "misses": 0}
+
+
+async def generate_summarization(title: str, text: str) -> str:
+    """Summarizes note without blocking event loop, raises TimeoutError on timeout"""
+    contents = f"{settings.ai.summarization_prompt} Title: {title} Text: {text}"
+    async with summarization_semaphore:
+        async with asyncio.timeout(settings.ai.request_timeout):
+            response = await ai_client.aio.models.generate_content(
+                model=settings.ai.default_model, contents=contents
+            )
+    return response.text.strip()
+
+
+class BatchSummary(BaseModel):
+    index: int
+    summary: str
+
+
+batch_summaries_adapter = TypeAdapter(list[BatchSummary])
+
+
+async def generate_batch_summarization(notes: list[tuple[str, str]]) -> list[str]:
+    """Summarizes several notes with one structured-output call.
+
+    Raises ValueError if response does not contain exactly one summary per note.
+    """
+    notes_text = "\n".join(
+        f"Note {index}: Title: {title} Text: {text}"
+        for index, (title, text) in enumerate(notes)
+    )
+    contents = (
+        f"{settings.ai.summarization_prompt} Summarize each of the following notes "
+        f"separately and return summary of every note with its index.\n{notes_text}"
+    )
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json", response_schema=list[BatchSummary]
+    )
+    async with summarization_semaphore:
+        async with asyncio.timeout(settings.ai.request_timeout):
+            response = await ai_client.aio.models.generate_content(
+                model=settings.ai.default_model, contents=contents, config=config
+            )
+    try:
+        summaries = batch_summaries_adapter.validate_json(response.text or "")
+    except ValidationError as error:
+        raise ValueError("Unparsable batch summarization response") from error
+    by_index = {summary.index: summary.summary.strip() for summary in summaries}
+    if sorted(by_index) != list(range(len(notes))):
+        raise ValueError("Batch summarization response does not match notes")
+    return [by_index[index] for index in range(len(notes))]
+
+
+class SummarizationBatcher:
+    """Collects concurrent summarization requests of one owner for `window`
+    seconds (or until `max_size` requests) and sends them as a single AI call.
+
+    Notes of different owners never share a prompt, so text of one user
+    can't steer summary of another one.
+    """
+
+    def __init__(self, window: float, max_size: int):
+        self.window = window
+        self.max_size = max_size
+        self._pending: dict[Hashable, list[tuple[str, str, asyncio.Future]]] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def summarize(self, owner: Hashable, title: str, text: str) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(owner, [])
+        pending.append((title, text, future))
+        if len(pending) >= self.max_size:
+            self._flush(owner)
+        elif owner not in self._timers:
+            self._timers[owner] = loop.call_later(self.window, self._flush, owner)
+        return await future
+
+    def _flush(self, owner: Hashable) -> None:
+        timer = self._timers.pop(owner, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(owner, [])
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[str, str, asyncio.Future]]) -> None:
+        notes = [(title, text) for title, text, _ in batch]
+        futures = [future for _, _, future in batch]
+        results = None
+        if len(batch) > 1:
+            try:
+                results = await generate_batch_summarization(notes)
+            except ValueError:
+                results = None
+            except Exception as error:
+                results = [error] * len(batch)
+        if results is None:
+            # single request or unparsable batch - fall back to one call per note
+            results = await asyncio.gather(
+                *(generate_summarization(title, text) for title, text in notes),
+                return_exceptions=True,
+            )
+        self._set_results(futures, results)
+
+    @staticmethod
+    def _set_results(futures: list[asyncio.Future], results: list) -> None:
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+summarization_batcher = SummarizationBatcher(
+    settings.ai.batch_window, settings.ai.batch_max_size
+)
+
+
+def summarization_cache_key(title: str, text: str) -> str:
+    """Content address of summarization, changes with model or prompt"""
+    parts = (settings.ai.default_model, settings.ai.summarization_prompt, title, text)
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+async def summarize_note(
+    title: str,
+    text: str,
+    session_factory: async_sessionmaker[AsyncSession],
+    owner: Hashable | None = None,
+) -> str:
+    """Looks summarization up in LRU, then in DB, and only then asks AI.
+
+    With batching enabled misses of the same `owner` (user) share AI calls,
+    misses without an owner are never batched.
+    """
+    key = summarization_cache_key(title, text)
+    summarization = summarization_cache.get(key)
+    if summarization is not None:
+        return summarization
+
+    async with session_factory() as session:
+        summarization = await session.scalar(
+            select(SummarizationCache.summarization).where(
+                SummarizationCache.key == key
+            )
+        )
+    if summarization is not None:
+        summarization_db_cache_stats["hits"] += 1
+        summarization_cache.set(key, summarization)
+        return summarization
+
+    summarization_db_cache_stats["misses"] += 1
+    if settings.ai.batch_window > 0 and owner is not None:
+        summarization = await summarization_batcher.summarize(owner, title, text)
+    else:
+        summarization = await generate_summarization(title, text)
+    async with session_factory() as session:
+        await session.execute(
+            insert(SummarizationCache)
+            .values(key=key, summarization=summarization)
+            .on_conflict_do_nothing(index_elements=[SummarizationCache.key])
+        )
+        await session.commit()
+    summarization_cache.set(key, summarization)
+    return summarization
+
+
+async def prune_summarization_cache(
+    session: AsyncSession, batch_size: int = 1_000
+) -> int:
+    """Deletes summarizations older than `settings.ai.db_cache_ttl_days` in
+    batches, each committed on its own, so inserts of the same keys aren't blocked
+    for long. Returns number of deleted summarizations"""
+    expired_before = datetime.now(UTC) - timedelta(days=settings.ai.db_cache_ttl_days)
+    deleted = 0
+    while True:
+        expired_ids = (
+            select(SummarizationCache.id)
+            .where(SummarizationCache.created_at < expired_before)
+            .limit(batch_size)
+        )
+        result = await session.execute(
+            delete(SummarizationCache).where(
+                SummarizationCache.id.in_(expired_ids.scalar_subquery())
+            )
+        )
+        await session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from api.v1.notes.controllers import bump_notes_version
+from api.v1.notes.summarization import prune_summarization_cache, summarize_note
+from core.config import settings
+from core.database import (
+    JobStatus,
+    Note,
+    SummarizationJob,
+    SummarizationStatus,
+)
+from core.database.db_helper import db_helper
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ClaimedJob:
+    id: int
+    note_id: int
+    revision: int
+    attempts: int
+    user_id: int
+    title: str
+    text: str
+
+
+async def claim_summarization_jobs(
+    session: AsyncSession, limit: int
+) -> list[ClaimedJob]:
+    """Locks due jobs with SKIP LOCKED, so several workers never claim the same job.
+
+    Running jobs whose lease expired (crashed worker) are claimed again.
+    """
+    now = datetime.now(UTC)
+    stmt = (
+        select(SummarizationJob, Note.user_id, Note.title, Note.text)
+        .join(Note, Note.id == SummarizationJob.note_id)
+        .where(
+            SummarizationJob.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+            SummarizationJob.run_after <= now,
+        )
+        .order_by(SummarizationJob.run_after)
+        .limit(limit)
+        .with_for_update(of=SummarizationJob, skip_locked=True)
+    )
+    rows = (await session.execute(stmt)).all()
+    claimed = []
+    for job, user_id, title, text in rows:
+        if job.attempts >= settings.worker.max_attempts:
+            await _mark_dead(
+                session, job.id, job.note_id, user_id, job.revision, "Lease expired"
+            )
+            continue
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        job.run_after = now + timedelta(seconds=settings.worker.lease_seconds)
+        claimed.append(
+            ClaimedJob(
+                job.id, job.note_id, job.revision, job.attempts, user_id, title, text
+            )
+        )
+    await session.commit()
+    return claimed
+
+
+async def complete_summarization_job(
+    session: AsyncSession, job: ClaimedJob, summarization: str
+) -> bool:
+    """Stores summarization, unless job was re-enqueued by a newer note update"""
+    result = await session.execute(
+        delete(SummarizationJob).where(
+            SummarizationJob.id == job.id,
+            SummarizationJob.revision == job.revision,
+            SummarizationJob.status == JobStatus.RUNNING,
+        )
+    )
+    if not result.rowcount:
+        await session.rollback()
+        return False
+    await session.execute(
+        update(Note)
+        .where(Note.id == job.note_id)
+        .values(
+            summarization=summarization,
+            summarization_status=SummarizationStatus.DONE,
+        )
+    )
+    await bump_notes_version(session, [job.user_id])
+    await session.commit()
+    return True
+
+
+async def fail_summarization_job(
+    session: AsyncSession, job: ClaimedJob, error: str
+) -> None:
+    """Schedules retry with exponential backoff or moves job to dead-letter state"""
+    if job.attempts >= settings.worker.max_attempts:
+        await _mark_dead(session, job.id, job.note_id, job.user_id, job.revision, error)
+    else:
+        delay = settings.worker.retry_backoff * 2 ** (job.attempts - 1)
+        await session.execute(
+            update(SummarizationJob)
+            .where(
+                SummarizationJob.id == job.id,
+                SummarizationJob.revision == job.revision,
+            )
+            .values(
+                status=JobStatus.PENDING,
+                run_after=datetime.now(UTC) + timedelta(seconds=delay),
+                last_error=error,
+            )
+        )
+    await session.commit()
+
+
+async def _mark_dead(
+    session: AsyncSession,
+    job_id: int,
+    note_id: int,
+    user_id: int,
+    revision: int,
+    error: str,
+) -> None:
+    result = await session.execute(
+        update(SummarizationJob)
+        .where(SummarizationJob.id == job_id, SummarizationJob.revision == revision)
+        .values(status=JobStatus.DEAD, last_error=error)
+    )
+    if result.rowcount:
+        await session.execute(
+            update(Note)
+            .where(Note.id == note_id)
+            .values(summarization_status=SummarizationStatus.FAILED)
+        )
+        await bump_notes_version(session, [user_id])
+
+
+async def process_summarization_job(
+    session_factory: async_sessionmaker[AsyncSession], job: ClaimedJob
+) -> None:
+    """Errors are logged, a job whose result couldn't be stored is claimed again
+    when its lease expires"""
+    error = None
+    try:
+        summarization = await summarize_note(
+            job.title, job.text, session_factory, job.user_id
+        )
+    except Exception as summarization_error:
+        logger.warning("Summarization job %s failed: %r", job.id, summarization_error)
+        error = repr(summarization_error)
+    try:
+        async with session_factory() as session:
+            if error is None:
+                await complete_summarization_job(session, job, summarization)
+            else:
+                await fail_summarization_job(session, job, error)
+    except Exception:
+        logger.exception("Storing result of summarization job %s failed", job.id)
+
+
+async def prune_expired_summarizations(
+    session_factory: async_sessionmaker[AsyncSession],
+) -> None:
+    """Errors are logged, pruning is retried after
+    `settings.worker.cache_prune_interval` seconds"""
+    try:
+        async with session_factory() as session:
+            deleted = await prune_summarization_cache(session)
+    except Exception:
+        logger.exception("Pruning summarization cache failed")
+        return
+    if deleted:
+        logger.info("Pruned %d expired summarizations", deleted)
+
+
+async def run_summarization_worker(
+    session_factory: async_sessionmaker[AsyncSession] = db_helper.factory,
+) -> None:
+    """Claims jobs while keeping at most `settings.worker.concurrency` in progress.
+
+    If claiming fails (e.g. database is down), the worker retries with exponential
+    backoff up to `settings.worker.max_error_backoff` seconds. Expired summarizations
+    are pruned every `settings.worker.cache_prune_interval` seconds.
+    """
+    tasks: set[asyncio.Task] = set()
+    failures = 0
+    pruned_at = -math.inf
+    while True:
+        if time.monotonic() - pruned_at >= settings.worker.cache_prune_interval:
+            pruned_at = time.monotonic()
+            await prune_expired_summarizations(session_factory)
+        jobs = []
+        free_slots = settings.worker.concurrency - len(tasks)
+        if free_slots > 0:
+            try:
+                async with session_factory() as session:
+                    jobs = await claim_summarization_jobs(session, free_slots)
+            except Exception:
+                failures += 1
+                delay = min(
+                    settings.worker.poll_interval * 2**failures,
+                    settings.worker.max_error_backoff,
+                )
+                logger.exception(
+                    "Claiming summarization jobs failed, retrying in %.1f s", delay
+                )
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+        for job in jobs:
+            task = asyncio.create_task(process_summarization_job(session_factory, job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(
+                tasks,
+                timeout=settings.worker.poll_interval,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        else:
+            await asyncio.sleep(settings.worker.poll_interval)
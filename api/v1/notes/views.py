@@ -1,37 +1,96 @@
-from fastapi import APIRouter, Depends, status
-from pydantic import TypeAdapter
+from fastapi import APIRouter, Depends, Response, status
+from sqlalchemy import Row
 
+from api.serialization import encode_rows, fields_encoder, json_response, row_encoder
 from api.v1.notes.exceptions import note_not_found_exc
 from api.v1.notes.helpers import (
+    apply_notes_batch_with_jwt,
+    check_users_note_not_modified_with_jwt,
+    check_users_notes_not_modified_with_jwt,
     create_note_with_jwt,
     delete_users_note_with_jwt,
     get_all_users_notes_with_jwt,
     get_single_users_note_with_jwt,
     get_users_note_history_with_jwt,
+    note_fields,
+    search_users_notes_with_jwt,
     update_users_note_with_jwt,
 )
-from api.v1.notes.schemas import NoteSchema, NoteSchemaWithHistory
+from api.v1.notes.schemas import (
+    BatchItemResultSchema,
+    NotesBatchResultSchema,
+    NoteSchema,
+    NoteSchemaWithHistory,
+    NoteSchemaWithHistoryMetadata,
+    NoteSearchResultSchema,
+    NotesPageSchema,
+    NotesSearchPageSchema,
+)
 from core.database import Note
 
 router = APIRouter(tags=["notes"], prefix="/notes")
 
 
-@router.get("/", response_model=list[NoteSchema])
+@router.get(
+    "/",
+    response_model=NotesPageSchema,
+    dependencies=[Depends(check_users_notes_not_modified_with_jwt)],
+)
 async def get_users_notes(
-    notes: list[Note] = Depends(get_all_users_notes_with_jwt),
+    response: Response,
+    notes_page: tuple[list[Note] | list[Row], str | None] = Depends(
+        get_all_users_notes_with_jwt
+    ),
+    fields: tuple[str, ...] | None = Depends(note_fields),
+):
+    notes, next_cursor = notes_page
+    encoder = row_encoder(NoteSchema) if fields is None else fields_encoder(fields)
+    return json_response(
+        {"items": [encoder(note) for note in notes], "next_cursor": next_cursor},
+        response,
+    )
+
+
+@router.get("/search", response_model=NotesSearchPageSchema)
+async def search_users_notes(
+    search_page: tuple[list[Row], str | None] = Depends(search_users_notes_with_jwt),
 ):
-    ta = TypeAdapter(list[NoteSchema])
-    return ta.validate_python(notes, from_attributes=True)
+    matches, next_cursor = search_page
+    return json_response(
+        {
+            "items": encode_rows(NoteSearchResultSchema, matches),
+            "next_cursor": next_cursor,
+        }
+    )
 
 
 @router.post("/", response_model=NoteSchema, status_code=status.HTTP_201_CREATED)
-async def create_note(note: Note = Depends(create_note_with_jwt)):
-    return NoteSchema.model_validate(note, from_attributes=True)
+async def create_note(response: Response, note: Note = Depends(create_note_with_jwt)):
+    return json_response(
+        row_encoder(NoteSchema)(note), response, status_code=status.HTTP_201_CREATED
+    )
+
+
+@router.post("/batch", response_model=NotesBatchResultSchema)
+async def apply_notes_batch(
+    response: Response,
+    results: list[BatchItemResultSchema] = Depends(apply_notes_batch_with_jwt),
+):
+    return json_response({"items": results}, response)
 
 
-@router.get("/{note_id}", response_model=NoteSchema)
-async def get_user_single_note(note: Note = Depends(get_single_users_note_with_jwt)):
-    return NoteSchema.model_validate(note, from_attributes=True)
+@router.get(
+    "/{note_id}",
+    response_model=NoteSchema,
+    dependencies=[Depends(check_users_note_not_modified_with_jwt)],
+)
+async def get_user_single_note(
+    response: Response,
+    note: Note | Row = Depends(get_single_users_note_with_jwt),
+    fields: tuple[str, ...] | None = Depends(note_fields),
+):
+    encoder = row_encoder(NoteSchema) if fields is None else fields_encoder(fields)
+    return json_response(encoder(note), response)
 
 
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -43,12 +102,19 @@ async def delete_users_note(
 
 
 @router.patch("/{note_id}", response_model=NoteSchema)
-async def update_users_note(upd_note=Depends(update_users_note_with_jwt)):
-    return NoteSchema.model_validate(upd_note, from_attributes=True)
+async def update_users_note(
+    response: Response, upd_note=Depends(update_users_note_with_jwt)
+):
+    return json_response(row_encoder(NoteSchema)(upd_note), response)
 
 
-@router.get("/history/{note_id}", response_model=NoteSchemaWithHistory)
+@router.get(
+    "/history/{note_id}",
+    response_model=NoteSchemaWithHistory | NoteSchemaWithHistoryMetadata,
+    dependencies=[Depends(check_users_note_not_modified_with_jwt)],
+)
 async def get_users_note_history(
-    note_with_history: Note = Depends(get_users_note_history_with_jwt),
+    response: Response,
+    note_with_history: dict = Depends(get_users_note_history_with_jwt),
 ):
-    return NoteSchemaWithHistory.model_validate(note_with_history, from_attributes=True)
+    return json_response(note_with_history, response)
@@ -0,0 +1,86 @@
+"""Accuracy of ?mode=approx common words against exact counts on Zipfian corpora.
+
+Corpora are generated in memory and folded in partitions like the process
+pool does, so the database is not needed:
+    python -m benchmarks.analytics_approx_accuracy
+"""
+
+import pickle
+import time
+
+import numpy as np
+
+from api.v1.analytics.helpers import AnalyticsAccumulator, SketchAnalyticsAccumulator
+
+NOTES = 100_000
+WORDS_PER_NOTE = 50
+VOCABULARY = 200_000
+PARTITIONS = 4
+CHUNK_SIZE = 10_000
+ZIPF_EXPONENTS = (1.1, 1.3, 1.6)
+TOP = 10
+
+
+def zipfian_corpus(exponent: float, seed: int = 0) -> list[str]:
+    rng = np.random.default_rng(seed)
+    ranks = rng.zipf(exponent, size=(NOTES, WORDS_PER_NOTE)) % VOCABULARY
+    # permute ranks, so word order in corpus doesn't follow frequency
+    names = rng.permutation(VOCABULARY)
+    return [" ".join(f"w{names[rank]}" for rank in note) for note in ranks]
+
+
+def fold(accumulator_class, texts: list[str]) -> tuple[AnalyticsAccumulator, int]:
+    """Returns merged accumulator and bytes sent from partitions"""
+    merged = accumulator_class(top_words=TOP)
+    transferred = 0
+    size = -(-len(texts) // PARTITIONS)
+    for start in range(0, len(texts), size):
+        partition = accumulator_class(top_words=TOP)
+        for chunk in range(start, min(start + size, len(texts)), CHUNK_SIZE):
+            chunk_texts = texts[chunk : min(chunk + CHUNK_SIZE, start + size)]
+            partition.update([""] * len(chunk_texts), chunk_texts)
+        payload = pickle.dumps(partition)
+        transferred += len(payload)
+        merged.merge(pickle.loads(payload))
+    return merged, transferred
+
+
+def main():
+    for exponent in ZIPF_EXPONENTS:
+        texts = zipfian_corpus(exponent)
+        results = {}
+        for name, accumulator_class in (
+            ("exact", AnalyticsAccumulator),
+            ("approx", SketchAnalyticsAccumulator),
+        ):
+            start = time.perf_counter()
+            accumulator, transferred = fold(accumulator_class, texts)
+            elapsed = time.perf_counter() - start
+            results[name] = accumulator
+            print(
+                f"zipf={exponent} {name:<7} time={elapsed:6.2f}s "
+                f"partitions={transferred / 2**20:8.2f}MiB"
+            )
+
+        exact = results["exact"].word_counts
+        approx = results["approx"].result()
+        true_top = {word for word, _ in exact.most_common(TOP)}
+        recall = len(true_top & approx.common_words.keys()) / TOP
+        overestimates = [
+            count - exact[word] for word, count in approx.common_words.items()
+        ]
+        within_bounds = all(
+            count - approx.common_words_error[word] <= exact[word] <= count
+            for word, count in approx.common_words.items()
+        )
+        print(
+            f"zipf={exponent} recall@{TOP}={recall:.2f} "
+            f"max_overestimate={max(overestimates)} "
+            f"max_reported_error={max(approx.common_words_error.values())} "
+            f"cms_bound={results['approx'].sketch.error_bound} "
+            f"within_bounds={within_bounds}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Time, peak memory and event loop stalls of pandas analytics engine,
+process pool map-reduce vs the old full-corpus implementation.
+
+Seeded notes are deleted afterwards, existing notes of the database are counted
+as well. Peak memory is of the API process only, without pool workers.
+
+Run from the project root against a migrated database:
+    python -m benchmarks.analytics_engine
+"""
+
+import asyncio
+import re
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+import pandas as pd
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from api.v1.analytics.helpers import analytics_executor, get_pandas_analytics
+from api.v1.analytics.schemas import AnalyticsSchema
+from benchmarks.seed import delete_users, refresh_maintained_tables
+from core.database import Note
+from core.database.db_helper import db_helper
+
+SIZES = (10_000, 100_000, 1_000_000)
+WORDS = 50
+VOCABULARY = 5_000
+
+
+async def legacy_analytics(session: AsyncSession) -> AnalyticsSchema:
+    """Previous implementation: one DataFrame and one joined string of the corpus"""
+    notes = (await session.execute(select(Note.title, Note.text))).all()
+    titles, texts = zip(*notes)
+
+    def clean_text(value: str) -> str:
+        return re.sub(r"[^a-zA-Zа-яА-ЯёЁ0-9\s]", "", value.lower())
+
+    df = pd.DataFrame(
+        {
+            "title": [clean_text(title) for title in titles],
+            "text": [clean_text(note_text) for note_text in texts],
+        }
+    )
+    df["content"] = df["title"] + " " + df["text"]
+    df["word_count"] = df["content"].apply(lambda x: len(x.split()))
+    words = " ".join(df["content"]).lower().split()
+    return AnalyticsSchema(
+        total_notes=len(df),
+        total_words=df["word_count"].sum(),
+        avg_words=int(df["word_count"].mean()),
+        common_words=dict(Counter(words).most_common(10)),
+        top_longest_notes=dict(
+            df.nlargest(3, "word_count")[["title", "word_count"]].values
+        ),
+        top_shortest_notes=dict(
+            df.nsmallest(3, "word_count")[["title", "word_count"]].values
+        ),
+    )
+
+
+async def seed(conn: AsyncConnection, count: int) -> int:
+    user_id = await conn.scalar(
+        text(
+            'INSERT INTO "user" (username, password) '
+            "VALUES (:username, 'password') RETURNING id"
+        ),
+        {"username": f"bench_{uuid.uuid4().hex[:8]}"},
+    )
+    await conn.execute(
+        text(
+            "INSERT INTO note "
+            "(user_id, title, text, summarization, created_at, updated_at) "
+            "SELECT :user_id, 'Bench note ' || i, array_to_string(ARRAY("
+            "  SELECT 'Word' || ((i * 7919 + j * 104729) % :vocabulary) || ','"
+            "  FROM generate_series(1, :words) AS j), ' '), "
+            "'Bench', now(), now() "
+            "FROM generate_series(1, :count) AS i"
+        ),
+        {
+            "user_id": user_id,
+            "count": count,
+            "words": WORDS,
+            "vocabulary": VOCABULARY,
+        },
+    )
+    return user_id
+
+
+async def max_loop_stall(stop: asyncio.Event) -> float:
+    """Longest time in ms the event loop couldn't run a 10ms ticker"""
+    longest = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        longest = max(longest, (time.perf_counter() - start - 0.01) * 1000)
+    return longest
+
+
+async def measure(engine) -> tuple[float, float, float]:
+    """Returns (seconds, peak MiB, max loop stall ms), peak is from a second run"""
+    async with db_helper.factory() as session:
+        stop = asyncio.Event()
+        ticker = asyncio.create_task(max_loop_stall(stop))
+        start = time.perf_counter()
+        await engine(session)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        stall = await ticker
+    async with db_helper.factory() as session:
+        tracemalloc.start()
+        await engine(session)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak / 2**20, stall
+
+
+async def main():
+    for size in SIZES:
+        async with db_helper.engine.begin() as conn:
+            user_id = await seed(conn, size)
+        await refresh_maintained_tables([user_id])
+        for name, engine in (
+            ("legacy", legacy_analytics),
+            ("pool", get_pandas_analytics),
+        ):
+            elapsed, peak, stall = await measure(engine)
+            print(
+                f"{name:<8} notes={size:<9} time={elapsed:8.2f}s "
+                f"peak={peak:9.1f}MiB max_loop_stall={stall:9.1f}ms"
+            )
+        await delete_users([user_id])
+    analytics_executor.shutdown()
+    await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
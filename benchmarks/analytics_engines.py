@@ -0,0 +1,103 @@
+"""Latency and transferred bytes of every analytics engine on the same corpus.
+
+Transferred bytes are the row payload sent by Postgres to the engine (values
+only, without protocol overhead): the whole corpus for pandas engine and only
+the results for incremental and sql ones.
+
+Seeded notes are deleted afterwards, existing notes of the database are counted
+as well. Run from the project root against a migrated database:
+    python -m benchmarks.analytics_engines
+"""
+
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from api.v1.analytics.controllers import (
+    get_most_common_words,
+    get_notes_by_word_count,
+    get_notes_totals,
+    get_sql_analytics_rows,
+)
+from api.v1.analytics.helpers import (
+    analytics_executor,
+    get_incremental_analytics,
+    get_pandas_analytics,
+    get_sql_analytics,
+)
+from api.v1.analytics.tokenizer import MAX_WORD_LENGTH, postgres_non_word_pattern
+from benchmarks.analytics_engine import seed
+from benchmarks.seed import delete_users, refresh_maintained_tables
+from core.database.db_helper import db_helper
+
+SIZES = (10_000, 100_000)
+REPEATS = 3
+
+
+def payload_size(rows) -> int:
+    return sum(len(str(value).encode()) for row in rows for value in row)
+
+
+async def incremental_payload(session) -> int:
+    rows = [await get_notes_totals(session)]
+    rows += await get_most_common_words(session, 10)
+    rows += await get_notes_by_word_count(session, 3, longest=True)
+    rows += await get_notes_by_word_count(session, 3, longest=False)
+    return payload_size(rows)
+
+
+async def pandas_payload(session) -> int:
+    # rows are streamed to pool workers, so they are measured on server side
+    return await session.scalar(
+        text(
+            "SELECT coalesce(sum(length(id::text) + octet_length(title) "
+            "+ octet_length(text)), 0) FROM note"
+        )
+    )
+
+
+async def sql_payload(session) -> int:
+    rows = await get_sql_analytics_rows(
+        session,
+        postgres_non_word_pattern(),
+        top_words=10,
+        top_notes=3,
+        max_word_length=MAX_WORD_LENGTH,
+    )
+    return payload_size(rows)
+
+
+ENGINES = {
+    "incremental": (get_incremental_analytics, incremental_payload),
+    "pandas": (get_pandas_analytics, pandas_payload),
+    "sql": (get_sql_analytics, sql_payload),
+}
+
+
+async def main():
+    for size in SIZES:
+        async with db_helper.engine.begin() as conn:
+            user_id = await seed(conn, size)
+        await refresh_maintained_tables([user_id])
+        for name, (engine, payload) in ENGINES.items():
+            timings = []
+            for _ in range(REPEATS):
+                async with db_helper.factory() as session:
+                    start = time.perf_counter()
+                    await engine(session)
+                    timings.append(time.perf_counter() - start)
+            async with db_helper.factory() as session:
+                transferred = await payload(session)
+            print(
+                f"{name:<12} notes={size:<8} "
+                f"median={sorted(timings)[REPEATS // 2]:8.3f}s "
+                f"transferred={transferred / 2**10:12.1f}KiB"
+            )
+        await delete_users([user_id])
+    analytics_executor.shutdown()
+    await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
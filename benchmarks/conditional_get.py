@@ -0,0 +1,99 @@
+"""Bandwidth and CPU of polling note reads with and without If-None-Match.
+
+The app is called in-process through ASGI, so CPU time includes the HTTP
+client, but not the database. Seeded user and notes are deleted afterwards.
+Run from the project root against a migrated database:
+    python -m benchmarks.conditional_get
+"""
+
+import asyncio
+import time
+import uuid
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+
+from benchmarks.seed import delete_users, refresh_maintained_tables
+from core.database.db_helper import db_helper
+from main import main_app
+
+NOTES = 1_000
+TEXT_WORDS = 200
+POLLS = 500
+PAGE = 50
+
+
+async def seed(client: AsyncClient) -> tuple[int, dict[str, str], int]:
+    """Returns (user id, auth headers, id of a note with history)"""
+    username = f"poll_{uuid.uuid4().hex[:8]}"
+    response = await client.post(
+        "/api/v1/auth/sign_up",
+        json={"username": username, "password": "StrongTestPassword123!"},
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    async with db_helper.engine.begin() as conn:
+        user_id = await conn.scalar(
+            text('SELECT id FROM "user" WHERE username = :username'),
+            {"username": username},
+        )
+        note_id = await conn.scalar(
+            text(
+                "INSERT INTO note "
+                "(user_id, title, text, summarization, created_at, updated_at) "
+                "SELECT :user_id, 'Polled note ' || i, repeat('lorem ', :words), "
+                "'Summary', now(), now() - i * interval '1 second' "
+                "FROM generate_series(1, :count) AS i RETURNING id"
+            ),
+            {"user_id": user_id, "words": TEXT_WORDS, "count": NOTES},
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO note_history (note_id, title, text, created_at) "
+                "SELECT :note_id, 'Old title ' || i, repeat('ipsum ', :words), now() "
+                "FROM generate_series(1, 10) AS i"
+            ),
+            {"note_id": note_id, "words": TEXT_WORDS},
+        )
+    return user_id, headers, note_id
+
+
+async def poll(client: AsyncClient, url: str, headers: dict, conditional: bool):
+    """Returns (KiB received per poll, CPU ms per poll, status of the last poll)"""
+    etag = (await client.get(url, headers=headers)).headers["ETag"]
+    if conditional:
+        headers = {**headers, "If-None-Match": etag}
+    received = 0
+    start = time.process_time()
+    for _ in range(POLLS):
+        response = await client.get(url, headers=headers)
+        received += len(response.content)
+    cpu = time.process_time() - start
+    return received / POLLS / 2**10, cpu / POLLS * 1000, response.status_code
+
+
+async def main():
+    async with AsyncClient(
+        transport=ASGITransport(app=main_app), base_url="http://bench"
+    ) as client:
+        user_id, headers, note_id = await seed(client)
+        await refresh_maintained_tables([user_id])
+        try:
+            for url in (
+                f"/api/v1/notes/?limit={PAGE}",
+                f"/api/v1/notes/{note_id}",
+                f"/api/v1/notes/history/{note_id}",
+            ):
+                for conditional in (False, True):
+                    size, cpu, status = await poll(client, url, headers, conditional)
+                    name = "If-None-Match" if conditional else "plain"
+                    print(
+                        f"{url.split('/notes')[1] or '/':<24} {name:<14} "
+                        f"status={status} body={size:8.2f}KiB cpu={cpu:6.2f}ms"
+                    )
+        finally:
+            await delete_users([user_id])
+    await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,24 @@
+"""Microbenchmark of access token verification with and without cache.
+
+python -m benchmarks.jwt_decode
+"""
+
+import timeit
+
+from api.v1.auth.security_utils import decode_jwt, decode_jwt_cached, encode_jwt
+
+ROUNDS = 5_000
+
+
+def main():
+    token = encode_jwt({"sub": "1", "username": "bench", "type": "access"})
+    for name, func in (
+        ("decode_jwt", decode_jwt),
+        ("decode_jwt_cached", decode_jwt_cached),
+    ):
+        seconds = timeit.timeit(lambda: func(token), number=ROUNDS)
+        print(f"{name:<20} {seconds / ROUNDS * 1_000_000:9.2f}us per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Logins per second and GET /auth/me latency during a login storm.
+
+Compares bcrypt run inline on the event loop (old behaviour)
+with bcrypt sent to the password executor (current behaviour).
+
+Run from the project root against a migrated database:
+    python -m benchmarks.login_storm
+"""
+
+import asyncio
+import time
+import uuid
+from unittest import mock
+
+from api.v1.auth import helpers
+from api.v1.auth.security_utils import validate_password
+from benchmarks.utils import API_V1_PREFIX, PASSWORD, api_client, report, sign_up, timed
+
+LOGINS = 100
+READS = 100
+
+
+async def inline_validate_password(password: str, hashed_password: str) -> bool:
+    return validate_password(password, hashed_password)
+
+
+async def login_storm(client, username: str) -> tuple[float, int]:
+    user = {"username": username, "password": PASSWORD}
+    start = time.perf_counter()
+    responses = await asyncio.gather(
+        *(client.post(f"{API_V1_PREFIX}/auth/login", json=user) for _ in range(LOGINS))
+    )
+    elapsed = time.perf_counter() - start
+    ok = sum(response.status_code == 200 for response in responses)
+    rejected = sum(response.status_code == 503 for response in responses)
+    return ok / elapsed, rejected
+
+
+async def measure_reads(client, headers: dict) -> list[float]:
+    samples = []
+    for _ in range(READS):
+        samples.append(
+            await timed(client.get(f"{API_V1_PREFIX}/auth/me", headers=headers))
+        )
+        await asyncio.sleep(0)
+    return samples
+
+
+async def run_scenario(client, username: str, headers: dict) -> None:
+    (logins_per_second, rejected), samples = await asyncio.gather(
+        login_storm(client, username), measure_reads(client, headers)
+    )
+    print(f"logins per second: {logins_per_second:.1f}, rejected with 503: {rejected}")
+    report("GET /auth/me during login storm", samples)
+
+
+async def main():
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    async with api_client() as client:
+        token = await sign_up(client, username)
+        headers = {"Authorization": f"Bearer {token}"}
+        report("GET /auth/me idle", await measure_reads(client, headers))
+
+        print("bcrypt inline on event loop:")
+        with mock.patch.object(
+            helpers, "validate_password_async", inline_validate_password
+        ):
+            await run_scenario(client, username, headers)
+
+        print("bcrypt in password executor:")
+        await run_scenario(client, username, headers)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""Stored size and read time of note history as reverse deltas and as full texts.
+
+The same revisions are seeded twice: as the app stores them (deltas with a
+snapshot every `settings.history.snapshot_interval` revisions) and as full
+texts only. Size is the on-disk size of the text columns after Postgres' own
+compression. Read time is `get_note_history` of one note, including the rebuild.
+Seeded notes are deleted afterwards. Run from the project root against
+a migrated database:
+    python -m benchmarks.note_history
+"""
+
+import asyncio
+import random
+import statistics
+import time
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import insert, text
+
+from api.v1.notes.controllers import get_note_history
+from api.v1.notes.history import history_values
+from benchmarks.seed import delete_users, refresh_maintained_tables
+from core.config import settings
+from core.database import Note, NoteHistory
+from core.database.db_helper import db_helper
+
+NOTES = 200
+REVISIONS = 50
+WORDS = 500
+EDITS = 5
+VOCABULARY = 5_000
+
+
+def revisions() -> list[str]:
+    """Returns texts of a note oldest first, every one edits a few words"""
+    words = [f"word{random.randrange(VOCABULARY)}" for _ in range(WORDS)]
+    texts = [" ".join(words)]
+    for _ in range(REVISIONS):
+        for _ in range(EDITS):
+            words[random.randrange(WORDS)] = f"edit{random.randrange(VOCABULARY)}"
+        texts.append(" ".join(words))
+    return texts
+
+
+def history_rows(note_id: int, texts: list[str], deltas: bool) -> list[dict]:
+    rows = []
+    now = datetime.now(UTC)
+    newer_text, delta_run = texts[-1], 0
+    for revision in range(len(texts) - 2, -1, -1):
+        values = {"text": texts[revision], "text_delta": None}
+        if deltas:
+            values = history_values(texts[revision], newer_text, delta_run)
+            delta_run = delta_run + 1 if values["text"] is None else 0
+        newer_text = texts[revision]
+        rows.append(
+            {
+                "note_id": note_id,
+                "title": f"Revision {revision}",
+                "created_at": now - timedelta(minutes=revision + 1),
+                **values,
+            }
+        )
+    return rows
+
+
+async def seed(conn, user_id: int, layout: str) -> list[int]:
+    note_ids = []
+    for i in range(NOTES):
+        texts = revisions()
+        note_id = await conn.scalar(
+            insert(Note)
+            .values(
+                user_id=user_id,
+                title=f"History bench {layout} {i}",
+                text=texts[-1],
+                summarization="Summary",
+            )
+            .returning(Note.id)
+        )
+        await conn.execute(
+            insert(NoteHistory), history_rows(note_id, texts, layout == "deltas")
+        )
+        note_ids.append(note_id)
+    return note_ids
+
+
+async def stored_size(conn, note_ids: list[int]) -> int:
+    return await conn.scalar(
+        text(
+            "SELECT sum(coalesce(pg_column_size(text), 0) "
+            "+ coalesce(pg_column_size(text_delta), 0)) "
+            "FROM note_history WHERE note_id = ANY(:note_ids)"
+        ),
+        {"note_ids": note_ids},
+    )
+
+
+async def read_time(note_ids: list[int]) -> float:
+    """Returns median ms of reading history of a note"""
+    timings = []
+    for note_id in note_ids:
+        async with db_helper.factory() as session:
+            start = time.perf_counter()
+            await get_note_history(session, note_id)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+async def main():
+    random.seed(0)
+    async with db_helper.engine.begin() as conn:
+        user_id = await conn.scalar(
+            text(
+                'INSERT INTO "user" (username, password) '
+                "VALUES ('history_bench', 'password') RETURNING id"
+            )
+        )
+        layouts = {
+            layout: await seed(conn, user_id, layout) for layout in ("full", "deltas")
+        }
+    await refresh_maintained_tables([user_id])
+    try:
+        async with db_helper.engine.connect() as conn:
+            sizes = {
+                layout: await stored_size(conn, note_ids)
+                for layout, note_ids in layouts.items()
+            }
+        for layout, note_ids in layouts.items():
+            print(
+                f"{layout:<7} revisions={NOTES * REVISIONS} "
+                f"size={sizes[layout] / 2**20:7.2f}MiB "
+                f"ratio={sizes[layout] / sizes['full']:5.3f} "
+                f"read={await read_time(note_ids):6.2f}ms/note"
+            )
+        print(f"snapshot_interval={settings.history.snapshot_interval}")
+    finally:
+        await delete_users([user_id])
+        await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""Notes per second of POST /notes/batch against single-note endpoints.
+
+Summarization is replaced with a fake one sleeping `SUMMARIZATION_LATENCY`
+seconds, so no AI calls are made. The app is called in-process through ASGI,
+the seeded user and its notes are deleted afterwards. Run from the project root
+against a migrated database:
+    python -m benchmarks.notes_batch
+"""
+
+import asyncio
+import time
+import uuid
+from unittest import mock
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+
+from core.database.db_helper import db_helper
+from main import main_app
+
+NOTES = 500
+BATCH_SIZE = 100
+SUMMARIZATION_LATENCY = 0.05
+
+
+async def fake_summarization(title: str, text: str) -> str:
+    await asyncio.sleep(SUMMARIZATION_LATENCY)
+    return f"Summary of {title}"
+
+
+def note_json(i: int, kind: str) -> dict[str, str]:
+    return {"title": f"Batch bench {i}", "text": f"{kind} text of note number {i}"}
+
+
+async def single_requests(client: AsyncClient, headers: dict) -> dict[str, float]:
+    """Returns seconds per kind of operation"""
+    timings = {}
+    start = time.perf_counter()
+    note_ids = []
+    for i in range(NOTES):
+        response = await client.post(
+            "/api/v1/notes/", json=note_json(i, "created"), headers=headers
+        )
+        note_ids.append(response.json()["id"])
+    timings["create"] = time.perf_counter() - start
+    start = time.perf_counter()
+    for i, note_id in enumerate(note_ids):
+        await client.patch(
+            f"/api/v1/notes/{note_id}", json=note_json(i, "updated"), headers=headers
+        )
+    timings["update"] = time.perf_counter() - start
+    start = time.perf_counter()
+    for note_id in note_ids:
+        await client.delete(f"/api/v1/notes/{note_id}", headers=headers)
+    timings["delete"] = time.perf_counter() - start
+    return timings
+
+
+async def batch_requests(client: AsyncClient, headers: dict) -> dict[str, float]:
+    async def run(operations: list[dict]) -> list[dict]:
+        items = []
+        for start in range(0, len(operations), BATCH_SIZE):
+            response = await client.post(
+                "/api/v1/notes/batch",
+                json={"operations": operations[start : start + BATCH_SIZE]},
+                headers=headers,
+            )
+            items += response.json()["items"]
+        return items
+
+    timings = {}
+    start = time.perf_counter()
+    items = await run(
+        [{"op": "create", **note_json(i, "created")} for i in range(NOTES)]
+    )
+    note_ids = [item["note"]["id"] for item in items]
+    timings["create"] = time.perf_counter() - start
+    start = time.perf_counter()
+    await run(
+        [
+            {"op": "update", "id": note_id, **note_json(i, "updated")}
+            for i, note_id in enumerate(note_ids)
+        ]
+    )
+    timings["update"] = time.perf_counter() - start
+    start = time.perf_counter()
+    await run([{"op": "delete", "id": note_id} for note_id in note_ids])
+    timings["delete"] = time.perf_counter() - start
+    return timings
+
+
+async def main():
+    async with AsyncClient(
+        transport=ASGITransport(app=main_app), base_url="http://bench"
+    ) as client:
+        username = f"batch_{uuid.uuid4().hex[:8]}"
+        response = await client.post(
+            "/api/v1/auth/sign_up",
+            json={"username": username, "password": "StrongTestPassword123!"},
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        try:
+            with mock.patch(
+                "api.v1.notes.helpers.create_note_summarization", fake_summarization
+            ):
+                for name, run in (
+                    ("single", single_requests),
+                    (f"batch/{BATCH_SIZE}", batch_requests),
+                ):
+                    timings = await run(client, headers)
+                    print(
+                        f"{name:<10} "
+                        + " ".join(
+                            f"{kind}={NOTES / seconds:8.1f} notes/s"
+                            for kind, seconds in timings.items()
+                        )
+                    )
+        finally:
+            async with db_helper.engine.begin() as conn:
+                await conn.execute(
+                    text('DELETE FROM "user" WHERE username = :username'),
+                    {"username": username},
+                )
+    await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+"""Latency of GET /notes/ pages with keyset pagination, page 1 vs page 1000.
+
+Run from the project root against a migrated database:
+    python -m benchmarks.notes_pagination
+"""
+
+import asyncio
+import uuid
+
+from api.v1.auth.security_utils import decode_jwt
+from benchmarks.seed import delete_users, seed_notes
+from benchmarks.utils import API_V1_PREFIX, api_client, report, sign_up, timed
+
+LIMIT = 10
+PAGES = 1_000
+SAMPLES = 50
+
+
+async def main():
+    async with api_client() as client:
+        token = await sign_up(client, f"bench_{uuid.uuid4().hex[:8]}")
+        headers = {"Authorization": f"Bearer {token}"}
+        user_id = int(decode_jwt(token)["sub"])
+        await seed_notes(user_id, LIMIT * PAGES)
+        try:
+            url = f"{API_V1_PREFIX}/notes/"
+            cursors = [None]
+            for _ in range(PAGES - 1):
+                params = {"limit": LIMIT}
+                if cursors[-1]:
+                    params["cursor"] = cursors[-1]
+                response = await client.get(url, params=params, headers=headers)
+                cursors.append(response.json()["next_cursor"])
+
+            for page in (1, PAGES):
+                params = {"limit": LIMIT}
+                if cursors[page - 1]:
+                    params["cursor"] = cursors[page - 1]
+                samples = [
+                    await timed(client.get(url, params=params, headers=headers))
+                    for _ in range(SAMPLES)
+                ]
+                report(f"GET /notes/ page {page}", samples)
+        finally:
+            await delete_users([user_id])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
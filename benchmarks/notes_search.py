@@ -0,0 +1,108 @@
+"""Latency of GET /notes/search controller on a 1M notes table.
+
+Notes of `USERS` users are seeded with words of a `VOCABULARY`-sized dictionary,
+so "word1" is in every note of a user and "word4999" in a few of them.
+Seeded notes are deleted afterwards. Run from the project root against
+a migrated database:
+    python -m benchmarks.notes_search
+"""
+
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text
+
+from api.v1.notes.controllers import search_user_notes
+from benchmarks.seed import delete_users, refresh_maintained_tables
+from core.database.db_helper import db_helper
+
+NOTES = 1_000_000
+USERS = 1_000
+WORDS = 50
+VOCABULARY = 5_000
+PAGE = 20
+REPEATS = 50
+QUERIES = {
+    "common": "word1",
+    "rare": "word4999",
+    "phrase": '"word1 word2"',
+    "or": "word17 or word4001",
+    "missing": "nonexistent",
+}
+
+
+async def seed(conn) -> list[int]:
+    user_ids = (
+        await conn.execute(
+            text(
+                'INSERT INTO "user" (username, password) '
+                "SELECT 'search_bench_' || i, 'password' "
+                "FROM generate_series(1, :users) AS i RETURNING id"
+            ),
+            {"users": USERS},
+        )
+    ).scalars()
+    user_ids = list(user_ids)
+    # word1 and word2 start every note, the rest follow a skewed distribution,
+    # `i * 0` correlates the subquery, so it is evaluated for every note
+    await conn.execute(
+        text(
+            "INSERT INTO note "
+            "(user_id, title, text, summarization, created_at, updated_at) "
+            "SELECT (CAST(:user_ids AS integer[]))[i % :users + 1], "
+            "'Search note ' || i, "
+            "'word1 word2 ' || array_to_string(ARRAY("
+            "  SELECT 'word' || floor(:vocabulary * power(random(), 3) + i * 0)::int"
+            "  FROM generate_series(1, :words)), ' '), "
+            "'Summary', now(), now() "
+            "FROM generate_series(1, :count) AS i"
+        ),
+        {
+            "user_ids": user_ids,
+            "users": USERS,
+            "count": NOTES,
+            "words": WORDS,
+            "vocabulary": VOCABULARY,
+        },
+    )
+    await conn.execute(text("ANALYZE note"))
+    return user_ids
+
+
+async def measure(user_ids: list[int], query: str) -> tuple[float, float, int]:
+    """Returns (p50, p95) latency in ms of first pages and matches on them"""
+    timings = []
+    found = 0
+    for i in range(REPEATS):
+        async with db_helper.factory() as session:
+            start = time.perf_counter()
+            matches = await search_user_notes(
+                session, user_ids[i % len(user_ids)], query, PAGE
+            )
+            timings.append((time.perf_counter() - start) * 1000)
+            found += len(matches)
+    percentiles = statistics.quantiles(timings, n=20)
+    return percentiles[9], percentiles[18], found // REPEATS
+
+
+async def main():
+    async with db_helper.engine.begin() as conn:
+        start = time.perf_counter()
+        user_ids = await seed(conn)
+        print(f"seeded {NOTES} notes in {time.perf_counter() - start:.1f}s")
+    await refresh_maintained_tables(user_ids)
+    try:
+        for name, query in QUERIES.items():
+            p50, p95, found = await measure(user_ids, query)
+            print(
+                f"{name:<8} q={query!r:<22} p50={p50:7.1f}ms p95={p95:7.1f}ms "
+                f"page={found}"
+            )
+    finally:
+        await delete_users(user_ids)
+        await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""DB queries per request of notes endpoints with each way of resolving the user.
+
+Run from the project root against a migrated database:
+    python -m benchmarks.queries_per_request
+"""
+
+import asyncio
+import uuid
+from unittest import mock
+
+from sqlalchemy import event
+
+from api.v1.auth.helpers import user_cache
+from benchmarks.utils import API_V1_PREFIX, api_client, sign_up
+from core.config import settings
+from core.database.db_helper import db_helper
+
+
+async def main():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(
+        db_helper.engine.sync_engine, "before_cursor_execute", before_cursor_execute
+    )
+
+    async with api_client() as client:
+        token = await sign_up(client, f"bench_{uuid.uuid4().hex[:8]}")
+        headers = {"Authorization": f"Bearer {token}"}
+        with mock.patch.object(settings.ai, "summarization_mode", "deferred"):
+            response = await client.post(
+                f"{API_V1_PREFIX}/notes/",
+                json={"title": "Queries note", "text": "Count my queries"},
+                headers=headers,
+            )
+        note_id = response.json()["id"]
+        endpoints = [
+            f"{API_V1_PREFIX}/notes/",
+            f"{API_V1_PREFIX}/notes/{note_id}",
+            f"{API_V1_PREFIX}/notes/history/{note_id}",
+            f"{API_V1_PREFIX}/auth/me",
+        ]
+
+        # (trust_access_token_claims, cache_users)
+        modes = {
+            "user row, no cache": (False, False),
+            "user row, cached": (False, True),
+            "trusted claims": (True, False),
+        }
+        for mode, (trust_claims, cache_users) in modes.items():
+            print(mode)
+            user_cache.clear()
+            with (
+                mock.patch.object(
+                    settings.jwt, "trust_access_token_claims", trust_claims
+                ),
+                mock.patch.object(settings.jwt, "cache_users", cache_users),
+            ):
+                for url in endpoints:
+                    statements.clear()
+                    await client.get(url, headers=headers)
+                    print(f"  GET {url:<40} {len(statements)} queries")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+from collections.abc import Sequence
+
+from sqlalchemy import text
+
+from api.v1.analytics.controllers import rebuild_word_frequency
+from api.v1.notes.controllers import bump_notes_version
+from core.database.db_helper import db_helper
+
+
+async def refresh_maintained_tables(user_ids: Sequence[int] = ()) -> None:
+    """Notes written with SQL bypass note controllers, so word counts, totals
+    and sketch partitions are rebuilt and notes versions of users are bumped"""
+    async with db_helper.factory() as session:
+        if user_ids:
+            await bump_notes_version(session, list(user_ids))
+        await rebuild_word_frequency(session)
+
+
+async def delete_users(user_ids: Sequence[int]) -> None:
+    """Deletes benchmark users with their notes and rebuilds maintained tables"""
+    async with db_helper.engine.begin() as conn:
+        await conn.execute(
+            text("DELETE FROM note WHERE user_id = ANY(:user_ids)"),
+            {"user_ids": list(user_ids)},
+        )
+        await conn.execute(
+            text('DELETE FROM "user" WHERE id = ANY(:user_ids)'),
+            {"user_ids": list(user_ids)},
+        )
+    await refresh_maintained_tables()
+
+
+async def seed_notes(user_id: int, count: int, words: int = 50) -> None:
+    """Inserts `count` synthetic notes of user with one statement"""
+    async with db_helper.factory() as session:
+        await session.execute(
+            text(
+                "INSERT INTO note "
+                "(user_id, title, text, summarization, created_at, updated_at) "
+                "SELECT :user_id, 'Seeded note ' || i, "
+                "repeat('lorem ipsum dolor sit amet ', :words / 5), 'Seeded', "
+                "now() - i * interval '1 second', now() - i * interval '1 second' "
+                "FROM generate_series(1, :count) AS i"
+            ),
+            {"user_id": user_id, "count": count, "words": words},
+        )
+        await session.commit()
+        await session.execute(text("ANALYZE note"))
+    await refresh_maintained_tables([user_id])
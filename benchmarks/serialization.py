@@ -0,0 +1,184 @@
+"""CPU time of building note responses: pre-encoded against FastAPI's default path.
+
+The default path is what the views did before: validate ORM objects or rows
+with a `TypeAdapter` built per request, then let FastAPI validate the result
+against `response_model` and render it with `JSONResponse`. The fast path is
+`api.serialization`. No database is needed, objects are built in memory.
+Run from the project root:
+    python -m benchmarks.serialization
+"""
+
+import asyncio
+import time
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import TypeAdapter
+
+from api.serialization import encode_rows, json_response, row_encoder
+from api.v1.analytics.schemas import AnalyticsSchema
+from api.v1.notes.schemas import (
+    NoteHistoryMetadataSchema,
+    NoteSchema,
+    NoteSchemaWithHistoryMetadata,
+    NoteSearchResultSchema,
+    NotesPageSchema,
+    NotesSearchPageSchema,
+)
+from core.database import Note
+
+PAGE = 50
+TEXT_WORDS = 300
+REPEATS = 500
+
+
+def notes() -> list[Note]:
+    now = datetime.now(UTC)
+    return [
+        Note(
+            id=i,
+            title=f"Benchmark note {i}",
+            text="lorem ipsum " * (TEXT_WORDS // 2),
+            summarization="Summary of a benchmark note",
+            summarization_status="done",
+            user_id=1,
+            created_at=now - timedelta(days=i),
+            updated_at=now - timedelta(seconds=i),
+        )
+        for i in range(PAGE)
+    ]
+
+
+def search_rows(items: list[Note]) -> list[SimpleNamespace]:
+    return [
+        SimpleNamespace(
+            id=note.id,
+            title=note.title,
+            updated_at=note.updated_at,
+            rank=0.5 / (note.id + 1),
+            snippet="… <b>lorem</b> ipsum lorem ipsum …",
+        )
+        for note in items
+    ]
+
+
+def history_rows(items: list[Note]) -> list[SimpleNamespace]:
+    return [
+        SimpleNamespace(
+            id=note.id, title=note.title, created_at=note.created_at, note_id=1
+        )
+        for note in items
+    ]
+
+
+def analytics() -> AnalyticsSchema:
+    return AnalyticsSchema(
+        total_notes=100_000,
+        total_words=5_000_000,
+        avg_words=50,
+        common_words={f"word{i}": 1_000 - i for i in range(10)},
+        top_longest_notes={f"Long note {i}": 900 - i for i in range(3)},
+        top_shortest_notes={f"Short note {i}": i for i in range(3)},
+    )
+
+
+async def default_path(response_model, build) -> bytes:
+    field = create_model_field("Response", response_model, mode="serialization")
+    content = await serialize_response(field=field, response_content=build())
+    return JSONResponse(content).body
+
+
+def endpoints(items, searches, history, stats) -> dict:
+    """Returns {endpoint: (default path, fast path)}"""
+    return {
+        "GET /notes/": (
+            lambda: default_path(
+                NotesPageSchema,
+                lambda: NotesPageSchema(
+                    items=TypeAdapter(list[NoteSchema]).validate_python(
+                        items, from_attributes=True
+                    ),
+                    next_cursor="cursor",
+                ),
+            ),
+            lambda: json_response(
+                {"items": encode_rows(NoteSchema, items), "next_cursor": "cursor"}
+            ).body,
+        ),
+        "GET /notes/search": (
+            lambda: default_path(
+                NotesSearchPageSchema,
+                lambda: NotesSearchPageSchema(
+                    items=TypeAdapter(list[NoteSearchResultSchema]).validate_python(
+                        searches, from_attributes=True
+                    ),
+                ),
+            ),
+            lambda: json_response(
+                {
+                    "items": encode_rows(NoteSearchResultSchema, searches),
+                    "next_cursor": None,
+                }
+            ).body,
+        ),
+        "GET /notes/{id}": (
+            lambda: default_path(
+                NoteSchema,
+                lambda: NoteSchema.model_validate(items[0], from_attributes=True),
+            ),
+            lambda: json_response(row_encoder(NoteSchema)(items[0])).body,
+        ),
+        "GET /notes/history/{id}": (
+            lambda: default_path(
+                NoteSchemaWithHistoryMetadata,
+                lambda: NoteSchemaWithHistoryMetadata(
+                    **NoteSchema.model_validate(
+                        items[0], from_attributes=True
+                    ).model_dump(),
+                    note_history=TypeAdapter(
+                        list[NoteHistoryMetadataSchema]
+                    ).validate_python(history, from_attributes=True),
+                ),
+            ),
+            lambda: json_response(
+                {
+                    **row_encoder(NoteSchema)(items[0]),
+                    "note_history": encode_rows(NoteHistoryMetadataSchema, history),
+                    "next_cursor": None,
+                }
+            ).body,
+        ),
+        "GET /analytics/": (
+            lambda: default_path(AnalyticsSchema, lambda: stats),
+            lambda: json_response(stats).body,
+        ),
+    }
+
+
+async def measure(run) -> float:
+    """Returns CPU microseconds per response"""
+    start = time.process_time()
+    for _ in range(REPEATS):
+        body = run()
+        if asyncio.iscoroutine(body):
+            await body
+    return (time.process_time() - start) / REPEATS * 1e6
+
+
+async def main():
+    items = notes()
+    for endpoint, (default, fast) in endpoints(
+        items, search_rows(items), history_rows(items), analytics()
+    ).items():
+        default_us, fast_us = await measure(default), await measure(fast)
+        print(
+            f"{endpoint:<24} default={default_us:8.1f}us fast={fast_us:8.1f}us "
+            f"speedup={default_us / fast_us:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""Bytes and latency of note reads with `?fields=` against full notes.
+
+Notes have `TEXT_KIB` KiB texts of random words, so they are TOASTed
+like large real notes. The app is called in-process through ASGI,
+seeded user and notes are deleted afterwards. Run from the project root
+against a migrated database:
+    python -m benchmarks.sparse_fields
+"""
+
+import asyncio
+import statistics
+import time
+import uuid
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+
+from benchmarks.seed import delete_users, refresh_maintained_tables
+from core.database.db_helper import db_helper
+from main import main_app
+
+NOTES = 1_000
+TEXT_KIB = 16
+PAGE = 100
+REQUESTS = 200
+LIST_FIELDS = "id,title,summarization,updated_at"
+
+
+async def seed(client: AsyncClient) -> tuple[int, dict[str, str], int]:
+    """Returns (user id, auth headers, id of a seeded note)"""
+    username = f"fields_{uuid.uuid4().hex[:8]}"
+    response = await client.post(
+        "/api/v1/auth/sign_up",
+        json={"username": username, "password": "StrongTestPassword123!"},
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    async with db_helper.engine.begin() as conn:
+        user_id = await conn.scalar(
+            text('SELECT id FROM "user" WHERE username = :username'),
+            {"username": username},
+        )
+        # 33 bytes per md5 word, `i * 0` makes every note text different
+        note_id = await conn.scalar(
+            text(
+                "INSERT INTO note "
+                "(user_id, title, text, summarization, created_at, updated_at) "
+                "SELECT :user_id, 'Large note ' || i, array_to_string(ARRAY("
+                "  SELECT md5(random()::text || i * 0)"
+                "  FROM generate_series(1, :words)), ' '), "
+                "'Summary of a large note', now(), now() - i * interval '1 second' "
+                "FROM generate_series(1, :count) AS i RETURNING id"
+            ),
+            {"user_id": user_id, "words": TEXT_KIB * 1024 // 33, "count": NOTES},
+        )
+    return user_id, headers, note_id
+
+
+async def measure(client: AsyncClient, url: str, headers: dict) -> tuple[float, float]:
+    """Returns (KiB per response, p50 latency in ms)"""
+    timings = []
+    received = 0
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+        received += len(response.content)
+    return received / REQUESTS / 2**10, statistics.median(timings)
+
+
+async def main():
+    async with AsyncClient(
+        transport=ASGITransport(app=main_app), base_url="http://bench"
+    ) as client:
+        user_id, headers, note_id = await seed(client)
+        await refresh_maintained_tables([user_id])
+        try:
+            for name, url in (
+                ("list", f"/api/v1/notes/?limit={PAGE}"),
+                ("list fields", f"/api/v1/notes/?limit={PAGE}&fields={LIST_FIELDS}"),
+                ("note", f"/api/v1/notes/{note_id}"),
+                ("note fields", f"/api/v1/notes/{note_id}?fields=title,updated_at"),
+            ):
+                size, latency = await measure(client, url, headers)
+                print(f"{name:<12} body={size:9.2f}KiB p50={latency:7.2f}ms")
+        finally:
+            await delete_users([user_id])
+    await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
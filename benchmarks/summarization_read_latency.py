@@ -0,0 +1,88 @@
+"""Read latency of GET /notes/{id} while a burst of note creates is summarizing.
+
+Gemini is replaced with a fake that takes `LLM_LATENCY` seconds, once as
+a blocking call (old behaviour) and once as an awaitable (current behaviour).
+
+Run from the project root against a migrated database:
+    python -m benchmarks.summarization_read_latency
+"""
+
+import asyncio
+import time
+import uuid
+from unittest import mock
+
+from api.v1.notes import summarization
+from benchmarks.utils import API_V1_PREFIX, api_client, report, sign_up, timed
+
+LLM_LATENCY = 0.5
+BURST_SIZE = 20
+READS = 200
+
+
+class FakeResponse:
+    text = "Fake summary"
+
+
+async def fake_async_generate_content(**kwargs) -> FakeResponse:
+    await asyncio.sleep(LLM_LATENCY)
+    return FakeResponse()
+
+
+async def fake_blocking_generate_content(**kwargs) -> FakeResponse:
+    time.sleep(LLM_LATENCY)
+    return FakeResponse()
+
+
+async def measure_reads(client, headers: dict, note_id: int) -> list[float]:
+    samples = []
+    for _ in range(READS):
+        samples.append(
+            await timed(client.get(f"{API_V1_PREFIX}/notes/{note_id}", headers=headers))
+        )
+    return samples
+
+
+async def run_scenario(client, headers: dict, note_id: int, fake) -> list[float]:
+    with mock.patch.object(
+        summarization.ai_client.aio.models, "generate_content", side_effect=fake
+    ):
+        burst = [
+            client.post(
+                f"{API_V1_PREFIX}/notes/",
+                json={"title": f"Burst note {i}", "text": "Some burst text"},
+                headers=headers,
+            )
+            for i in range(BURST_SIZE)
+        ]
+        results = await asyncio.gather(measure_reads(client, headers, note_id), *burst)
+    return results[0]
+
+
+async def main():
+    async with api_client() as client:
+        token = await sign_up(client, f"bench_{uuid.uuid4().hex[:8]}")
+        headers = {"Authorization": f"Bearer {token}"}
+        with mock.patch.object(
+            summarization.ai_client.aio.models,
+            "generate_content",
+            side_effect=fake_async_generate_content,
+        ):
+            response = await client.post(
+                f"{API_V1_PREFIX}/notes/",
+                json={"title": "Read target", "text": "Read me"},
+                headers=headers,
+            )
+        note_id = response.json()["id"]
+
+        report("idle reads", await measure_reads(client, headers, note_id))
+        for name, fake in (
+            ("blocking LLM call", fake_blocking_generate_content),
+            ("async LLM call", fake_async_generate_content),
+        ):
+            samples = await run_scenario(client, headers, note_id, fake)
+            report(f"reads during burst ({name})", samples)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+import statistics
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+
+from httpx import ASGITransport, AsyncClient
+
+from main import main_app
+
+API_V1_PREFIX = "/api/v1"
+PASSWORD = "StrongBenchPassword123!"
+
+
+@asynccontextmanager
+async def api_client() -> AsyncGenerator[AsyncClient, None]:
+    async with AsyncClient(
+        transport=ASGITransport(app=main_app), base_url="http://bench"
+    ) as client:
+        yield client
+
+
+async def sign_up(client: AsyncClient, username: str) -> str:
+    """Signs up (or logs in, if user exists) and returns an access token"""
+    user = {"username": username, "password": PASSWORD}
+    response = await client.post(f"{API_V1_PREFIX}/auth/sign_up", json=user)
+    if response.status_code != 201:
+        response = await client.post(f"{API_V1_PREFIX}/auth/login", json=user)
+    return response.json()["access_token"]
+
+
+async def timed(coro) -> float:
+    """Awaits coroutine and returns elapsed time in milliseconds"""
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name: str, samples: list[float], unit: str = "ms") -> None:
+    print(
+        f"{name:<45} n={len(samples):<6} "
+        f"mean={statistics.mean(samples):9.2f}{unit} "
+        f"p50={percentile(samples, 50):9.2f}{unit} "
+        f"p99={percentile(samples, 99):9.2f}{unit}"
+    )
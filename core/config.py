@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 
 from pydantic import BaseModel, PostgresDsn
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -21,11 +22,63 @@ class JWT(BaseModel):
     algorithm: str = "RS256"
     access_token_expires_minutes: int = 30
     refresh_token_expires_days: int = 30
+    verified_cache_size: int = 10_000
+    verified_cache_ttl_seconds: int = 300
+    # build principal from access token claims instead of selecting user row
+    trust_access_token_claims: bool = False
+    # cache user rows in process, invalidated on commit of user writes of this
+    # process only, other workers see changes after user_cache_ttl_seconds
+    cache_users: bool = False
+    user_cache_size: int = 1_000
+    user_cache_ttl_seconds: int = 60
     TOKEN_TYPE_FIELD: str = "type"
     ACCESS_TOKEN_TYPE: str = "access"
     REFRESH_TOKEN_TYPE: str = "refresh"
 
 
+class AnalyticsConfig(BaseModel):
+    stream_chunk_size: int = 1_000
+    engine: Literal["incremental", "pandas", "sql"] = "incremental"
+    chunk_size: int = 10_000
+    # process pool of pandas engine, one id-range partition per worker
+    workers: int = 4
+    max_queue_depth: int = 16
+    # ?mode=approx, Count-Min Sketch error is e / sketch_width * total_words
+    # with probability 1 - exp(-sketch_depth)
+    sketch_width: int = 8192
+    sketch_depth: int = 5
+    heavy_hitters_capacity: int = 1_000
+    # results are fresh for cache_ttl seconds, then served for cache_stale_ttl more
+    # seconds while recomputed in background; note writes of this process
+    # invalidate them right away
+    cache_ttl: float = 5.0
+    cache_stale_ttl: float = 55.0
+
+
+class PaginationConfig(BaseModel):
+    default_limit: int = 50
+    max_limit: int = 100
+
+
+class BatchConfig(BaseModel):
+    # operations per POST /notes/batch
+    max_size: int = 500
+    # summarizations of one batch in flight, ai.max_concurrent_requests still applies
+    summarization_concurrency: int = 10
+
+
+class HistoryConfig(BaseModel):
+    # every n-th revision is stored in full, so rebuilding any revision applies
+    # at most snapshot_interval - 1 deltas
+    snapshot_interval: int = 10
+
+
+class PasswordHashingConfig(BaseModel):
+    executor: Literal["thread", "process"] = "thread"
+    max_workers: int = 4
+    max_queue_depth: int = 64
+
+
 class DbConfig(BaseModel):
     url: PostgresDsn
     test_url: PostgresDsn
@@ -35,6 +88,17 @@ class DbConfig(BaseModel):
     echo_pool: bool = False
     pool_size: int = 50
     max_overflow: int = 10
+    # read-only endpoints use replicas lagging at most replica_max_lag seconds
+    replica_urls: list[PostgresDsn] = []
+    test_replica_urls: list[PostgresDsn] = []
+    replica_max_lag: float = 1.0
+    # lags are measured in background, a replica isn't used if its last
+    # measurement is older than two intervals
+    replica_lag_check_interval: float = 1.0
+    replica_connect_timeout: float = 1.0
+    # lifetime of the write marker cookie: for this long after a write, reads of
+    # the user skip replicas which haven't replayed its commit
+    read_your_writes_seconds: float = 5.0
 
     naming_convention: dict[str, str] = {
         "ix": "ix_%(column_0_label)s",
@@ -54,6 +118,31 @@ class AIConfig(BaseModel):
         "while preserving the key meaning. Maintain the original language of the note. "
         "Avoid unnecessary details and keep the response as brief as possible."
     )
+    max_concurrent_requests: int = 10
+    request_timeout: float = 30.0
+    cache_size: int = 1024
+    # summarizations in summarization_cache table older than this are deleted
+    # by worker.py
+    db_cache_ttl_days: int = 30
+    # seconds to collect concurrent summarizations of one user into one call,
+    # 0 - disabled, every cache miss waits this long when enabled
+    batch_window: float = 0
+    batch_max_size: int = 10
+    # "deferred" - commit note right away and summarize it in worker.py
+    summarization_mode: Literal["sync", "deferred"] = "sync"
+
+
+class WorkerConfig(BaseModel):
+    processes: int = 1
+    concurrency: int = 5
+    poll_interval: float = 1.0
+    max_attempts: int = 5
+    retry_backoff: float = 5.0
+    lease_seconds: int = 120
+    # longest pause between attempts to claim jobs while the database fails
+    max_error_backoff: float = 30.0
+    # seconds between deletions of expired summarization_cache entries
+    cache_prune_interval: float = 3600.0
 
 
 class Settings(BaseSettings):
@@ -65,7 +154,13 @@ class Settings(BaseSettings):
     db: DbConfig
     ai: AIConfig
     jwt: JWT = JWT()
+    password: PasswordHashingConfig = PasswordHashingConfig()
+    pagination: PaginationConfig = PaginationConfig()
+    batch: BatchConfig = BatchConfig()
+    history: HistoryConfig = HistoryConfig()
+    analytics: AnalyticsConfig = AnalyticsConfig()
     run: RunConfig = RunConfig()
+    worker: WorkerConfig = WorkerConfig()
 
 
 settings = Settings()
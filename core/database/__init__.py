@@ -1,6 +1,23 @@
-__all__ = ["Base", "User", "Note", "NoteHistory"]
+__all__ = [
+    "Base",
+    "User",
+    "Note",
+    "NoteHistory",
+    "NotesPartition",
+    "NotesVersion",
+    "SummarizationCache",
+    "SummarizationJob",
+    "SummarizationStatus",
+    "JobStatus",
+    "WordFrequency",
+]
 
 from .base import Base
 from .note import Note
 from .notes_history import NoteHistory
+from .notes_partition import NotesPartition
+from .notes_version import NotesVersion
+from .summarization_cache import SummarizationCache
+from .summarization_job import JobStatus, SummarizationJob, SummarizationStatus
 from .user import User
+from .word_frequency import WordFrequency
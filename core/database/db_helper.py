@@ -1,5 +1,13 @@
-from typing import AsyncGenerator
+import asyncio
+import itertools
+import math
+import time
+from dataclasses import dataclass
+from typing import AsyncGenerator, Sequence
 
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -8,9 +16,53 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from core.config import settings
+from core.database.pool_metrics import InstrumentedPool, PoolMetrics
+
+# (seconds since the last replayed transaction, replayed WAL position in bytes),
+# lag is 0 if a streaming replica has replayed everything it received, or if it
+# isn't a replica (anymore)
+REPLICA_STATE_SQL = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "AND EXISTS (SELECT FROM pg_stat_wal_receiver WHERE status = 'streaming') "
+    "THEN 0 "
+    "ELSE coalesce("
+    "extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 'Infinity') "
+    "END, "
+    "pg_wal_lsn_diff(CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() "
+    "ELSE pg_current_wal_lsn() END, '0/0')"
+)
+
+# WAL position in bytes, taken after a commit it is past the commit record
+WAL_LSN_SQL = text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')")
+
+
+async def get_wal_lsn(session: AsyncSession) -> int:
+    """Returns WAL position of the primary, replicas which replayed up to it
+    have every transaction committed before the call"""
+    return int(await session.scalar(WAL_LSN_SQL))
+
+
+@dataclass(frozen=True)
+class ReplicaState:
+    lag: float
+    replayed_lsn: int
+    # time.monotonic() when the measurement started
+    measured_at: float
 
 
 class DatabaseHelper:
+    """Engine of the primary and, optionally, of read replicas.
+
+    Replicas are measured in background every `replica_lag_check_interval`
+    seconds. Reads are routed to replicas which lag at most `replica_max_lag`
+    seconds by a measurement at most two intervals old, or to the primary if
+    there are none. Reads of a client whose write committed at WAL position
+    `written_lsn` skip replicas which, by the last measurement, hadn't replayed
+    up to it.
+    """
+
     def __init__(
         self,
         url: str,
@@ -18,6 +70,10 @@ class DatabaseHelper:
         echo_pool: bool,
         pool_size: int = 5,
         max_overflow: int = 10,
+        replica_urls: Sequence[str] = (),
+        replica_max_lag: float = 1.0,
+        replica_lag_check_interval: float = 1.0,
+        replica_connect_timeout: float = 1.0,
     ):
         self.engine: AsyncEngine = create_async_engine(
             url=url,
@@ -25,18 +81,148 @@ class DatabaseHelper:
             echo_pool=echo_pool,
             max_overflow=max_overflow,
             pool_size=pool_size,
+            poolclass=InstrumentedPool,
         )
         self.factory: async_sessionmaker[AsyncSession] = async_sessionmaker(
             bind=self.engine, autoflush=False, autocommit=False, expire_on_commit=False
         )
+        # a replica that doesn't answer fails fast instead of holding
+        # a measurement or a read for asyncpg's default 60 seconds
+        self.replica_engines: list[AsyncEngine] = [
+            create_async_engine(
+                url=replica_url,
+                echo=echo,
+                echo_pool=echo_pool,
+                max_overflow=max_overflow,
+                pool_size=pool_size,
+                poolclass=InstrumentedPool,
+                connect_args={"timeout": replica_connect_timeout},
+            )
+            for replica_url in replica_urls
+        ]
+        self.replica_factories: list[async_sessionmaker[AsyncSession]] = [
+            async_sessionmaker(
+                bind=engine, autoflush=False, autocommit=False, expire_on_commit=False
+            )
+            for engine in self.replica_engines
+        ]
+        self.replica_max_lag = replica_max_lag
+        self.replica_lag_check_interval = replica_lag_check_interval
+        # last measurement of every replica, None until the first one
+        self.replica_states: list[ReplicaState | None] = [None] * len(
+            self.replica_engines
+        )
+        self._replica_monitors: list[asyncio.Task | None] = [None] * len(
+            self.replica_engines
+        )
+        self._next_replica = itertools.count()
+        self.pool_metrics: list[PoolMetrics] = [
+            PoolMetrics(self.engine, "primary"),
+            *(
+                PoolMetrics(engine, f"replica{i}")
+                for i, engine in enumerate(self.replica_engines)
+            ),
+        ]
+
+    async def connect(self) -> None:
+        """Opens the first connection of the primary, so startup fails
+        on a wrong URL or an unreachable database instead of the first request"""
+        async with self.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
 
     async def dispose(self) -> None:
+        await self.stop_replica_monitors()
         await self.engine.dispose()
+        for engine in self.replica_engines:
+            await engine.dispose()
 
     async def session_getter(self) -> AsyncGenerator[AsyncSession, None]:
         async with self.factory() as session:
             yield session
 
+    async def factory_getter(self) -> async_sessionmaker[AsyncSession]:
+        """For responses that outlive request dependencies, e.g. streaming ones"""
+        return self.factory
+
+    async def read_factory_getter(self) -> async_sessionmaker[AsyncSession]:
+        """Same as factory_getter, but for read-only work, so on a replica"""
+        return await self.read_factory()
+
+    async def pool_metrics_getter(self) -> list[PoolMetrics]:
+        return self.pool_metrics
+
+    async def read_factory(
+        self, written_lsn: int | None = None
+    ) -> async_sessionmaker[AsyncSession]:
+        """Returns factory of a replica in sync enough, or of the primary.
+
+        Never waits for a measurement: replicas take turns, the primary is used
+        if all replicas lag too much, are unreachable, haven't been measured
+        recently or hadn't replayed WAL up to `written_lsn` (see get_wal_lsn)
+        when measured. Replay only moves forward, so a replica that had
+        replayed it then has it now.
+        """
+        if not self.replica_factories:
+            return self.factory
+        self.start_replica_monitors()
+        measured_after = time.monotonic() - 2 * self.replica_lag_check_interval
+        in_sync = [
+            factory
+            for factory, state in zip(self.replica_factories, self.replica_states)
+            if state is not None
+            and state.measured_at >= measured_after
+            and state.lag <= self.replica_max_lag
+            and (written_lsn is None or state.replayed_lsn >= written_lsn)
+        ]
+        if not in_sync:
+            return self.factory
+        return in_sync[next(self._next_replica) % len(in_sync)]
+
+    def start_replica_monitors(self) -> None:
+        """Starts (or restarts) background measurement of every replica,
+        one task per replica, so one that doesn't answer delays only itself"""
+        for index, task in enumerate(self._replica_monitors):
+            if task is None or task.done():
+                self._replica_monitors[index] = asyncio.create_task(
+                    self._monitor_replica(index)
+                )
+
+    async def stop_replica_monitors(self) -> None:
+        tasks = [task for task in self._replica_monitors if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._replica_monitors = [None] * len(self.replica_engines)
+
+    async def _monitor_replica(self, index: int) -> None:
+        while True:
+            await self.measure_replica(index)
+            await asyncio.sleep(self.replica_lag_check_interval)
+
+    async def measure_replica(self, index: int) -> ReplicaState:
+        """Measures lag and replayed LSN of a replica and stores them, an
+        unreachable one lags infinitely and has replayed nothing"""
+        measured_at = time.monotonic()
+        try:
+            async with asyncio.timeout(self.replica_max_lag + 1):
+                async with self.replica_engines[index].connect() as conn:
+                    lag, replayed_lsn = (await conn.execute(REPLICA_STATE_SQL)).one()
+                    state = ReplicaState(float(lag), int(replayed_lsn), measured_at)
+        except (OSError, SQLAlchemyError, TimeoutError, asyncpg.PostgresError):
+            # PostgresError of connect is not wrapped, e.g. a database
+            # not replicated yet
+            state = ReplicaState(math.inf, -1, measured_at)
+        self.replica_states[index] = state
+        return state
+
+    async def measure_replicas(self) -> list[ReplicaState]:
+        """Measures every replica right away, see measure_replica"""
+        return list(
+            await asyncio.gather(
+                *map(self.measure_replica, range(len(self.replica_engines)))
+            )
+        )
+
 
 db_helper: DatabaseHelper = DatabaseHelper(
     url=str(settings.db.url),
@@ -44,4 +230,8 @@ db_helper: DatabaseHelper = DatabaseHelper(
     echo_pool=settings.db.echo_pool,
     pool_size=settings.db.pool_size,
     max_overflow=settings.db.max_overflow,
+    replica_urls=[str(url) for url in settings.db.replica_urls],
+    replica_max_lag=settings.db.replica_max_lag,
+    replica_lag_check_interval=settings.db.replica_lag_check_interval,
+    replica_connect_timeout=settings.db.replica_connect_timeout,
 )
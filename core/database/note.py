@@ -1,24 +1,64 @@
 from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import DateTime, ForeignKey, func
+from sqlalchemy import Computed, DateTime, ForeignKey, Index, String, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from core.database import Base
 from core.database.mixins import BaseNotesMixin
+from core.database.summarization_job import SummarizationStatus
 
 if TYPE_CHECKING:
     from .notes_history import NoteHistory
     from .user import User
 
+# no stemming and stop words, notes are written in different languages
+SEARCH_CONFIG = "simple"
+# characters of text and summarization that are searched, a tsvector takes
+# at most ~6 bytes per character of input and can't exceed 1 MB
+SEARCH_TEXT_LENGTH = 100_000
+
 
 class Note(BaseNotesMixin, Base):
+    __table_args__ = (
+        # keyset pagination of user notes by (updated_at desc, id desc)
+        Index("ix_note_user_id_updated_at_id", "user_id", "updated_at", "id"),
+        # top shortest/longest notes for analytics, ties broken by id
+        Index("ix_note_word_count_id", "word_count", "id"),
+        Index("ix_note_search_vector", "search_vector", postgresql_using="gin"),
+    )
+    # generated by Postgres and only used in search queries, so it is not mapped
+    # (mapped server-generated columns are sent back by every INSERT ... RETURNING)
+    __mapper_args__ = {"exclude_properties": ["search_vector"]}
+
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), nullable=False, server_default=func.now()
     )
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
 
-    summarization: Mapped[str] = mapped_column(nullable=False)
+    summarization: Mapped[str | None] = mapped_column(nullable=True)
+    summarization_status: Mapped[str] = mapped_column(
+        String(16),
+        nullable=False,
+        default=SummarizationStatus.DONE,
+        server_default=SummarizationStatus.DONE,
+    )
+    word_count: Mapped[int] = mapped_column(
+        nullable=False, default=0, server_default="0"
+    )
+    # title matches rank higher than text ones, and text higher than summarization
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR,
+        Computed(
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', title), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+            f"left(text, {SEARCH_TEXT_LENGTH})), 'B') || "
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+            f"left(coalesce(summarization, ''), {SEARCH_TEXT_LENGTH})), 'C')",
+            persisted=True,
+        ),
+    )
 
     user: Mapped["User"] = relationship("User", back_populates="notes")
     note_history: Mapped[list["NoteHistory"]] = relationship(
@@ -1,6 +1,6 @@
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from core.database import Base
@@ -11,6 +11,15 @@ if TYPE_CHECKING:
 
 
 class NoteHistory(BaseNotesMixin, Base):
+    __table_args__ = (
+        # history of note newest first, also used by note deletion cascade
+        Index("ix_note_history_note_id_created_at_id", "note_id", "created_at", "id"),
+    )
+
+    # revisions are stored as reverse deltas against the next newer revision
+    # (see api/v1/notes/history.py), text is set only for snapshots
+    text: Mapped[str | None] = mapped_column(nullable=True)
+    text_delta: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
     note_id: Mapped[int] = mapped_column(
         ForeignKey("note.id", ondelete="CASCADE"), nullable=False
     )
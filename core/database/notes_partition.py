@@ -0,0 +1,20 @@
+from sqlalchemy import BigInteger
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.database import Base
+
+
+class NotesPartition(Base):
+    """Version, number of notes and of words in them of one id range, kept up to
+    date by note writes along with word_frequency. Sketches of approximate
+    analytics are rebuilt only for ranges whose version changed, totals are
+    sums over all ranges"""
+
+    partition: Mapped[int] = mapped_column(unique=True, nullable=False)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    notes: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    words: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.database import Base
+
+
+class NotesVersion(Base):
+    """Version of all notes of a user, bumped by every note write and by the
+    worker, so lists of notes are validated without reading the notes"""
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("user.id", ondelete="CASCADE"), unique=True, nullable=False
+    )
+    version: Mapped[int] = mapped_column(nullable=False)
+    changed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
@@ -0,0 +1,144 @@
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# seconds, from an idle connection to a request queued behind a saturated pool
+CHECKOUT_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    """Cumulative histogram in Prometheus terms, values are counted into
+    the first bucket they are less than or equal to"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str) -> list[str]:
+        lines = []
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {total}")
+        return lines
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool timing connect(), which waits for a free connection when
+    the pool is exhausted (and opens a new one when it can)"""
+
+    checkout_wait: Histogram
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_wait = Histogram(CHECKOUT_WAIT_BUCKETS)
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.checkout_wait.observe(time.perf_counter() - start)
+
+    def recreate(self) -> "InstrumentedPool":
+        # engine.dispose() replaces the pool, waits of the old one are kept
+        pool = super().recreate()
+        pool.checkout_wait = self.checkout_wait
+        return pool
+
+
+class PoolMetrics:
+    """Prometheus metrics of an engine pool, fed by SQLAlchemy pool events.
+
+    Engine must be created with `poolclass=InstrumentedPool`.
+    """
+
+    def __init__(self, engine: AsyncEngine, name: str):
+        self.engine = engine
+        self.labels = f'pool="{name}"'
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        # open connections by id of their pool record
+        self.connected_at: dict[int, float] = {}
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "connect", self.on_connect)
+        event.listen(sync_engine, "checkout", self.on_checkout)
+        event.listen(sync_engine, "invalidate", self.on_invalidate)
+        for closed in ("close", "close_detached", "detach"):
+            event.listen(sync_engine, closed, self.on_close)
+
+    def on_connect(self, dbapi_connection, connection_record) -> None:
+        self.connects += 1
+        self.connected_at[id(connection_record)] = time.monotonic()
+
+    def on_checkout(self, dbapi_connection, connection_record, proxy) -> None:
+        self.checkouts += 1
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        self.invalidations += 1
+
+    def on_close(self, dbapi_connection, connection_record=None) -> None:
+        self.connected_at.pop(id(connection_record), None)
+
+    def render(self) -> dict[str, list[str]]:
+        """Returns {metric name: samples}, see METRICS for types of metrics"""
+        pool: InstrumentedPool = self.engine.sync_engine.pool
+        now = time.monotonic()
+        ages = [now - connected_at for connected_at in self.connected_at.values()]
+        values = {
+            "db_pool_size": pool.size(),
+            "db_pool_checked_out": pool.checkedout(),
+            # negative while fewer than pool_size connections are open
+            "db_pool_overflow": pool.overflow(),
+            "db_pool_connections": len(ages),
+            "db_pool_connection_max_age_seconds": max(ages, default=0.0),
+            "db_pool_checkouts_total": self.checkouts,
+            "db_pool_connects_total": self.connects,
+            "db_pool_invalidations_total": self.invalidations,
+        }
+        samples = {
+            name: [f"{name}{{{self.labels}}} {value}"] for name, value in values.items()
+        }
+        samples["db_pool_checkout_wait_seconds"] = pool.checkout_wait.render(
+            "db_pool_checkout_wait_seconds", self.labels
+        )
+        return samples
+
+
+# (type, help) of metrics rendered by PoolMetrics
+METRICS = {
+    "db_pool_size": ("gauge", "Configured number of pooled connections"),
+    "db_pool_checked_out": ("gauge", "Connections in use"),
+    "db_pool_overflow": ("gauge", "Connections open above the pool size"),
+    "db_pool_connections": ("gauge", "Open connections"),
+    "db_pool_connection_max_age_seconds": ("gauge", "Age of the oldest connection"),
+    "db_pool_checkouts_total": ("counter", "Connections taken from the pool"),
+    "db_pool_connects_total": ("counter", "Connections opened"),
+    "db_pool_invalidations_total": ("counter", "Connections invalidated"),
+    "db_pool_checkout_wait_seconds": (
+        "histogram",
+        "Time to get a connection from the pool",
+    ),
+}
+
+
+def render_metrics(pools: list[PoolMetrics]) -> str:
+    """Returns Prometheus text exposition of pools, samples grouped by metric"""
+    samples = [pool.render() for pool in pools]
+    lines = []
+    for name, (metric_type, description) in METRICS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+        for pool_samples in samples:
+            lines += pool_samples[name]
+    return "\n".join(lines) + "\n"
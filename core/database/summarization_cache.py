@@ -0,0 +1,15 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.database import Base
+
+
+class SummarizationCache(Base):
+    # sha256 of model, prompt, title and text
+    key: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    summarization: Mapped[str] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), index=True
+    )
@@ -0,0 +1,55 @@
+from datetime import datetime
+from enum import StrEnum
+from typing import TYPE_CHECKING
+
+from sqlalchemy import DateTime, ForeignKey, Index, String, func, text
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from core.database import Base
+
+if TYPE_CHECKING:
+    from .note import Note
+
+
+class SummarizationStatus(StrEnum):
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class JobStatus(StrEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DEAD = "dead"
+
+
+class SummarizationJob(Base):
+    __table_args__ = (
+        # due jobs for workers, dead ones stay in the table but are never claimed
+        Index(
+            "ix_summarization_job_run_after",
+            "run_after",
+            postgresql_where=text("status <> 'dead'"),
+        ),
+    )
+
+    note_id: Mapped[int] = mapped_column(
+        ForeignKey("note.id", ondelete="CASCADE"), unique=True, nullable=False
+    )
+    status: Mapped[str] = mapped_column(
+        String(16), nullable=False, default=JobStatus.PENDING
+    )
+    attempts: Mapped[int] = mapped_column(nullable=False, default=0)
+    # bumped on every re-enqueue, so a worker never finishes an outdated job
+    revision: Mapped[int] = mapped_column(nullable=False, default=1)
+    # for pending jobs - when to run (retry backoff),
+    # for running jobs - when the lease expires and job can be reclaimed
+    run_after: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    last_error: Mapped[str | None] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    note: Mapped["Note"] = relationship("Note")
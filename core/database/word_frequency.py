@@ -0,0 +1,10 @@
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.database import Base
+
+
+class WordFrequency(Base):
+    """Occurrences of every word across all notes, kept up to date by note writes"""
+
+    word: Mapped[str] = mapped_column(unique=True, nullable=False)
+    count: Mapped[int] = mapped_column(nullable=False, index=True)
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """Bounded in-process LRU cache with optional per-entry expiry and counters"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, tuple[V, float | None]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: K) -> V | None:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, expires_at: float | None = None) -> None:
+        """Stores value, `expires_at` is a unix timestamp after which it's dropped"""
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> V | None:
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class SingleFlightCache(Generic[K, V]):
+    """In-process cache of async computations with single-flight misses.
+
+    Concurrent callers of a missing key wait for one computation. Entry is fresh
+    for `ttl` seconds, then for `stale_ttl` more seconds it is still returned
+    while one background computation refreshes it (stale-while-revalidate).
+    `invalidate` makes current entries and computations unusable, so the next
+    caller waits for a computation started after it.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._version = 0
+        self._data: dict[K, tuple[V, float, int]] = {}
+        self._in_flight: dict[K, tuple[asyncio.Task, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def get(self, key: K, compute: Callable[[], Awaitable[V]]) -> V:
+        entry = self._data.get(key)
+        if entry is not None and entry[2] == self._version:
+            value, computed_at, _ = entry
+            age = time.monotonic() - computed_at
+            if age < self.ttl:
+                self.hits += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._computation(key, compute)
+                return value
+        self.misses += 1
+        # shielded, so a cancelled caller doesn't cancel it for the others
+        return await asyncio.shield(self._computation(key, compute))
+
+    def invalidate(self) -> None:
+        self._version += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.invalidate()
+
+    def _computation(self, key: K, compute: Callable[[], Awaitable[V]]) -> asyncio.Task:
+        """Returns computation of key started after the last invalidation"""
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None and in_flight[1] == self._version:
+            return in_flight[0]
+        task = asyncio.create_task(self._compute(key, compute, self._version))
+        self._in_flight[key] = (task, self._version)
+        task.add_done_callback(lambda task: self._forget(key, task))
+        return task
+
+    async def _compute(
+        self, key: K, compute: Callable[[], Awaitable[V]], version: int
+    ) -> V:
+        # age counts from the start, writes during computation may be missed
+        started_at = time.monotonic()
+        value = await compute()
+        current = self._data.get(key)
+        if current is None or current[2] <= version:
+            self._data[key] = (value, started_at, version)
+        return value
+
+    def _forget(self, key: K, task: asyncio.Task) -> None:
+        if self._in_flight.get(key, (None,))[0] is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # failed background refresh keeps the stale entry, waiters get the error
+            task.exception()
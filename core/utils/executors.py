@@ -0,0 +1,61 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Literal, TypeVar
+
+T = TypeVar("T")
+
+
+class ExecutorSaturatedError(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """Runs blocking calls in a thread or process pool off the event loop.
+
+    When `max_workers + max_queue_depth` calls are already in flight, new calls
+    are rejected with ExecutorSaturatedError instead of queueing forever.
+    """
+
+    def __init__(
+        self,
+        kind: Literal["thread", "process"],
+        max_workers: int,
+        max_queue_depth: int,
+    ):
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # workers are started by a single-threaded server process, forking
+                # the app itself while its other pools run threads may deadlock
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        if self.in_flight >= self.max_workers + self.max_queue_depth:
+            self.rejected += 1
+            raise ExecutorSaturatedError
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
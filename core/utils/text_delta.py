@@ -0,0 +1,100 @@
+import re
+import zlib
+from difflib import SequenceMatcher
+
+import orjson
+
+# words with their trailing whitespace, so texts are compared word by word
+TOKEN_PATTERN = re.compile(r"\s*\S+\s*|\s+")
+# chunks end after tokens with hash divisible by it, about 8 tokens per chunk
+CHUNK_MODULUS = 8
+# changed regions bigger than this many token pairs are stored as is
+MAX_TOKEN_DIFF_CELLS = 40_000
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text)
+
+
+def chunk(tokens: list[str]) -> list[list[str]]:
+    """Splits tokens into content-defined chunks, so an edit changes only
+    chunks around it and the rest of both texts still match"""
+    chunks, current = [], []
+    for token in tokens:
+        current.append(token)
+        if zlib.crc32(token.encode()) % CHUNK_MODULUS == 0:
+            chunks.append(current)
+            current = []
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def diff_tokens(base: list[str], target: list[str], ops: list[int | str]) -> None:
+    """Appends ops turning `base` tokens into `target` ones"""
+    matcher = SequenceMatcher(None, base, target, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append("".join(target[j1:j2]))
+
+
+def make_delta(base: str, target: str) -> bytes:
+    """Returns delta that turns `base` into `target`.
+
+    Delta is a JSON list: positive numbers copy that many tokens of `base`,
+    negative ones skip them and strings are inserted as is. Texts are matched
+    by chunks first and only changed chunks are compared token by token,
+    so rewrites of long texts don't pay for the quadratic matcher.
+    """
+    base_tokens, target_tokens = tokenize(base), tokenize(target)
+    prefix = 0
+    limit = min(len(base_tokens), len(target_tokens))
+    while prefix < limit and base_tokens[prefix] == target_tokens[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < limit - prefix
+        and base_tokens[-suffix - 1] == target_tokens[-suffix - 1]
+    ):
+        suffix += 1
+    base_chunks = chunk(base_tokens[prefix : len(base_tokens) - suffix])
+    target_chunks = chunk(target_tokens[prefix : len(target_tokens) - suffix])
+
+    ops: list[int | str] = [prefix]
+    matcher = SequenceMatcher(
+        None,
+        ["".join(tokens) for tokens in base_chunks],
+        ["".join(tokens) for tokens in target_chunks],
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        base_region = [token for tokens in base_chunks[i1:i2] for token in tokens]
+        target_region = [token for tokens in target_chunks[j1:j2] for token in tokens]
+        if tag == "equal":
+            ops.append(len(base_region))
+        elif len(base_region) * len(target_region) <= MAX_TOKEN_DIFF_CELLS:
+            diff_tokens(base_region, target_region, ops)
+        else:
+            ops += [-len(base_region), "".join(target_region)]
+    ops.append(suffix)
+    return orjson.dumps([op for op in ops if op])
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    """Returns text that `delta` was made for from the same `base`"""
+    tokens = tokenize(base)
+    parts = []
+    position = 0
+    for op in orjson.loads(delta):
+        if isinstance(op, str):
+            parts.append(op)
+        elif op > 0:
+            parts.extend(tokens[position : position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(parts)
@@ -1,13 +1,53 @@
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 
 from api import router as api_router
+from api.metrics import router as metrics_router
+from api.v1.analytics.helpers import analytics_executor
+from api.v1.auth.security_utils import password_executor
+from api.v1.notes.summarization import ai_client
 from core.config import settings
+from core.database.db_helper import db_helper
+
+
+async def close_ai_client() -> None:
+    """Closes HTTP clients of the genai client. Client.close() and
+    AsyncClient.aclose() came in later google-genai releases than the locked
+    1.5.0, whose clients have no such methods"""
+    aclose = getattr(ai_client.aio, "aclose", None)
+    close = getattr(ai_client, "close", None)
+    try:
+        if aclose is not None:
+            await aclose()
+    finally:
+        if close is not None:
+            close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Connects to the database and starts measuring replicas on startup, stops
+    measuring and closes connection pools, the genai client and worker pools
+    on shutdown. Every step of shutdown runs even if an earlier one fails"""
+    await db_helper.connect()
+    db_helper.start_replica_monitors()
+    async with AsyncExitStack() as shutdown:
+        # run in reverse order
+        shutdown.push_async_callback(db_helper.dispose)
+        shutdown.callback(password_executor.shutdown)
+        shutdown.callback(analytics_executor.shutdown)
+        shutdown.push_async_callback(close_ai_client)
+        yield
+
 
-main_app: FastAPI = FastAPI(default_response_class=ORJSONResponse)
+main_app: FastAPI = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 main_app.include_router(api_router)
+main_app.include_router(metrics_router)
 
 if __name__ == "__main__":
     uvicorn.run(
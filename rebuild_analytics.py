@@ -0,0 +1,15 @@
+import asyncio
+
+from api.v1.analytics.controllers import rebuild_word_frequency
+from core.database.db_helper import db_helper
+
+
+async def rebuild_analytics() -> None:
+    async with db_helper.factory() as session:
+        processed = await rebuild_word_frequency(session)
+    await db_helper.dispose()
+    print(f"Word frequency rebuilt from {processed} notes")
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_analytics())
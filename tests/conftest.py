@@ -1,4 +1,4 @@
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Generator
 
 import pytest
 import sqlalchemy
@@ -6,6 +6,7 @@ from httpx import ASGITransport, AsyncClient
 from pytest_asyncio import is_async_test
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
+from api.v1.auth.helpers import get_read_session_with_jwt
 from api.v1.auth.schemas import UserSchema
 from core.config import settings
 from core.database import Base
@@ -90,6 +91,20 @@ async def db_session(
         await session.rollback()
 
 
+@pytest.fixture()
+def query_counter(test_db_helper: DatabaseHelper) -> Generator[list[str], None, None]:
+    """Collects SQL statements executed on the test database."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sync_engine = test_db_helper.engine.sync_engine
+    sqlalchemy.event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    sqlalchemy.event.remove(sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
 @pytest.fixture()
 def user_schema_in() -> UserSchema:
     return UserSchema(username="user123", password="StrongTestPassword123!")
@@ -108,4 +123,16 @@ async def api_client(test_db_helper) -> AsyncClient:
         main_app.dependency_overrides[db_helper.session_getter] = (
             test_db_helper.session_getter
         )
+        main_app.dependency_overrides[db_helper.factory_getter] = (
+            test_db_helper.factory_getter
+        )
+        main_app.dependency_overrides[db_helper.read_factory_getter] = (
+            test_db_helper.read_factory_getter
+        )
+        main_app.dependency_overrides[db_helper.pool_metrics_getter] = (
+            test_db_helper.pool_metrics_getter
+        )
+        main_app.dependency_overrides[get_read_session_with_jwt] = (
+            test_db_helper.session_getter
+        )
         yield api_client
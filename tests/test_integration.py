@@ -1,9 +1,39 @@
+from unittest.mock import ANY
+
 import pytest
 from fastapi import status
 from httpx import AsyncClient
-
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.serialization import fields_encoder
+from api.v1.analytics.controllers import (
+    SKETCH_PARTITION_SIZE,
+    get_notes_totals,
+    get_sketch_partition_ids,
+    rebuild_word_frequency,
+)
+from api.v1.analytics.helpers import (
+    analytics_cache,
+    analytics_executor,
+    partition_sketches,
+)
+from api.v1.analytics.tokenizer import MAX_WORD_LENGTH
+from api.v1.auth import helpers as auth_helpers
+from api.v1.auth.helpers import WRITE_MARKER_COOKIE, user_cache
 from api.v1.auth.schemas import UserSchema
-from api.v1.notes.schemas import CreateNoteSchema, UpdateNoteSchema
+from api.v1.auth.security_utils import password_executor, verify_write_marker
+from api.v1.notes import helpers
+from api.v1.notes.schemas import (
+    CreateNoteSchema,
+    NoteSchemaWithHistory,
+    NoteSchemaWithHistoryMetadata,
+    UpdateNoteSchema,
+)
+from core.config import settings
+from core.database import Note, User, WordFrequency
+from core.database.db_helper import DatabaseHelper, db_helper, get_wal_lsn
+from core.database.note import SEARCH_TEXT_LENGTH
 
 API_V1_PREFIX = "/api/v1"
 AUTH_PREFIX = "/auth"
@@ -122,7 +152,9 @@ async def test_refresh_failed(api_client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_create_note_ok(api_client: AsyncClient, mocker):
+async def test_create_note_ok(
+    api_client: AsyncClient, test_db_helper: DatabaseHelper, mocker
+):
     mocker.patch(
         "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
     )
@@ -150,6 +182,21 @@ async def test_create_note_ok(api_client: AsyncClient, mocker):
     assert data["title"] == note_data.title
     assert data["text"] == note_data.text
     assert data["summarization"] == "Mocked summary"
+    # without replicas nothing reads the write marker
+    assert WRITE_MARKER_COOKIE not in response.cookies
+
+    mocker.patch.object(db_helper, "replica_factories", [test_db_helper.factory])
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=note_data.model_dump(),
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    # reads of the user skip replicas that may not have the note yet
+    written_lsn = verify_write_marker(
+        response.cookies[WRITE_MARKER_COOKIE], data["user_id"]
+    )
+    async with test_db_helper.factory() as session:
+        assert 0 < written_lsn <= await get_wal_lsn(session)
 
 
 @pytest.mark.asyncio
@@ -186,7 +233,7 @@ async def test_get_all_user_notes_ok(api_client: AsyncClient, mocker):
     )
 
     assert response.status_code == status.HTTP_200_OK
-    data = response.json()
+    data = response.json()["items"]
     assert len(data) >= 2
     assert data[0]["summarization"] == "Mocked summary"
     assert data[1]["summarization"] == "Mocked summary"
@@ -275,7 +322,72 @@ async def test_update_note_ok(api_client: AsyncClient, mocker):
 
 
 @pytest.mark.asyncio
-async def test_delete_note_ok(api_client: AsyncClient, mocker):
+async def test_update_note_partial(api_client: AsyncClient, mocker):
+    summarization = mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_upd_note_partial", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(title="Test Note", text="Test content").model_dump(),
+        headers=headers,
+    )
+    note_id = response.json()["id"]
+
+    response = await api_client.patch(
+        f"{API_V1_PREFIX}/notes/{note_id}",
+        json={"text": "Updated content"},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert (response.json()["title"], response.json()["text"]) == (
+        "Test Note",
+        "Updated content",
+    )
+    summarization.assert_called_with("Test Note", "Updated content", ANY, ANY)
+
+    response = await api_client.patch(
+        f"{API_V1_PREFIX}/notes/{note_id}",
+        json={"title": "Updated Note"},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert (response.json()["title"], response.json()["text"]) == (
+        "Updated Note",
+        "Updated content",
+    )
+
+    for body in (
+        {},
+        {"title": "Updated Note"},
+        {"text": ""},
+        {"title": "Other Note", "text": ""},
+    ):
+        response = await api_client.patch(
+            f"{API_V1_PREFIX}/notes/{note_id}", json=body, headers=headers
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/batch",
+        json={"operations": [{"op": "update", "id": note_id, "text": ""}]},
+        headers=headers,
+    )
+    assert response.json()["items"][0]["status"] == status.HTTP_404_NOT_FOUND
+    response = await api_client.get(f"{API_V1_PREFIX}/notes/{note_id}", headers=headers)
+    assert response.json()["text"] == "Updated content"
+
+
+@pytest.mark.asyncio
+async def test_delete_note_ok(
+    api_client: AsyncClient, test_db_helper: DatabaseHelper, mocker
+):
     mocker.patch(
         "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
     )
@@ -314,6 +426,17 @@ async def test_delete_note_ok(api_client: AsyncClient, mocker):
 
     assert response.status_code == status.HTTP_404_NOT_FOUND
 
+    # deleting nothing isn't a write, reads of the user may stay on replicas
+    mocker.patch.object(db_helper, "replica_factories", [test_db_helper.factory])
+    get_written_lsn = mocker.spy(auth_helpers, "get_wal_lsn")
+    response = await api_client.delete(
+        f"{API_V1_PREFIX}/notes/{note_id}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    get_written_lsn.assert_not_called()
+
 
 @pytest.mark.asyncio
 async def test_get_note_history_ok(api_client: AsyncClient, mocker):
@@ -362,6 +485,173 @@ async def test_get_note_history_ok(api_client: AsyncClient, mocker):
     assert data["summarization"] == "Updated mocked summary"
 
 
+@pytest.mark.asyncio
+async def test_get_note_history_pages(api_client: AsyncClient, mocker, monkeypatch):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    # short delta runs, so later pages are rebuilt from a snapshot
+    monkeypatch.setattr(settings.history, "snapshot_interval", 3)
+    user_schema_in = UserSchema(
+        username="user_note_history_pages", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    words = [f"word{i}" for i in range(100)]
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json={"title": "Revision 0", "text": " ".join(words)},
+        headers=headers,
+    )
+    note_id = response.json()["id"]
+    texts = [" ".join(words)]
+    for revision in range(1, 8):
+        words[revision] = f"edit{revision}"
+        texts.append(" ".join(words))
+        await api_client.patch(
+            f"{API_V1_PREFIX}/notes/{note_id}",
+            json={"title": f"Revision {revision}", "text": texts[-1]},
+            headers=headers,
+        )
+
+    history, cursor, etags = [], None, set()
+    while True:
+        params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+        response = await api_client.get(
+            f"{API_V1_PREFIX}/notes/history/{note_id}", params=params, headers=headers
+        )
+        assert response.status_code == status.HTTP_200_OK
+        etags.add(response.headers["ETag"])
+        data = NoteSchemaWithHistory.model_validate(response.json()).model_dump()
+        history += data["note_history"]
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert [revision["text"] for revision in history] == texts[-2::-1]
+    assert len(etags) == 4
+
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/history/{note_id}",
+        params={"metadata_only": True},
+        headers=headers,
+    )
+    NoteSchemaWithHistoryMetadata.model_validate(response.json())
+    metadata = response.json()["note_history"]
+    assert [revision["title"] for revision in metadata] == [
+        f"Revision {revision}" for revision in range(6, -1, -1)
+    ]
+    assert all("text" not in revision for revision in metadata)
+
+
+@pytest.mark.asyncio
+async def test_get_note_history_during_update(api_client: AsyncClient, mocker):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_note_history_during_update", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    texts = [
+        " ".join(f"word{revision}_{i}" for i in range(30)) for revision in range(3)
+    ]
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json={"title": "Raced history", "text": texts[0]},
+        headers=headers,
+    )
+    note_id = response.json()["id"]
+    await api_client.patch(
+        f"{API_V1_PREFIX}/notes/{note_id}",
+        json={"title": "Raced history", "text": texts[1]},
+        headers=headers,
+    )
+    get_note_history_rows = helpers.get_note_history_rows
+
+    async def update_then_get_rows(*args, **kwargs):
+        # a revision is committed after the note is read, before its history
+        await api_client.patch(
+            f"{API_V1_PREFIX}/notes/{note_id}",
+            json={"title": "Raced history", "text": texts[2]},
+            headers=headers,
+        )
+        return await get_note_history_rows(*args, **kwargs)
+
+    mocker.patch(
+        "api.v1.notes.helpers.get_note_history_rows", side_effect=update_then_get_rows
+    )
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/history/{note_id}", headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["text"] == texts[1]
+    assert [revision["text"] for revision in data["note_history"]] == [texts[0]]
+
+
+@pytest.mark.asyncio
+async def test_notes_sparse_fields(api_client: AsyncClient, mocker):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_notes_sparse_fields", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for i in range(3):
+        response = await api_client.post(
+            f"{API_V1_PREFIX}/notes/",
+            json={"title": f"Sparse note {i}", "text": "Long text " * 100},
+            headers=headers,
+        )
+    note_id = response.json()["id"]
+
+    fields = "title, id,summarization"
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/",
+        params={"fields": fields, "limit": 2},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert "ETag" in response.headers
+    data = response.json()
+    assert data["items"][0] == {
+        "id": note_id,
+        "title": "Sparse note 2",
+        "summarization": "Mocked summary",
+    }
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/",
+        params={"fields": fields, "cursor": data["next_cursor"]},
+        headers=headers,
+    )
+    assert [note["title"] for note in response.json()["items"]] == ["Sparse note 0"]
+
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/{note_id}",
+        params={"fields": "updated_at"},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert list(response.json()) == ["updated_at"]
+    assert "Last-Modified" in response.headers
+    assert fields_encoder(("id", "title")) is fields_encoder(("id", "title"))
+
+    for fields in ("password", "", " , "):
+        response = await api_client.get(
+            f"{API_V1_PREFIX}/notes/", params={"fields": fields}, headers=headers
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
 @pytest.mark.asyncio
 async def test_get_analytics_ok(api_client: AsyncClient, mocker):
     mocker.patch(
@@ -437,3 +727,782 @@ async def test_get_all_notes_ok(api_client: AsyncClient, mocker):
     data = response.json()
     assert data
     assert len(data) >= 2
+
+
+@pytest.mark.asyncio
+async def test_create_note_deferred_summarization(api_client: AsyncClient, mocker):
+    mocker.patch.object(settings.ai, "summarization_mode", "deferred")
+    summarize = mocker.patch("api.v1.notes.helpers.summarize_note")
+
+    user_schema_in = UserSchema(
+        username="user_create_note_deferred", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    token = response.json()["access_token"]
+
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(title="Test Note", text="Test content").model_dump(),
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    data = response.json()
+    assert data["summarization"] is None
+    assert data["summarization_status"] == "pending"
+    summarize.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_login_password_executor_busy(api_client: AsyncClient, mocker):
+    user_schema_in = UserSchema(
+        username="user_login_busy", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    mocker.patch.object(
+        password_executor, "max_queue_depth", -password_executor.max_workers
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/login", json=user_schema_in.model_dump()
+    )
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_note_read_queries_per_request(
+    api_client: AsyncClient, query_counter: list[str], mocker
+):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_queries_per_request", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(title="Test Note", text="Test content").model_dump(),
+        headers=headers,
+    )
+    note_url = f"{API_V1_PREFIX}/notes/{response.json()['id']}"
+
+    async def count_queries() -> int:
+        query_counter.clear()
+        response = await api_client.get(note_url, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        return len(query_counter)
+
+    assert await count_queries() == 2
+    assert await count_queries() == 2
+
+    user_cache.clear()
+    mocker.patch.object(settings.jwt, "cache_users", True)
+    assert await count_queries() == 2
+    assert await count_queries() == 1
+
+    user_cache.clear()
+    mocker.patch.object(settings.jwt, "trust_access_token_claims", True)
+    assert await count_queries() == 1
+
+
+@pytest.mark.asyncio
+async def test_trusted_claims_of_deleted_user_write(
+    api_client: AsyncClient, db_session: AsyncSession, mocker
+):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    mocker.patch.object(settings.jwt, "trust_access_token_claims", True)
+    user_schema_in = UserSchema(
+        username="user_deleted_trusted_claims", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    await db_session.execute(
+        delete(User).where(User.username == user_schema_in.username)
+    )
+    await db_session.commit()
+
+    note = CreateNoteSchema(title="Orphan note", text="Never stored").model_dump()
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/", json=note, headers=headers
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"][0]["msg"] == "User not found"
+
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/batch",
+        json={"operations": [{"op": "create", **note}]},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"][0]["msg"] == "User not found"
+
+
+@pytest.mark.asyncio
+async def test_get_user_notes_pagination_ok(api_client: AsyncClient, mocker):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_notes_pagination", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for i in range(3):
+        await api_client.post(
+            f"{API_V1_PREFIX}/notes/",
+            json=CreateNoteSchema(title=f"Paged note {i}", text="Text").model_dump(),
+            headers=headers,
+        )
+
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/", params={"limit": 2}, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    first_page = response.json()
+    assert [note["title"] for note in first_page["items"]] == [
+        "Paged note 2",
+        "Paged note 1",
+    ]
+    assert first_page["next_cursor"]
+
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/",
+        params={"limit": 2, "cursor": first_page["next_cursor"]},
+        headers=headers,
+    )
+    second_page = response.json()
+    assert [note["title"] for note in second_page["items"]] == ["Paged note 0"]
+    assert second_page["next_cursor"] is None
+
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/", params={"cursor": "not-a-cursor"}, headers=headers
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_word_frequency_follows_note_writes(
+    api_client: AsyncClient, test_db_helper: DatabaseHelper, mocker
+):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_word_frequency", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    words = ["zebraword", "quokkaword", "axolotlword"]
+
+    async def word_counts() -> dict[str, int]:
+        async with test_db_helper.factory() as session:
+            result = await session.execute(
+                select(WordFrequency.word, WordFrequency.count).where(
+                    WordFrequency.word.in_(words)
+                )
+            )
+            return dict(result.tuples().all())
+
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(
+            title="Zebraword zebraword", text="quokkaword, QUOKKAWORD!"
+        ).model_dump(),
+        headers=headers,
+    )
+    note_url = f"{API_V1_PREFIX}/notes/{response.json()['id']}"
+    assert await word_counts() == {"zebraword": 2, "quokkaword": 2}
+
+    await api_client.patch(
+        note_url,
+        json=UpdateNoteSchema(
+            title="Zebraword zebraword", text="quokkaword axolotlword"
+        ).model_dump(),
+        headers=headers,
+    )
+    assert await word_counts() == {"zebraword": 2, "quokkaword": 1, "axolotlword": 1}
+
+    async with test_db_helper.factory() as session:
+        before = await session.execute(select(WordFrequency.word, WordFrequency.count))
+        before = set(before.tuples().all())
+        word_count_before = set(
+            (await session.execute(select(Note.id, Note.word_count))).tuples().all()
+        )
+        totals_before = await get_notes_totals(session)
+        assert totals_before == tuple(
+            (
+                await session.execute(
+                    select(func.count(Note.id), func.sum(Note.word_count))
+                )
+            ).one()
+        )
+        await rebuild_word_frequency(session)
+        after = await session.execute(select(WordFrequency.word, WordFrequency.count))
+        assert set(after.tuples().all()) == before
+        word_count_after = await session.execute(select(Note.id, Note.word_count))
+        assert set(word_count_after.tuples().all()) == word_count_before
+        assert await get_notes_totals(session) == totals_before
+
+    await api_client.delete(note_url, headers=headers)
+    assert await word_counts() == {}
+    async with test_db_helper.factory() as session:
+        assert await get_notes_totals(session) == (
+            totals_before[0] - 1,
+            totals_before[1] - 4,
+        )
+
+
+@pytest.mark.asyncio
+async def test_incremental_analytics_matches_pandas(api_client: AsyncClient, mocker):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_analytics_engines", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(
+            title="Engines note", text="one two three four five six seven"
+        ).model_dump(),
+        headers=headers,
+    )
+
+    response = await api_client.get(f"{API_V1_PREFIX}/analytics/")
+    incremental = response.json()
+    mocker.patch.object(settings.analytics, "engine", "pandas")
+    response = await api_client.get(f"{API_V1_PREFIX}/analytics/")
+    pandas = response.json()
+
+    for field in ("total_notes", "total_words", "avg_words", "top_longest_notes"):
+        assert incremental[field] == pandas[field]
+
+
+@pytest.mark.asyncio
+async def test_get_analytics_approx_ok(api_client: AsyncClient):
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/analytics/", params={"mode": "approx"}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["approximate"] is True
+    assert data["common_words"]
+    assert data["common_words_error"].keys() == data["common_words"].keys()
+
+
+@pytest.mark.asyncio
+async def test_approx_analytics_rebuilds_written_partitions(
+    api_client: AsyncClient, test_db_helper: DatabaseHelper, mocker
+):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_analytics_sketches", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    note_ids = []
+    for note_text in ("first sketch note", "sketchword " * 1_000):
+        response = await api_client.post(
+            f"{API_V1_PREFIX}/notes/",
+            json=CreateNoteSchema(title="Sketch note", text=note_text).model_dump(),
+            headers=headers,
+        )
+        note_ids.append(response.json()["id"])
+        # the next note is the first one of the next partition
+        async with test_db_helper.factory() as session:
+            await session.execute(
+                text("SELECT setval('note_id_seq', :last_id)"),
+                {
+                    "last_id": get_sketch_partition_ids(
+                        note_ids[-1] // SKETCH_PARTITION_SIZE
+                    )[1]
+                },
+            )
+            await session.commit()
+    analytics_cache.clear()
+    partition_sketches.clear()
+    run = mocker.spy(analytics_executor, "run")
+
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/analytics/", params={"mode": "approx"}
+    )
+    approx = response.json()
+    response = await api_client.get(f"{API_V1_PREFIX}/analytics/")
+    exact = response.json()
+
+    assert approx["approximate"] is True
+    for field in (
+        "total_notes",
+        "total_words",
+        "avg_words",
+        "top_longest_notes",
+        "top_shortest_notes",
+    ):
+        assert approx[field] == exact[field]
+    assert approx["common_words"]["sketchword"] >= 1_000
+    built = {call.args[3] for call in run.call_args_list}
+    assert {
+        get_sketch_partition_ids(note_id // SKETCH_PARTITION_SIZE)[0]
+        for note_id in note_ids
+    } <= built
+    assert len(built) == run.call_count == len(partition_sketches)
+
+    run.reset_mock()
+    await api_client.patch(
+        f"{API_V1_PREFIX}/notes/{note_ids[1]}",
+        json=UpdateNoteSchema(
+            title="Sketch note", text="patchedword " * 1_000
+        ).model_dump(),
+        headers=headers,
+    )
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/analytics/", params={"mode": "approx"}
+    )
+
+    assert [call.args[3] for call in run.call_args_list] == [
+        get_sketch_partition_ids(note_ids[1] // SKETCH_PARTITION_SIZE)[0]
+    ]
+    assert "sketchword" not in response.json()["common_words"]
+    assert response.json()["common_words"]["patchedword"] >= 1_000
+
+
+@pytest.mark.asyncio
+async def test_sql_analytics_matches_pandas(api_client: AsyncClient, mocker):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_analytics_sql", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    for title, note_text in (
+        ("SQL note", "Alpha, beta; gamma! alpha-beta   ALPHA\ttabs\nnew line"),
+        ("Заметка SQL", "Привет, мир! Ёлка и ЁЛКА, привет-мир 42"),
+        ("Empty-ish", "... !!! ???"),
+    ):
+        await api_client.post(
+            f"{API_V1_PREFIX}/notes/",
+            json=CreateNoteSchema(title=title, text=note_text).model_dump(),
+            headers=headers,
+        )
+
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/analytics/", params={"engine": "sql"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    sql = response.json()
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/analytics/", params={"engine": "pandas"}
+    )
+
+    assert sql == response.json()
+
+
+@pytest.mark.asyncio
+async def test_very_long_word(
+    api_client: AsyncClient, test_db_helper: DatabaseHelper, mocker
+):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_long_word", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    long_word = "q" * 10_000
+
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(title="Long word", text=long_word).model_dump(),
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    response = await api_client.patch(
+        f"{API_V1_PREFIX}/notes/{response.json()['id']}",
+        json=UpdateNoteSchema(
+            title="Long word", text=f"{long_word} {long_word}z"
+        ).model_dump(),
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    truncated = long_word[:MAX_WORD_LENGTH]
+    async with test_db_helper.factory() as session:
+        before = await session.scalar(
+            select(WordFrequency.count).where(WordFrequency.word == truncated)
+        )
+        assert before == 2
+        await rebuild_word_frequency(session)
+        assert before == await session.scalar(
+            select(WordFrequency.count).where(WordFrequency.word == truncated)
+        )
+    responses = [
+        await api_client.get(f"{API_V1_PREFIX}/analytics/", params={"engine": engine})
+        for engine in ("incremental", "pandas", "sql")
+    ]
+    incremental, pandas, sql = (response.json() for response in responses)
+    assert sql == pandas
+    assert incremental["total_words"] == pandas["total_words"]
+
+
+@pytest.mark.asyncio
+async def test_search_notes_ok(api_client: AsyncClient, mocker):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    headers = {}
+    for username in ("user_search_1", "user_search_2"):
+        user_schema_in = UserSchema(
+            username=username, password="StrongTestPassword123!"
+        )
+        response = await api_client.post(
+            f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+        )
+        headers[username] = {
+            "Authorization": f"Bearer {response.json()['access_token']}"
+        }
+    for title, note_text in (
+        ("Kiwi recipes", "How to peel a kiwi"),
+        ("Groceries", "Milk, bread, kiwi and apples"),
+        ("Travel plans", "Visit New Zealand, the land of the kiwi bird"),
+        ("Unrelated", "Nothing to see here"),
+    ):
+        await api_client.post(
+            f"{API_V1_PREFIX}/notes/",
+            json=CreateNoteSchema(title=title, text=note_text).model_dump(),
+            headers=headers["user_search_1"],
+        )
+    await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(title="Kiwi of other user", text="kiwi").model_dump(),
+        headers=headers["user_search_2"],
+    )
+
+    items = []
+    params = {"q": "kiwi", "limit": 2}
+    while True:
+        response = await api_client.get(
+            f"{API_V1_PREFIX}/notes/search",
+            params=params,
+            headers=headers["user_search_1"],
+        )
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        items += page["items"]
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+
+    assert [item["title"] for item in items][0] == "Kiwi recipes"
+    assert {item["title"] for item in items} == {
+        "Kiwi recipes",
+        "Groceries",
+        "Travel plans",
+    }
+    assert all("<b>kiwi</b>" in item["snippet"] for item in items)
+
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/search",
+        params={"q": "kiwi", "cursor": "not a cursor"},
+        headers=headers["user_search_1"],
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_search_long_note(api_client: AsyncClient, mocker):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_search_long", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    # distinct two-letter words of 4-byte letters, the largest tsvector per character
+    letters = [chr(0x20000 + index) for index in range(400)]
+    words = " ".join(first + second for first in letters for second in letters)
+    searched = words[: SEARCH_TEXT_LENGTH - len(" inside")] + " inside"
+    note_text = f"{searched} outside {'filler ' * 300_000}"
+
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(title="Long note", text=note_text).model_dump(),
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(note_text) > 2_000_000
+    note_url = f"{API_V1_PREFIX}/notes/{response.json()['id']}"
+
+    try:
+        for query, found in (("inside", True), ("outside", False)):
+            response = await api_client.get(
+                f"{API_V1_PREFIX}/notes/search", params={"q": query}, headers=headers
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert bool(response.json()["items"]) is found
+    finally:
+        # other tests stream every note
+        await api_client.delete(note_url, headers=headers)
+
+
+@pytest.mark.asyncio
+async def test_conditional_get_notes(
+    api_client: AsyncClient, query_counter: list[str], mocker
+):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_conditional_get", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(title="Polled note", text="Polled text").model_dump(),
+        headers=headers,
+    )
+    note_id = response.json()["id"]
+    urls = [
+        f"{API_V1_PREFIX}/notes/",
+        f"{API_V1_PREFIX}/notes/{note_id}",
+        f"{API_V1_PREFIX}/notes/history/{note_id}",
+    ]
+
+    etags = {}
+    for url in urls:
+        response = await api_client.get(url, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["Last-Modified"]
+        etags[url] = response.headers["ETag"]
+
+        query_counter.clear()
+        response = await api_client.get(
+            url, headers={**headers, "If-None-Match": etags[url]}
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["ETag"] == etags[url]
+        assert not response.content
+        # only the user and version queries, the note itself is not loaded
+        assert len(query_counter) == 2
+
+    await api_client.patch(
+        f"{API_V1_PREFIX}/notes/{note_id}",
+        json=UpdateNoteSchema(title="Polled note", text="Changed text").model_dump(),
+        headers=headers,
+    )
+    for url in urls:
+        response = await api_client.get(
+            url, headers={**headers, "If-None-Match": etags[url]}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["ETag"] != etags[url]
+
+
+@pytest.mark.asyncio
+async def test_analytics_cache_invalidated_by_note_writes(
+    api_client: AsyncClient, query_counter: list[str], mocker
+):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_analytics_cache", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    total_notes = (await api_client.get(f"{API_V1_PREFIX}/analytics/")).json()[
+        "total_notes"
+    ]
+
+    query_counter.clear()
+    response = await api_client.get(f"{API_V1_PREFIX}/analytics/")
+    assert response.json()["total_notes"] == total_notes
+    assert not query_counter
+
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/",
+        json=CreateNoteSchema(title="Cached note", text="Cached text").model_dump(),
+        headers=headers,
+    )
+    response = await api_client.get(f"{API_V1_PREFIX}/analytics/")
+    assert response.json()["total_notes"] == total_notes + 1
+
+
+@pytest.mark.asyncio
+async def test_notes_batch_ok(api_client: AsyncClient, test_db_helper, mocker):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_notes_batch", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}{AUTH_PREFIX}/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    note_ids = []
+    for title in ("Batch note 1", "Batch note 2", "Batch note 3"):
+        response = await api_client.post(
+            f"{API_V1_PREFIX}/notes/",
+            json=CreateNoteSchema(title=title, text="Old text").model_dump(),
+            headers=headers,
+        )
+        note_ids.append(response.json()["id"])
+
+    operations = [
+        {"op": "create", "title": "Batch new 1", "text": "New text one"},
+        {"op": "create", "title": "Batch new 2", "text": "New text two"},
+        {"op": "update", "id": note_ids[0], "title": "Batch note 1", "text": "New"},
+        {
+            "op": "update",
+            "id": note_ids[1],
+            "title": "Batch note 2",
+            "text": "Old text",
+        },
+        {"op": "delete", "id": note_ids[2]},
+        {"op": "delete", "id": 0},
+        {"op": "delete", "id": note_ids[0]},
+    ]
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/batch", json={"operations": operations}, headers=headers
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    items = response.json()["items"]
+    assert [item["index"] for item in items] == list(range(len(operations)))
+    assert [item["status"] for item in items] == [
+        status.HTTP_201_CREATED,
+        status.HTTP_201_CREATED,
+        status.HTTP_422_UNPROCESSABLE_ENTITY,
+        status.HTTP_404_NOT_FOUND,
+        status.HTTP_204_NO_CONTENT,
+        status.HTTP_404_NOT_FOUND,
+        status.HTTP_422_UNPROCESSABLE_ENTITY,
+    ]
+    assert [items[0]["note"]["title"], items[1]["note"]["title"]] == [
+        "Batch new 1",
+        "Batch new 2",
+    ]
+    assert items[0]["note"]["summarization"] == "Mocked summary"
+
+    response = await api_client.get(f"{API_V1_PREFIX}/notes/", headers=headers)
+    assert {note["title"] for note in response.json()["items"]} == {
+        "Batch note 1",
+        "Batch note 2",
+        "Batch new 1",
+        "Batch new 2",
+    }
+
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/batch",
+        json={
+            "operations": [
+                {"op": "update", "id": note_ids[1], "title": "Renamed", "text": "New"}
+            ]
+        },
+        headers=headers,
+    )
+    item = response.json()["items"][0]
+    assert item["status"] == status.HTTP_200_OK
+    assert item["note"]["title"] == "Renamed"
+    response = await api_client.get(
+        f"{API_V1_PREFIX}/notes/history/{note_ids[1]}", headers=headers
+    )
+    assert response.json()["note_history"][0]["title"] == "Batch note 2"
+
+    # fields that aren't given keep their values, like with PATCH
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/batch",
+        json={
+            "operations": [
+                {"op": "update", "id": note_ids[1], "text": "Only text changed"}
+            ]
+        },
+        headers=headers,
+    )
+    item = response.json()["items"][0]
+    assert item["status"] == status.HTTP_200_OK
+    assert (item["note"]["title"], item["note"]["text"]) == (
+        "Renamed",
+        "Only text changed",
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/notes/batch",
+        json={"operations": [{"op": "update", "id": note_ids[1]}]},
+        headers=headers,
+    )
+    # same error as an unchanged update
+    assert response.json()["items"][0]["status"] == status.HTTP_404_NOT_FOUND
+
+    # incremental word counts are kept in sync like by single-note writes
+    async with test_db_helper.factory() as session:
+        before = await session.execute(select(WordFrequency.word, WordFrequency.count))
+        before = set(before.tuples().all())
+        await rebuild_word_frequency(session)
+        after = await session.execute(select(WordFrequency.word, WordFrequency.count))
+        assert set(after.tuples().all()) == before
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics(api_client: AsyncClient, test_db_helper: DatabaseHelper):
+    async with test_db_helper.factory() as session:
+        await session.execute(select(1))
+        response = await api_client.get("/metrics")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        samples = dict(
+            line.rsplit(" ", 1)
+            for line in response.text.splitlines()
+            if not line.startswith("#")
+        )
+        assert float(samples['db_pool_checked_out{pool="primary"}']) >= 1
+
+    assert "# TYPE db_pool_checkout_wait_seconds histogram" in response.text
+    assert float(samples['db_pool_checkout_wait_seconds_count{pool="primary"}']) >= 1
+    assert float(samples['db_pool_connections{pool="primary"}']) >= 1
+    assert float(samples['db_pool_connection_max_age_seconds{pool="primary"}']) > 0
+    assert (
+        samples['db_pool_checkout_wait_seconds_bucket{pool="primary",le="+Inf"}']
+        == (samples['db_pool_checkout_wait_seconds_count{pool="primary"}'])
+    )
@@ -0,0 +1,370 @@
+from collections import Counter
+from datetime import datetime
+from typing import AsyncGenerator, Awaitable, Callable
+
+import pytest
+import sqlalchemy
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from api.v1.analytics.controllers import (
+    apply_word_count_delta,
+    get_most_common_words,
+    get_notes_by_word_count,
+    get_notes_totals,
+    get_sketch_partition_versions,
+)
+from api.v1.auth.controllers import get_user, get_user_by_username
+from api.v1.auth.helpers import user_cache
+from api.v1.auth.schemas import UserSchema
+from api.v1.notes.controllers import (
+    apply_notes_batch,
+    bump_notes_version,
+    create_note,
+    delete_note,
+    enqueue_summarization_job,
+    get_history_delta_runs,
+    get_newer_history_rows,
+    get_note,
+    get_note_history,
+    get_note_history_rows,
+    get_note_version,
+    get_user_notes,
+    get_user_notes_by_ids,
+    get_user_notes_page,
+    get_user_notes_version,
+    search_user_notes,
+    update_note_and_create_history,
+)
+from api.v1.notes.schemas import (
+    BatchUpdateNoteSchema,
+    CreateNoteSchema,
+    NoteSchema,
+    UpdateNoteSchema,
+)
+from api.v1.notes.summarization_queue import claim_summarization_jobs
+from core.database.db_helper import DatabaseHelper
+
+API_V1_PREFIX = "/api/v1"
+
+SEED_USERS = 2_000
+SEED_NOTES = 100_000
+SEED_HISTORY = 100_000
+SEED_WORDS = 20_000
+
+
+@pytest.fixture(scope="module")
+async def seeded_connection(
+    test_db_helper: DatabaseHelper,
+) -> AsyncGenerator[AsyncConnection, None]:
+    """Connection with a large synthetic dataset, rolled back after the module."""
+    async with test_db_helper.engine.connect() as conn:
+        transaction = await conn.begin()
+        await conn.execute(
+            sqlalchemy.text(
+                'INSERT INTO "user" (username, password) '
+                "SELECT 'plan_user_' || i, 'password' "
+                "FROM generate_series(1, :count) AS i"
+            ),
+            {"count": SEED_USERS},
+        )
+        await conn.execute(
+            sqlalchemy.text(
+                "INSERT INTO note (user_id, title, text, summarization, word_count, "
+                "created_at, updated_at) "
+                "SELECT u.id, 'Plan note ' || i, 'lorem ipsum ' || i, 'Summary', "
+                "i % 500, "
+                "now() - i * interval '1 second', now() - i * interval '1 second' "
+                "FROM generate_series(1, :count) AS i "
+                "JOIN \"user\" AS u ON u.username = 'plan_user_' || (i % :users + 1)"
+            ),
+            {"count": SEED_NOTES, "users": SEED_USERS},
+        )
+        await conn.execute(
+            sqlalchemy.text(
+                "INSERT INTO note_history (note_id, title, text, created_at) "
+                "SELECT id, title, text, created_at FROM note "
+                "ORDER BY id DESC LIMIT :count"
+            ),
+            {"count": SEED_HISTORY},
+        )
+        await conn.execute(
+            sqlalchemy.text(
+                "INSERT INTO notes_version (user_id, version, changed_at) "
+                "SELECT user_id, 1, max(updated_at) FROM note "
+                "WHERE title LIKE 'Plan note %' GROUP BY user_id"
+            )
+        )
+        # most jobs of an old queue are dead, the rest is pending
+        await conn.execute(
+            sqlalchemy.text(
+                "INSERT INTO summarization_job "
+                "(note_id, status, attempts, revision, run_after) "
+                "SELECT id, CASE WHEN id % 10 = 0 THEN 'pending' ELSE 'dead' END, "
+                "0, 1, updated_at FROM note WHERE title LIKE 'Plan note %'"
+            )
+        )
+        await conn.execute(
+            sqlalchemy.text(
+                "INSERT INTO word_frequency (word, count) "
+                "SELECT 'planword' || i, i FROM generate_series(1, :count) AS i"
+            ),
+            {"count": SEED_WORDS},
+        )
+        for table in (
+            "user",
+            "note",
+            "note_history",
+            "notes_version",
+            "summarization_job",
+            "word_frequency",
+        ):
+            await conn.execute(sqlalchemy.text(f'ANALYZE "{table}"'))
+        yield conn
+        await transaction.rollback()
+
+
+async def explain_queries(
+    conn: AsyncConnection, run: Callable[[AsyncSession], Awaitable]
+) -> list[str]:
+    """Runs controller on seeded data and returns EXPLAIN of every its query"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if not many and statement.lstrip().upper().startswith(
+            ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+        ):
+            statements.append((statement, parameters))
+
+    # controller writes (and their row locks) are undone before the next test
+    savepoint = await conn.begin_nested()
+    sync_conn = conn.sync_connection
+    sqlalchemy.event.listen(sync_conn, "before_cursor_execute", before_cursor_execute)
+    try:
+        async with AsyncSession(
+            bind=conn, join_transaction_mode="create_savepoint"
+        ) as session:
+            await run(session)
+    finally:
+        sqlalchemy.event.remove(
+            sync_conn, "before_cursor_execute", before_cursor_execute
+        )
+
+    plans = []
+    for statement, parameters in statements:
+        result = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        plans.append("\n".join(row[0] for row in result))
+    await savepoint.rollback()
+    assert plans
+    return plans
+
+
+async def seeded_ids(conn: AsyncConnection) -> tuple[int, int, datetime]:
+    """Returns (user_id, note_id, updated_at) of a seeded note with history"""
+    row = (
+        await conn.execute(
+            sqlalchemy.text(
+                "SELECT n.user_id, n.id, n.updated_at FROM note AS n "
+                "JOIN note_history AS h ON h.note_id = n.id "
+                "WHERE n.title LIKE 'Plan note %' ORDER BY n.id DESC LIMIT 1"
+            )
+        )
+    ).one()
+    return row.user_id, row.id, row.updated_at
+
+
+async def update_note(session: AsyncSession, user_id: int, note_id: int) -> None:
+    note = await get_note(session, note_id, user_id)
+    old_note = NoteSchema.model_validate(note, from_attributes=True)
+    note_in = UpdateNoteSchema(title="Plan update", text="lorem dolor")
+    await update_note_and_create_history(session, note, note_in, old_note, None)
+
+
+async def apply_batch(session: AsyncSession, user_id: int, note_id: int) -> None:
+    note_in = CreateNoteSchema(title="Plan batch", text="lorem sit")
+    update_in = BatchUpdateNoteSchema(op="update", id=note_id, text="lorem amet")
+    await apply_notes_batch(
+        session, user_id, [(note_in, None)], [(update_in, None)], []
+    )
+    await apply_notes_batch(session, user_id, [], [], [note_id])
+
+
+CONTROLLER_QUERIES = {
+    "get_user": lambda s, user_id, note_id, after: get_user(s, user_id),
+    "get_user_by_username": lambda s, *_: get_user_by_username(s, "plan_user_7"),
+    "get_note": lambda s, user_id, note_id, after: get_note(s, note_id, user_id),
+    "get_user_notes": lambda s, user_id, note_id, after: get_user_notes(
+        s, user_id, limit=50
+    ),
+    "get_user_notes_after": lambda s, user_id, note_id, after: get_user_notes(
+        s, user_id, limit=50, after=(after, note_id)
+    ),
+    "get_user_notes_fields": lambda s, user_id, note_id, after: get_user_notes(
+        s, user_id, limit=50, columns=("id", "title", "updated_at")
+    ),
+    "get_user_notes_page": lambda s, user_id, note_id, after: get_user_notes_page(
+        s, user_id, limit=50, after=(after, note_id)
+    ),
+    "get_user_notes_page_fields": lambda s, user_id, note_id, after: (
+        get_user_notes_page(s, user_id, limit=50, columns=("id", "updated_at"))
+    ),
+    "get_note_version": lambda s, user_id, note_id, after: get_note_version(
+        s, note_id, user_id
+    ),
+    "get_user_notes_version": lambda s, user_id, note_id, after: (
+        get_user_notes_version(s, user_id)
+    ),
+    "bump_notes_version": lambda s, user_id, note_id, after: (
+        bump_notes_version(s, [user_id])
+    ),
+    "search_user_notes": lambda s, user_id, note_id, after: search_user_notes(
+        s, user_id, "lorem", limit=50
+    ),
+    "search_user_notes_after": lambda s, user_id, note_id, after: search_user_notes(
+        s, user_id, "lorem", limit=50, after=(0.1, note_id)
+    ),
+    "get_note_history": lambda s, user_id, note_id, after: get_note_history(s, note_id),
+    "get_history_delta_runs": lambda s, user_id, note_id, after: (
+        get_history_delta_runs(s, [note_id])
+    ),
+    "get_note_history_rows_after": lambda s, user_id, note_id, after: (
+        get_note_history_rows(s, note_id, limit=50, after=(after, 1))
+    ),
+    "get_newer_history_rows": lambda s, user_id, note_id, after: (
+        get_newer_history_rows(s, note_id, before=(after, 1))
+    ),
+    "enqueue_summarization_job": lambda s, user_id, note_id, after: (
+        enqueue_summarization_job(s, note_id)
+    ),
+    "delete_note": lambda s, user_id, note_id, after: delete_note(s, note_id, user_id),
+    "create_note": lambda s, user_id, *_: create_note(
+        s, CreateNoteSchema(title="Plan create", text="lorem ipsum"), user_id, None
+    ),
+    "update_note_and_create_history": lambda s, user_id, note_id, after: (
+        update_note(s, user_id, note_id)
+    ),
+    "apply_notes_batch": lambda s, user_id, note_id, after: (
+        apply_batch(s, user_id, note_id)
+    ),
+    "get_user_notes_by_ids": lambda s, user_id, note_id, after: (
+        get_user_notes_by_ids(s, user_id, [note_id, note_id - 1])
+    ),
+    "claim_summarization_jobs": lambda s, *_: claim_summarization_jobs(s, 10),
+    "apply_word_count_delta": lambda s, user_id, note_id, after: (
+        apply_word_count_delta(
+            s,
+            Counter({"planword1": 2, "planword2": -1, "newplanword": 1}),
+            {note_id: (1, 2)},
+        )
+    ),
+    "get_sketch_partition_versions": lambda s, user_id, note_id, after: (
+        get_sketch_partition_versions(s, 1, note_id)
+    ),
+    "get_most_common_words": lambda s, *_: get_most_common_words(s, 10),
+    "get_longest_notes": lambda s, *_: get_notes_by_word_count(s, 3, longest=True),
+    "get_shortest_notes": lambda s, *_: get_notes_by_word_count(s, 3, longest=False),
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("controller", CONTROLLER_QUERIES)
+async def test_controller_queries_use_indexes(
+    seeded_connection: AsyncConnection, controller: str
+):
+    user_id, note_id, updated_at = await seeded_ids(seeded_connection)
+    query = CONTROLLER_QUERIES[controller]
+
+    plans = await explain_queries(
+        seeded_connection, lambda session: query(session, user_id, note_id, updated_at)
+    )
+
+    for plan in plans:
+        assert "Seq Scan" not in plan, plan
+
+
+@pytest.mark.asyncio
+async def test_claim_skips_dead_jobs_by_index(seeded_connection: AsyncConnection):
+    plans = await explain_queries(
+        seeded_connection, lambda session: claim_summarization_jobs(session, 10)
+    )
+
+    # the partial index has no dead jobs, so they aren't walked past
+    assert "ix_summarization_job_run_after" in plans[0], plans[0]
+    index = await seeded_connection.scalar(
+        sqlalchemy.text(
+            "SELECT indexdef FROM pg_indexes "
+            "WHERE indexname = 'ix_summarization_job_run_after'"
+        )
+    )
+    assert "WHERE ((status)::text <> 'dead'::text)" in index
+
+
+@pytest.mark.asyncio
+async def test_notes_totals_read_only_partition_counters(
+    seeded_connection: AsyncConnection,
+):
+    plans = await explain_queries(seeded_connection, get_notes_totals)
+
+    # one row per SKETCH_PARTITION_SIZE notes is summed, notes aren't read
+    assert "on notes_partition" in plans[0], plans[0]
+    assert "on note " not in plans[0], plans[0]
+
+
+# maximum number of SQL statements per request, with empty user cache and
+# without replicas; every note write also updates counters and the version of
+# its partition and bumps the notes version of its user. With replicas it also
+# reads the WAL position of its commit for the write marker
+ENDPOINT_QUERY_BUDGETS = {
+    ("GET", "/auth/me"): 1,
+    ("POST", "/notes/"): 5,
+    ("GET", "/notes/"): 2,
+    ("GET", "/notes/{note_id}"): 2,
+    ("GET", "/notes/search?q=budget"): 2,
+    ("PATCH", "/notes/{note_id}"): 10,
+    ("GET", "/notes/history/{note_id}"): 3,
+    ("GET", "/analytics/"): 4,
+    ("DELETE", "/notes/{note_id}"): 9,
+}
+
+
+@pytest.mark.asyncio
+async def test_endpoint_query_budgets(
+    api_client: AsyncClient, query_counter: list[str], mocker
+):
+    mocker.patch(
+        "api.v1.notes.helpers.create_note_summarization", return_value="Mocked summary"
+    )
+    user_schema_in = UserSchema(
+        username="user_query_budgets", password="StrongTestPassword123!"
+    )
+    response = await api_client.post(
+        f"{API_V1_PREFIX}/auth/sign_up", json=user_schema_in.model_dump()
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    note_in = CreateNoteSchema(title="Budget note", text="Budget text")
+    update_in = UpdateNoteSchema(title="Budget note", text="Updated budget text")
+    note_id = None
+    counts = {}
+
+    for method, path in ENDPOINT_QUERY_BUDGETS:
+        user_cache.clear()
+        query_counter.clear()
+        body = {"POST": note_in, "PATCH": update_in}.get(method)
+        response = await api_client.request(
+            method,
+            API_V1_PREFIX + path.format(note_id=note_id),
+            json=body.model_dump() if body else None,
+            headers=headers,
+        )
+        assert response.status_code < status.HTTP_400_BAD_REQUEST, response.text
+        if method == "POST":
+            note_id = response.json()["id"]
+        counts[method, path] = len(query_counter)
+
+    over_budget = {
+        endpoint: count
+        for endpoint, count in counts.items()
+        if count > ENDPOINT_QUERY_BUDGETS[endpoint]
+    }
+    assert not over_budget
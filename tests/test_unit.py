@@ -1,19 +1,47 @@
+import asyncio
+import os
+import threading
 import time
-from datetime import timedelta
+import tracemalloc
+from collections import Counter
+from datetime import UTC, datetime, timedelta
 
 import jwt
+import numpy as np
+import orjson
 import pytest
+from sqlalchemy import delete, select, text, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.utils import validation_error
+from api.serialization import json_response, row_encoder
+from api.utils import (
+    decode_cursor,
+    encode_cursor,
+    etag_matches,
+    validation_error,
+    weak_etag,
+)
 from api.v1.analytics.controllers import get_all_notes
+from api.v1.analytics.helpers import (
+    AnalyticsAccumulator,
+    encode_all_notes_json,
+    split_id_range,
+)
+from api.v1.analytics.sketches import CountMinSketch, SpaceSaving
+from api.v1.analytics.tokenizer import MAX_WORD_LENGTH, clean_text, tokenize_note
 from api.v1.auth.controllers import create_user, get_user, get_user_by_username
+from api.v1.auth.helpers import get_principal_by_jwt_sub, user_cache
 from api.v1.auth.schemas import UserSchema
 from api.v1.auth.security_utils import (
     decode_jwt,
+    decode_jwt_cached,
     encode_jwt,
     hash_password,
+    hash_password_async,
+    sign_write_marker,
     validate_password,
+    validate_password_async,
+    verify_write_marker,
 )
 from api.v1.notes.controllers import (
     create_note,
@@ -21,10 +49,41 @@ from api.v1.notes.controllers import (
     get_note,
     get_note_history,
     get_user_notes,
+    get_user_notes_page,
+    get_user_notes_version,
     update_note_and_create_history,
 )
 from api.v1.notes.schemas import CreateNoteSchema, NoteSchema, UpdateNoteSchema
+from api.v1.notes.summarization import (
+    SummarizationBatcher,
+    ai_client,
+    generate_summarization,
+    prune_summarization_cache,
+    summarization_cache,
+    summarize_note,
+)
+from api.v1.notes.summarization_queue import (
+    claim_summarization_jobs,
+    complete_summarization_job,
+    fail_summarization_job,
+    process_summarization_job,
+    run_summarization_worker,
+)
+from core.config import settings
+from core.database import (
+    JobStatus,
+    Note,
+    NoteHistory,
+    SummarizationCache,
+    SummarizationJob,
+    SummarizationStatus,
+    User,
+)
+from core.utils.cache import LRUCache, SingleFlightCache
 from core.utils.case_convertor import camel_case_to_snake_case
+from core.utils.executors import BoundedExecutor, ExecutorSaturatedError
+from core.utils.text_delta import apply_delta, make_delta
+from main import lifespan, main_app
 
 
 @pytest.mark.parametrize(
@@ -81,6 +140,15 @@ def test_validate_password(password: str):
     assert not validate_password(wrong_password, hashed)
 
 
+def test_write_marker():
+    marker = sign_write_marker(1, 23456)
+
+    assert verify_write_marker(marker, 1) == 23456
+    assert verify_write_marker(marker, 2) is None
+    assert verify_write_marker(marker.replace("23456", "23457"), 1) is None
+    assert verify_write_marker("1:23456", 1) is None
+
+
 @pytest.mark.asyncio
 async def test_create_and_get_user(
     db_session: AsyncSession, user_schema_in: UserSchema
@@ -101,6 +169,27 @@ async def test_create_and_get_user(
     assert user_get_by_username.id == user_created.id
 
 
+def test_encode_decode_cursor():
+    cursor = encode_cursor("2025-03-13T15:12:18.213215+00:00", 42)
+
+    assert decode_cursor(cursor) == ["2025-03-13T15:12:18.213215+00:00", 42]
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_weak_etag_matches():
+    etag = weak_etag("2025-03-13T15:12:18.213215+00:00", 42)
+
+    assert etag.startswith('W/"')
+    assert etag != weak_etag("2025-03-13T15:12:18.213215+00:00", 43)
+    assert etag_matches(etag, etag)
+    assert etag_matches(etag.removeprefix("W/"), etag)
+    assert etag_matches(f'W/"other", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('W/"other"', etag)
+    assert not etag_matches(None, etag)
+
+
 def test_validation_error():
     loc = ["field"]
     msg = "Invalid value"
@@ -120,6 +209,35 @@ def test_validation_error():
     assert validation_error(loc, msg, input_value, reason) == expected
 
 
+@pytest.mark.asyncio
+async def test_user_cache_invalidated_on_update(db_session: AsyncSession):
+    user_schema_in = UserSchema(
+        username="user_cache_invalidation", password="StrongTestPassword123!"
+    )
+    user = await create_user(db_session, user_schema_in)
+    payload = {"sub": str(user.id)}
+
+    principal = await get_principal_by_jwt_sub(payload, db_session)
+    assert user_cache.get(user.id) == principal
+
+    user.username = "user_cache_invalidation_new"
+    await db_session.flush()
+    # flushed changes may still be rolled back
+    assert user_cache.get(user.id) == principal
+    await db_session.commit()
+
+    assert user_cache.get(user.id) is None
+    principal = await get_principal_by_jwt_sub(payload, db_session)
+    assert principal.username == "user_cache_invalidation_new"
+
+    await db_session.execute(
+        update(User).where(User.id == user.id).values(username="user_cache_bulk")
+    )
+    assert user_cache.get(user.id) == principal
+    await db_session.commit()
+    assert user_cache.get(user.id) is None
+
+
 @pytest.mark.asyncio
 async def test_create_and_get_note(db_session: AsyncSession):
     user_schema_in = UserSchema(username="user_note", password="StrongTestPassword123!")
@@ -157,6 +275,25 @@ async def test_get_user_notes(db_session: AsyncSession):
     assert len(notes) == 2
     assert notes[0].title == "Note 2"
 
+    notes = await get_user_notes(
+        db_session, user.id, limit=1, after=(notes[0].updated_at, notes[0].id)
+    )
+    assert [note.title for note in notes] == ["Note 1"]
+
+    version = await get_user_notes_version(db_session, user.id)
+    assert version[1:] == (2,)
+    page_version, page = await get_user_notes_page(db_session, user.id, limit=1)
+    assert page_version == version
+    assert [note.title for note in page] == ["Note 2"]
+    page_version, page = await get_user_notes_page(
+        db_session, user.id, limit=1, after=(notes[0].updated_at, notes[0].id)
+    )
+    assert (page_version, page) == (version, [])
+    page_version, page = await get_user_notes_page(
+        db_session, user.id, limit=5, columns=("id", "title", "updated_at")
+    )
+    assert [row.title for row in page] == ["Note 2", "Note 1"]
+
 
 @pytest.mark.asyncio
 async def test_create_and_get_note_history(db_session: AsyncSession):
@@ -189,6 +326,123 @@ async def test_create_and_get_note_history(db_session: AsyncSession):
     assert history_entry.created_at is not None
 
 
+def test_json_response_matches_pydantic():
+    note = Note(
+        id=1,
+        title="Ünicode title",
+        text='Text\nwith "quotes"',
+        summarization=None,
+        summarization_status=SummarizationStatus.PENDING,
+        user_id=2,
+        created_at=datetime(2026, 1, 2, 3, 4, 5, tzinfo=UTC),
+        updated_at=datetime(2026, 1, 2, 3, 4, 5, 678, tzinfo=UTC),
+    )
+    expected = NoteSchema.model_validate(note, from_attributes=True)
+
+    response = json_response(row_encoder(NoteSchema)(note))
+
+    assert response.body == expected.model_dump_json().encode()
+    assert json_response(expected).body == response.body
+    assert row_encoder(NoteSchema) is row_encoder(NoteSchema)
+
+
+def test_text_delta_round_trip():
+    base = "First line of a note.\nSecond  line with   extra spaces\n\nЁлки и палки"
+    targets = [
+        base,
+        "",
+        base.replace("Second", "2nd"),
+        "Prefix " + base + " suffix",
+        base[: len(base) // 2],
+        " ".join(reversed(base.split())),
+    ]
+    for target in targets:
+        assert apply_delta(base, make_delta(base, target)) == target
+        assert apply_delta(target, make_delta(target, base)) == base
+    long_text = " ".join(f"word{i}" for i in range(20_000))
+    edited = long_text.replace("word10000 ", "edited ")
+    assert len(make_delta(long_text, edited)) < 100
+
+
+@pytest.mark.asyncio
+async def test_note_history_snapshots(db_session: AsyncSession, monkeypatch):
+    monkeypatch.setattr(settings.history, "snapshot_interval", 3)
+    user = await create_user(
+        db_session,
+        UserSchema(username="user_note_deltas", password="StrongTestPassword123!"),
+    )
+    base_text = " ".join(f"word{i}" for i in range(200))
+    note = await create_note(
+        db_session, CreateNoteSchema(title="Revision 0", text=base_text), user.id, "s"
+    )
+    texts = [base_text]
+    for revision in range(1, 8):
+        texts.append(base_text.replace(f"word{revision} ", f"edit{revision} "))
+        old_note = NoteSchema.model_validate(note, from_attributes=True)
+        note_in = UpdateNoteSchema(title=f"Revision {revision}", text=texts[-1])
+        note = await update_note_and_create_history(
+            db_session, note, note_in, old_note, "s"
+        )
+
+    history = await get_note_history(db_session, note.id)
+    assert [entry.text for entry in history] == texts[-2::-1]
+    assert [entry.title for entry in history][-1] == "Revision 0"
+    stored = (
+        await db_session.execute(
+            select(NoteHistory.text.is_(None))
+            .where(NoteHistory.note_id == note.id)
+            .order_by(NoteHistory.created_at.desc(), NoteHistory.id.desc())
+        )
+    ).scalars()
+    # oldest first: a delta run is never longer than snapshot_interval - 1
+    assert list(stored)[::-1] == [True, True, False, True, True, False, True]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_note_updates_keep_history(
+    db_session: AsyncSession, test_db_helper, mocker
+):
+    texts = [" ".join(f"word{i}_{j}" for j in range(20 + i)) for i in range(5)]
+    user = await create_user(
+        db_session,
+        UserSchema(username="user_note_races", password="StrongTestPassword123!"),
+    )
+    note = await create_note(
+        db_session, CreateNoteSchema(title="Raced note", text=texts[0]), user.id, "s"
+    )
+    # clocks of writers disagree with the order they get the row lock in
+    # (skewed hosts, or a timestamp read before waiting for the lock)
+    clock = iter(datetime.now(UTC) - timedelta(minutes=i) for i in range(100))
+    mocker.patch("api.v1.notes.controllers.datetime", wraps=datetime).now = (
+        lambda tz=None: next(clock)
+    )
+
+    async def update(revision: int) -> None:
+        async with test_db_helper.factory() as session:
+            current = await get_note(session, note.id, user.id)
+            old_note = NoteSchema.model_validate(current, from_attributes=True)
+            note_in = UpdateNoteSchema(title="Raced note", text=texts[revision])
+            await update_note_and_create_history(
+                session, current, note_in, old_note, "s"
+            )
+
+    async with test_db_helper.factory() as lock_session:
+        await lock_session.execute(
+            select(Note.id).where(Note.id == note.id).with_for_update()
+        )
+        updates = [asyncio.create_task(update(revision)) for revision in range(1, 5)]
+        await asyncio.sleep(0.2)
+        # waiters get the lock in no particular order
+        await lock_session.rollback()
+    await asyncio.gather(*updates)
+
+    async with test_db_helper.factory() as session:
+        current = await get_note(session, note.id, user.id)
+        history = [entry.text for entry in await get_note_history(session, note.id)]
+    assert history[-1] == texts[0]
+    assert sorted([current.text, *history]) == sorted(texts)
+
+
 @pytest.mark.asyncio
 async def test_update_note(db_session: AsyncSession):
     user_schema_in = UserSchema(
@@ -208,6 +462,7 @@ async def test_update_note(db_session: AsyncSession):
     assert updated_note is not None
     assert updated_note.title == update_data.title
     assert updated_note.text == update_data.text
+    assert (await get_user_notes_version(db_session, user.id))[1] == 2
 
 
 @pytest.mark.asyncio
@@ -225,6 +480,7 @@ async def test_delete_note(db_session: AsyncSession):
 
     deleted_note = await get_note(db_session, note.id, user.id)
     assert deleted_note is None
+    assert (await get_user_notes_version(db_session, user.id))[1] == 2
 
 
 @pytest.mark.asyncio
@@ -262,3 +518,629 @@ async def test_get_analytics_notes(db_session: AsyncSession):
     notes = await get_all_notes(db_session)
     assert length < len(notes)
     assert notes[-1].title == "Note 24"
+
+
+@pytest.mark.asyncio
+async def test_generate_summarization_concurrency_cap(mocker):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_generate_content(**kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return mocker.Mock(text=" Summary ")
+
+    mocker.patch(
+        "api.v1.notes.summarization.summarization_semaphore", asyncio.Semaphore(2)
+    )
+    mocker.patch.object(
+        ai_client.aio.models, "generate_content", side_effect=fake_generate_content
+    )
+    results = await asyncio.gather(
+        *(generate_summarization("Title", "Text") for _ in range(6))
+    )
+
+    assert results == ["Summary"] * 6
+    assert max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_summarization_timeout(mocker):
+    async def slow_generate_content(**kwargs):
+        await asyncio.sleep(1)
+
+    mocker.patch.object(settings.ai, "request_timeout", 0.01)
+    mocker.patch.object(
+        ai_client.aio.models, "generate_content", side_effect=slow_generate_content
+    )
+    with pytest.raises(TimeoutError):
+        await generate_summarization("Title", "Text")
+
+
+@pytest.mark.asyncio
+async def test_deferred_summarization_job_lifecycle(db_session: AsyncSession):
+    user_schema_in = UserSchema(
+        username="user_note_deferred", password="StrongTestPassword123!"
+    )
+    user = await create_user(db_session, user_schema_in)
+    note_data = CreateNoteSchema(title="Deferred note", text="Summarize me later")
+    note = await create_note(db_session, note_data, user.id, None)
+
+    assert note.summarization is None
+    assert note.summarization_status == SummarizationStatus.PENDING
+
+    jobs = await claim_summarization_jobs(db_session, 100)
+    job = next(job for job in jobs if job.note_id == note.id)
+    assert job.attempts == 1
+    assert job.text == "Summarize me later"
+
+    version = await get_user_notes_version(db_session, user.id)
+    assert await complete_summarization_job(db_session, job, "Deferred summary")
+    await db_session.refresh(note)
+    assert note.summarization == "Deferred summary"
+    assert note.summarization_status == SummarizationStatus.DONE
+    new_version = await get_user_notes_version(db_session, user.id)
+    assert new_version[0] > version[0]
+    assert new_version[1] == version[1] + 1
+
+
+@pytest.mark.asyncio
+async def test_deferred_summarization_retry_and_dead_letter(
+    db_session: AsyncSession, mocker
+):
+    mocker.patch.object(settings.worker, "max_attempts", 2)
+    mocker.patch.object(settings.worker, "retry_backoff", 0)
+    user_schema_in = UserSchema(
+        username="user_note_dead_letter", password="StrongTestPassword123!"
+    )
+    user = await create_user(db_session, user_schema_in)
+    note_data = CreateNoteSchema(title="Failing note", text="AI is down")
+    note = await create_note(db_session, note_data, user.id, None)
+
+    for attempt in (1, 2):
+        jobs = await claim_summarization_jobs(db_session, 100)
+        job = next(job for job in jobs if job.note_id == note.id)
+        assert job.attempts == attempt
+        await fail_summarization_job(db_session, job, "AI is down")
+
+    job_row = await db_session.get(SummarizationJob, job.id, populate_existing=True)
+    assert job_row.status == JobStatus.DEAD
+    assert job_row.last_error == "AI is down"
+    await db_session.refresh(note)
+    assert note.summarization_status == SummarizationStatus.FAILED
+    assert (await get_user_notes_version(db_session, user.id))[1] == 2
+
+
+@pytest.mark.asyncio
+async def test_summarization_worker(db_session: AsyncSession, test_db_helper, mocker):
+    mocker.patch.object(settings.worker, "poll_interval", 0.01)
+    mocker.patch(
+        "api.v1.notes.summarization_queue.summarize_note",
+        return_value="Worker summary",
+    )
+    user_schema_in = UserSchema(
+        username="user_note_worker", password="StrongTestPassword123!"
+    )
+    user = await create_user(db_session, user_schema_in)
+    note_data = CreateNoteSchema(title="Worker note", text="Summarized by worker")
+    note = await create_note(db_session, note_data, user.id, None)
+
+    worker = asyncio.create_task(run_summarization_worker(test_db_helper.factory))
+    try:
+        for _ in range(100):
+            await db_session.refresh(note)
+            if note.summarization_status == SummarizationStatus.DONE:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        worker.cancel()
+
+    assert note.summarization == "Worker summary"
+
+
+@pytest.mark.asyncio
+async def test_summarization_worker_survives_claim_error(
+    db_session: AsyncSession, test_db_helper, mocker
+):
+    mocker.patch.object(settings.worker, "poll_interval", 0.01)
+    mocker.patch(
+        "api.v1.notes.summarization_queue.summarize_note",
+        return_value="Worker summary",
+    )
+    errors = [ConnectionRefusedError()]
+
+    async def claim_jobs(session: AsyncSession, limit: int):
+        if errors:
+            raise errors.pop()
+        return await claim_summarization_jobs(session, limit)
+
+    claim = mocker.patch(
+        "api.v1.notes.summarization_queue.claim_summarization_jobs",
+        side_effect=claim_jobs,
+    )
+    user_schema_in = UserSchema(
+        username="user_note_worker_claim_error", password="StrongTestPassword123!"
+    )
+    user = await create_user(db_session, user_schema_in)
+    note_data = CreateNoteSchema(title="Worker note", text="Summarized after error")
+    note = await create_note(db_session, note_data, user.id, None)
+
+    worker = asyncio.create_task(run_summarization_worker(test_db_helper.factory))
+    try:
+        for _ in range(100):
+            await db_session.refresh(note)
+            if note.summarization_status == SummarizationStatus.DONE:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        worker.cancel()
+
+    assert claim.call_count > 1
+    assert note.summarization == "Worker summary"
+
+
+@pytest.mark.asyncio
+async def test_summarization_job_store_error(
+    db_session: AsyncSession, test_db_helper, mocker
+):
+    mocker.patch(
+        "api.v1.notes.summarization_queue.summarize_note",
+        return_value="Worker summary",
+    )
+    mocker.patch(
+        "api.v1.notes.summarization_queue.complete_summarization_job",
+        side_effect=ConnectionRefusedError(),
+    )
+    user_schema_in = UserSchema(
+        username="user_note_worker_store_error", password="StrongTestPassword123!"
+    )
+    user = await create_user(db_session, user_schema_in)
+    note_data = CreateNoteSchema(title="Worker note", text="Stored later")
+    note = await create_note(db_session, note_data, user.id, None)
+    jobs = await claim_summarization_jobs(db_session, 100)
+    job = next(job for job in jobs if job.note_id == note.id)
+
+    await process_summarization_job(test_db_helper.factory, job)
+
+    job_row = await db_session.get(SummarizationJob, job.id, populate_existing=True)
+    assert job_row.status == JobStatus.RUNNING
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_lru_cache_expiry():
+    cache = LRUCache(maxsize=2)
+    cache.set("fresh", 1, expires_at=time.time() + 60)
+    cache.set("expired", 2, expires_at=time.time() - 1)
+
+    assert cache.get("fresh") == 1
+    assert cache.get("expired") is None
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_lifespan_closes_clients(mocker):
+    db_helper = mocker.patch("main.db_helper", connect=mocker.AsyncMock())
+    db_helper.dispose = mocker.AsyncMock()
+    ai_client = mocker.patch("main.ai_client")
+    ai_client.aio.aclose = mocker.AsyncMock()
+
+    async with lifespan(main_app):
+        db_helper.connect.assert_awaited_once()
+        db_helper.dispose.assert_not_awaited()
+
+    db_helper.dispose.assert_awaited_once()
+    ai_client.aio.aclose.assert_awaited_once()
+    ai_client.close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_lifespan_shutdown_survives_client_close(mocker):
+    db_helper = mocker.patch("main.db_helper", connect=mocker.AsyncMock())
+    db_helper.dispose = mocker.AsyncMock()
+    analytics_executor = mocker.patch("main.analytics_executor")
+    mocker.patch("main.password_executor")
+    # clients of the locked google-genai have no close methods
+    mocker.patch("main.ai_client", mocker.Mock(spec=[], aio=mocker.Mock(spec=[])))
+
+    async with lifespan(main_app):
+        pass
+
+    db_helper.dispose.assert_awaited_once()
+
+    ai_client = mocker.patch("main.ai_client")
+    ai_client.aio.aclose = mocker.AsyncMock(side_effect=RuntimeError("closed"))
+    with pytest.raises(RuntimeError):
+        async with lifespan(main_app):
+            pass
+
+    ai_client.close.assert_called_once()
+    assert analytics_executor.shutdown.call_count == 2
+    assert db_helper.dispose.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cache_coalesces_and_invalidates():
+    cache = SingleFlightCache(ttl=60, stale_ttl=0)
+    calls = 0
+    release = asyncio.Event()
+
+    async def compute() -> int:
+        nonlocal calls
+        calls += 1
+        result = calls
+        await release.wait()
+        return result
+
+    waiters = [asyncio.create_task(cache.get("key", compute)) for _ in range(10)]
+    await asyncio.sleep(0)
+    # a write during computation must not be hidden by its result
+    cache.invalidate()
+    late_waiter = asyncio.create_task(cache.get("key", compute))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == [1] * 10
+    assert await late_waiter == 2
+    assert await cache.get("key", compute) == 2
+    assert (calls, cache.hits, cache.misses) == (2, 1, 11)
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cache_stale_while_revalidate():
+    cache = SingleFlightCache(ttl=0, stale_ttl=60)
+    values = iter([1, 2])
+
+    async def compute() -> int:
+        return next(values)
+
+    assert await cache.get("key", compute) == 1
+    # stale value is returned right away and refreshed in background
+    assert await cache.get("key", compute) == 1
+    await asyncio.sleep(0)
+    assert await cache.get("key", compute) == 2
+    assert cache.stale_hits == 2
+
+
+def test_decode_jwt_cached(payload: dict[str, str], mocker):
+    token = encode_jwt(payload)
+    decode = mocker.patch(
+        "api.v1.auth.security_utils.decode_jwt", side_effect=decode_jwt
+    )
+
+    assert decode_jwt_cached(token)["sub"] == "user123"
+    assert decode_jwt_cached(token)["sub"] == "user123"
+    assert decode.call_count == 1
+
+
+def test_decode_jwt_cached_expires_with_token(payload: dict[str, str], mocker):
+    token = encode_jwt(payload, expire_timedelta=timedelta(seconds=10))
+    assert decode_jwt_cached(token)["sub"] == "user123"
+
+    # entry expires with the token, not after verified_cache_ttl_seconds
+    mocker.patch("core.utils.cache.time.time", return_value=time.time() + 11)
+    decode = mocker.patch(
+        "api.v1.auth.security_utils.decode_jwt",
+        side_effect=jwt.ExpiredSignatureError,
+    )
+    with pytest.raises(jwt.ExpiredSignatureError):
+        decode_jwt_cached(token)
+    decode.assert_called_once_with(token)
+
+
+@pytest.mark.asyncio
+async def test_summarize_note_cache(test_db_helper, mocker):
+    generate = mocker.patch(
+        "api.v1.notes.summarization.generate_summarization",
+        side_effect=["First summary", "Second summary"],
+    )
+
+    async def summarize():
+        return await summarize_note("Cached note", "Same text", test_db_helper.factory)
+
+    assert await summarize() == "First summary"
+    assert await summarize() == "First summary"
+    summarization_cache.clear()
+    assert await summarize() == "First summary"
+    assert generate.call_count == 1
+
+    mocker.patch.object(settings.ai, "summarization_prompt", "Another prompt")
+    assert await summarize() == "Second summary"
+    assert generate.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_prune_summarization_cache(db_session: AsyncSession, mocker):
+    await db_session.execute(delete(SummarizationCache))
+    expired_at = datetime.now(UTC) - timedelta(days=settings.ai.db_cache_ttl_days + 1)
+    db_session.add_all(
+        [
+            SummarizationCache(
+                key="expired 1", summarization="Old", created_at=expired_at
+            ),
+            SummarizationCache(
+                key="expired 2", summarization="Old", created_at=expired_at
+            ),
+            SummarizationCache(key="fresh", summarization="New"),
+        ]
+    )
+    await db_session.commit()
+
+    assert await prune_summarization_cache(db_session, batch_size=1) == 2
+    keys = await db_session.scalars(select(SummarizationCache.key))
+    assert keys.all() == ["fresh"]
+
+    prune = mocker.patch(
+        "api.v1.notes.summarization_queue.prune_summarization_cache", return_value=0
+    )
+    mocker.patch(
+        "api.v1.notes.summarization_queue.claim_summarization_jobs", return_value=[]
+    )
+    mocker.patch.object(settings.worker, "poll_interval", 0.01)
+    worker = asyncio.create_task(run_summarization_worker(mocker.MagicMock()))
+    await asyncio.sleep(0.05)
+    worker.cancel()
+    assert prune.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_summarization_batcher(mocker):
+    async def fake_generate_content(model, contents, config=None):
+        if config is None:
+            return mocker.Mock(text="Single summary")
+        return mocker.Mock(
+            text='[{"index": 1, "summary": "Second"}, {"index": 0, "summary": "First"}]'
+        )
+
+    generate = mocker.patch.object(
+        ai_client.aio.models, "generate_content", side_effect=fake_generate_content
+    )
+    batcher = SummarizationBatcher(window=0.01, max_size=10)
+
+    results = await asyncio.gather(
+        batcher.summarize(1, "Title 1", "Text 1"),
+        batcher.summarize(1, "Title 2", "Text 2"),
+        batcher.summarize(2, "Title 3", "Text 3"),
+    )
+
+    assert results == ["First", "Second", "Single summary"]
+    # notes of another user are summarized by a call of their own
+    assert generate.call_count == 2
+    assert "Title 3" not in generate.call_args_list[0].kwargs["contents"]
+
+
+@pytest.mark.asyncio
+async def test_summarization_batcher_fallback(mocker):
+    async def fake_generate_content(model, contents, config=None):
+        if config is None:
+            return mocker.Mock(text="Single summary")
+        return mocker.Mock(text="Not a JSON at all")
+
+    generate = mocker.patch.object(
+        ai_client.aio.models, "generate_content", side_effect=fake_generate_content
+    )
+    batcher = SummarizationBatcher(window=10, max_size=3)
+
+    results = await asyncio.gather(
+        *(batcher.summarize(1, f"Title {i}", "Text") for i in range(3))
+    )
+
+    assert results == ["Single summary"] * 3
+    assert generate.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_hash_and_validate_password_async(password: str):
+    hashed = await hash_password_async(password)
+
+    assert await validate_password_async(password, hashed)
+    assert not await validate_password_async("WrongPassword123!", hashed)
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_rejects_when_saturated():
+    executor = BoundedExecutor(kind="thread", max_workers=1, max_queue_depth=1)
+    release = threading.Event()
+    try:
+        running = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run(release.wait)
+        assert executor.rejected == 1
+
+        release.set()
+        assert await asyncio.gather(*running) == [True, True]
+        assert executor.in_flight == 0
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_process_pool_doesnt_fork_app():
+    executor = BoundedExecutor(kind="process", max_workers=1, max_queue_depth=1)
+    try:
+        # started by the fork server, not forked from this process
+        assert await executor.run(os.getppid) != os.getpid()
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_encode_all_notes_json_constant_memory(test_db_helper):
+    async with test_db_helper.factory() as session:
+        user_schema_in = UserSchema(
+            username="user_notes_stream", password="StrongTestPassword123!"
+        )
+        user = await create_user(session, user_schema_in)
+
+    async def seed_notes(count: int):
+        async with test_db_helper.factory() as session:
+            await session.execute(
+                text(
+                    "INSERT INTO note (user_id, title, text, summarization) "
+                    "SELECT :user_id, 'Streamed ' || i, repeat('word ', 200), 'sum' "
+                    "FROM generate_series(1, :count) AS i"
+                ),
+                {"user_id": user.id, "count": count},
+            )
+            await session.commit()
+
+    async def stream_peak_memory() -> tuple[int, int]:
+        size = 0
+        tracemalloc.start()
+        async for chunk in encode_all_notes_json(test_db_helper.factory, 100):
+            size += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return size, peak
+
+    try:
+        await seed_notes(1_000)
+        small_size, small_peak = await stream_peak_memory()
+        await seed_notes(4_000)
+        large_size, large_peak = await stream_peak_memory()
+    finally:
+        async with test_db_helper.factory() as session:
+            await session.execute(delete(Note).where(Note.user_id == user.id))
+            await session.commit()
+
+    assert large_size > small_size * 4
+    assert large_peak < small_peak * 1.5
+
+
+@pytest.mark.asyncio
+async def test_encode_all_notes_json_valid(db_session: AsyncSession, test_db_helper):
+    user_schema_in = UserSchema(
+        username="user_notes_stream_json", password="StrongTestPassword123!"
+    )
+    user = await create_user(db_session, user_schema_in)
+    note_data = CreateNoteSchema(title="Streamed note", text="Streamed text")
+    note = await create_note(db_session, note_data, user.id, "some summarization")
+
+    chunks = [chunk async for chunk in encode_all_notes_json(test_db_helper.factory, 2)]
+    notes = orjson.loads(b"".join(chunks))
+
+    streamed = next(item for item in notes if item["id"] == note.id)
+    assert NoteSchema.model_validate(streamed) == NoteSchema.model_validate(
+        note, from_attributes=True
+    )
+
+
+def test_tokenizer_covers_all_scripts():
+    assert clean_text("Hello, мир! Ёж_ёж") == "hello мир ёжёж"
+    assert tokenize_note("Café", "naïve 東京; हिन्दी!") == [
+        "café",
+        "naïve",
+        "東京",
+        "हिन्दी",
+    ]
+
+
+def test_long_words_are_truncated():
+    long_word = "ж" * (MAX_WORD_LENGTH * 40)
+    assert tokenize_note("Long", f"{long_word} {long_word}x") == [
+        "long",
+        long_word[:MAX_WORD_LENGTH],
+        long_word[:MAX_WORD_LENGTH],
+    ]
+
+    accumulator = AnalyticsAccumulator()
+    accumulator.update(["Long"], [f"{long_word} {long_word}x"])
+    result = accumulator.result()
+    assert result.total_words == 3
+    assert result.common_words == {long_word[:MAX_WORD_LENGTH]: 2, "long": 1}
+
+
+def test_analytics_accumulator_is_chunk_independent():
+    titles = [f"Note {index}!" for index in range(10)]
+    texts = [" ".join(["alpha", "beta", "gamma"][: index % 4]) for index in range(10)]
+
+    whole = AnalyticsAccumulator()
+    whole.update(titles, texts)
+    chunked = AnalyticsAccumulator()
+    for start in range(0, 10, 3):
+        chunked.update(titles[start : start + 3], texts[start : start + 3])
+
+    assert chunked.result() == whole.result()
+    result = whole.result()
+    assert result.total_words == 33
+    assert list(result.common_words.items()) == [
+        ("note", 10),
+        ("alpha", 7),
+        ("beta", 4),
+        ("gamma", 2),
+    ] + [(str(index), 1) for index in range(6)]
+    assert result.top_longest_notes == {"note 3": 5, "note 7": 5, "note 2": 4}
+    assert result.top_shortest_notes == {"note 0": 2, "note 4": 2, "note 8": 2}
+
+
+def test_analytics_accumulator_merge_partitions():
+    titles = [f"Note {index}" for index in range(9)]
+    texts = [" ".join(["alpha", "beta"] * (index % 3)) for index in range(9)]
+    whole = AnalyticsAccumulator()
+    whole.update(titles, texts)
+
+    merged = AnalyticsAccumulator()
+    for first_id, last_id in split_id_range(0, 8, 4):
+        partition = AnalyticsAccumulator()
+        partition.update(titles[first_id : last_id + 1], texts[first_id : last_id + 1])
+        merged.merge(partition)
+    merged.merge(AnalyticsAccumulator())
+
+    assert split_id_range(0, 8, 4) == [(0, 2), (3, 5), (6, 8)]
+    assert merged.result() == whole.result()
+
+
+def test_count_min_sketch_merge_and_serialization():
+    words = [f"word{index}" for index in range(500)]
+    counts = np.arange(500, 0, -1)
+    whole = CountMinSketch(width=256, depth=4)
+    whole.update(words, counts)
+    merged = CountMinSketch(width=256, depth=4)
+    for start in (0, 250):
+        partition = CountMinSketch(width=256, depth=4)
+        partition.update(words[start : start + 250], counts[start : start + 250])
+        merged.merge(CountMinSketch.from_bytes(partition.to_bytes()))
+
+    assert np.array_equal(merged.table, whole.table)
+    estimates = merged.estimate(words)
+    assert (estimates >= counts).all()
+    assert (estimates - counts <= merged.error_bound).mean() >= merged.confidence
+    with pytest.raises(ValueError):
+        merged.merge(CountMinSketch(width=128, depth=4))
+
+
+def test_space_saving_merge_bounds():
+    exact = Counter()
+    summary = SpaceSaving(capacity=20)
+    for partition in range(5):
+        counts = Counter(
+            {f"word{index}": (index * 7 + partition) % 50 + 1 for index in range(60)}
+        )
+        counts["common"] = 500
+        exact.update(counts)
+        words, values = zip(*counts.most_common())
+        part = SpaceSaving(capacity=20)
+        part.update(list(words), np.array(values))
+        summary.merge(SpaceSaving.from_bytes(part.to_bytes()))
+
+    top = summary.top(5)
+    assert top[0][0] == "common"
+    for word, count, error in top:
+        assert count - error <= exact[word] <= count
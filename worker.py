@@ -0,0 +1,21 @@
+import asyncio
+import logging
+from multiprocessing import Process
+
+from api.v1.notes.summarization_queue import run_summarization_worker
+from core.config import settings
+
+
+def run_worker_process() -> None:
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_summarization_worker())
+
+
+if __name__ == "__main__":
+    processes = [
+        Process(target=run_worker_process) for _ in range(settings.worker.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()